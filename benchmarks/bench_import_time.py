@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark for the submit and status entry points.
+
+Snakemake starts `uge_submit.py` once per job and `uge_status.py` once per
+job per poll, so interpreter start-up and module imports are paid on every
+call. This runs `python -X importtime` on each entry point and reports the
+wall time of the whole process, the cumulative import time of the script
+and the slowest imports it pulls in.
+
+    python benchmarks/bench_import_time.py --repeat 10
+    python benchmarks/bench_import_time.py --max-ms 60 --forbid snakemake
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+
+PROFILE_DIR = Path(__file__).parent.parent.absolute() / "snakemake_gridengine"
+ENTRY_POINTS = ["uge_status", "uge_submit"]
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    Map module name to cumulative import time in microseconds.
+
+    Only the imports done after interpreter start-up (`site`) are kept.
+    """
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative_us, name = line.split("|")
+        name = name.strip()
+        if name == "site":
+            imports = {}
+            continue
+        try:
+            imports[name] = int(cumulative_us)
+        except ValueError:
+            continue
+    return imports
+
+
+def measure(module: str) -> tuple:
+    # importing the script runs everything except its __main__ block
+    cmd = [sys.executable, "-X", "importtime", "-c", f"import {module}"]
+    start = time.perf_counter()
+    completed_process = subprocess.run(
+        cmd, cwd=PROFILE_DIR, check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"),
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    return wall_ms, parse_importtime(completed_process.stderr.decode())
+
+
+def main(argv=sys.argv[1:]):
+    p = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--top", type=int, default=5)
+    p.add_argument(
+        "--max-ms", type=float, default=None,
+        help="fail when the median import time of an entry point exceeds this")
+    p.add_argument(
+        "--forbid", action="append", default=[],
+        help="fail when the status entry point imports this module")
+    args = p.parse_args(argv)
+
+    failures = []
+    for module in ENTRY_POINTS:
+        walls, totals, imports = [], [], {}
+        for _ in range(args.repeat):
+            wall_ms, imports = measure(module)
+            walls.append(wall_ms)
+            totals.append(imports.get(module, 0) / 1000)
+
+        median_import_ms = statistics.median(totals)
+        print(
+            f"{module}: process {statistics.median(walls):.1f} ms, "
+            f"imports {median_import_ms:.1f} ms (median of {args.repeat})")
+        slowest = sorted(
+            ((name, us) for name, us in imports.items() if name != module),
+            key=lambda x: -x[1])
+        for name, us in slowest[:args.top]:
+            print(f"    {us / 1000:8.1f} ms  {name}")
+
+        if args.max_ms is not None and median_import_ms > args.max_ms:
+            failures.append(f"{module} imports take {median_import_ms:.1f} ms")
+        if module == "uge_status":
+            for forbidden in args.forbid:
+                if forbidden in imports:
+                    failures.append(f"{module} imports {forbidden}")
+
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
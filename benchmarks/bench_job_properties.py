@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Compare reading the job properties of large jobscripts.
+
+Writes synthetic jobscripts whose `input` lists hold the given numbers of
+files and times `snakemake.utils.read_job_properties` against the lean
+reader of `uge_job_properties` that only decodes the keys the submit script
+uses.
+
+    python benchmarks/bench_job_properties.py --inputs 100 10000 100000
+"""
+
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.append(
+    str(Path(__file__).parent.parent.absolute() / "snakemake_gridengine"))
+from uge_job_properties import SUBMITTER_KEYS, \
+    read_job_properties  # noqa: E402
+
+
+def job_properties(inputs: int) -> dict:
+    return {
+        "type": "single", "rule": "aggregate", "local": False,
+        "input": [
+            "results/sample_{:06d}/reads.filtered.bam".format(i)
+            for i in range(inputs)
+        ],
+        "output": ["results/aggregate/summary.tsv"],
+        "wildcards": {"cohort": "all"},
+        "params": {"threshold": 1.0, "names": ["a", "b"]},
+        "log": ["logs/aggregate.log"],
+        "threads": 4,
+        "resources": {"mem_mb": 8000, "runtime": 60},
+        "jobid": 17,
+        "cluster": {"queue": "all.q"},
+    }
+
+
+def write_jobscript(directory: str, inputs: int) -> str:
+    path = Path(directory) / "snakejob.aggregate.{}.sh".format(inputs)
+    path.write_text("#!/bin/sh\n# properties = {}\n{}\n".format(
+        json.dumps(job_properties(inputs)), "snakemake --snakefile ..."))
+    return str(path)
+
+
+def best_of(repeat: int, func, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(argv=sys.argv[1:]):
+    from snakemake.utils import read_job_properties as read_all
+
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    p.add_argument("--inputs", type=int, nargs="+", default=[100, 100000])
+    p.add_argument("--repeat", type=int, default=5)
+    args = p.parse_args(argv)
+
+    print("inputs\tsize\tsnakemake_ms\tlean_ms\tspeedup")
+    with tempfile.TemporaryDirectory() as directory:
+        for inputs in args.inputs:
+            jobscript = write_jobscript(directory, inputs)
+            expected = {
+                key: value for key, value in read_all(jobscript).items()
+                if key in SUBMITTER_KEYS
+            }
+            assert read_job_properties(jobscript, SUBMITTER_KEYS) == expected
+            full = best_of(args.repeat, read_all, jobscript)
+            lean = best_of(
+                args.repeat, read_job_properties, jobscript, SUBMITTER_KEYS)
+            print("{}\t{:.1f}M\t{:.2f}\t{:.2f}\t{:.1f}x".format(
+                inputs, Path(jobscript).stat().st_size / 1024 ** 2,
+                full * 1000, lean * 1000, full / lean))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Parse time and peak memory of bulk `qstat -xml` output.
+
+Generates a synthetic `qstat -xml` listing with the given number of jobs and
+compares the streaming parser of `sge_qstat_xml` with building the whole
+ElementTree first, as a plain `ElementTree.parse` would.
+
+    python benchmarks/bench_qstat_xml.py --jobs 50000
+"""
+
+import io
+import sys
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+from xml.etree import ElementTree
+
+sys.path.append(
+    str(Path(__file__).parent.parent.absolute() / "snakemake_gridengine"))
+from sge_qstat_xml import iter_qstat_xml, qstat_states  # noqa: E402
+
+
+JOB_TEMPLATE = """\
+    <job_list state="{list_state}">
+      <JB_job_number>{jobid}</JB_job_number>
+      <JAT_prio>0.50500</JAT_prio>
+      <JB_name>snakejob.rule.{jobid}.sh</JB_name>
+      <JB_owner>snakemake</JB_owner>
+      <state>{state}</state>
+      <JAT_start_time>2020-08-03T07:48:20.919</JAT_start_time>
+      <queue_name>{queue}</queue_name>
+      <jclass_name></jclass_name>
+      <slots>1</slots>
+    </job_list>
+"""
+
+
+def generate_qstat_xml(jobs: int) -> bytes:
+    running = jobs // 4
+    parts = ["<?xml version='1.0'?>\n<job_info>\n  <queue_info>\n"]
+    for jobid in range(1, running + 1):
+        parts.append(JOB_TEMPLATE.format(
+            list_state="running", jobid=jobid, state="r",
+            queue="all.q@node{}".format(jobid % 100)))
+    parts.append("  </queue_info>\n  <job_info>\n")
+    for jobid in range(running + 1, jobs + 1):
+        parts.append(JOB_TEMPLATE.format(
+            list_state="pending", jobid=jobid, state="qw", queue=""))
+    parts.append("  </job_info>\n</job_info>\n")
+    return "".join(parts).encode()
+
+
+def parse_streaming(data: bytes) -> dict:
+    return qstat_states(iter_qstat_xml(io.BytesIO(data)))
+
+
+def parse_tree(data: bytes) -> dict:
+    root = ElementTree.parse(io.BytesIO(data)).getroot()
+    return {
+        job.findtext("JB_job_number"): job.findtext("state")
+        for job in root.iter("job_list")
+    }
+
+
+def measure(parse, data: bytes) -> tuple:
+    tracemalloc.start()
+    start = time.perf_counter()
+    states = parse(data)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_ms, peak, len(states)
+
+
+def main(argv=sys.argv[1:]):
+    p = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    p.add_argument("--jobs", type=int, default=50000)
+    args = p.parse_args(argv)
+
+    data = generate_qstat_xml(args.jobs)
+    print(f"qstat -xml with {args.jobs} jobs, {len(data) / 2**20:.1f} MiB")
+    for name, parse in [("streaming", parse_streaming), ("tree", parse_tree)]:
+        elapsed_ms, peak, count = measure(parse, data)
+        print(
+            f"{name:>10}: {elapsed_ms:8.1f} ms, "
+            f"peak {peak / 2**20:6.1f} MiB, {count} jobs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+End to end submit and status throughput against the fake Grid Engine.
+
+Installs `fake_sge.py` in a scratch directory, submits `--jobs` jobscripts
+through `Submitter` and then checks the state of every active job with
+`StatusChecker` once per `--poll-interval`, the way Snakemake does, until
+all jobs are finished. Reports submissions per second, status calls per
+job, the qsub/qstat/qacct/qdel calls that reached the fake qmaster and how
+long after a job ended its completion was detected.
+
+    python benchmarks/bench_throughput.py --jobs 1000 --runtime 10
+    python benchmarks/bench_throughput.py --jobs 1000 --sidecar
+    python benchmarks/bench_throughput.py --jobs 200 --spawn
+
+`--spawn` runs `uge_submit.py` and `uge_status.py` as processes, which is
+what Snakemake does, instead of calling them in-process.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import getpass
+import logging
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).parent.absolute()
+PROFILE_DIR = BENCHMARKS_DIR.parent / "snakemake_gridengine"
+sys.path.append(str(BENCHMARKS_DIR))
+sys.path.append(str(PROFILE_DIR))
+from fake_sge import FakeGridEngine, DEFAULT_SETTINGS  # noqa: E402
+
+
+def write_jobscripts(workdir: Path, jobs: int) -> list:
+    jobscripts = []
+    for jobid in range(1, jobs + 1):
+        properties = {
+            "type": "single", "rule": "bench", "local": False,
+            "input": [], "output": ["out/{}.txt".format(jobid)],
+            "wildcards": {"i": str(jobid)}, "params": {}, "log": [],
+            "threads": 1, "resources": {"mem_mb": 100}, "jobid": jobid,
+            "cluster": {},
+        }
+        jobscript = workdir / "jobscripts" / "snakejob.bench.{}.sh".format(
+            jobid)
+        jobscript.parent.mkdir(parents=True, exist_ok=True)
+        jobscript.write_text("#!/bin/sh\n# properties = {}\ntrue\n".format(
+            json.dumps(properties)))
+        jobscripts.append(jobscript)
+    return jobscripts
+
+
+def submit_in_process(jobscript: Path) -> str:
+    from uge_submit import Submitter
+
+    return Submitter(str(jobscript)).submit()
+
+
+def submit_spawned(jobscript: Path) -> str:
+    completed_process = subprocess.run(
+        [sys.executable, str(PROFILE_DIR / "uge_submit.py"), str(jobscript)],
+        check=True, stdout=subprocess.PIPE)
+    return completed_process.stdout.decode().strip()
+
+
+def status_in_process(submitted: str) -> str:
+    from uge_status import StatusChecker
+
+    jobid, _, outlog = submitted.partition(" ")
+    return StatusChecker(jobid, outlog).get_status()
+
+
+def status_spawned(submitted: str) -> str:
+    completed_process = subprocess.run(
+        [sys.executable, str(PROFILE_DIR / "uge_status.py"), submitted],
+        check=True, stdout=subprocess.PIPE)
+    return completed_process.stdout.decode().strip()
+
+
+def start_sidecar(interval: float) -> str:
+    from uge_sidecar import QstatPoller, SidecarServer, default_socket_path
+    from uge_sidecar_client import SIDECAR_VARS_ENV
+
+    poller = QstatPoller(getpass.getuser(), interval=interval)
+    poller.poll()
+    socket_path = default_socket_path()
+    server = SidecarServer(socket_path, poller)
+    threading.Thread(
+        target=poller.run_forever, args=(threading.Event(),),
+        daemon=True).start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ[SIDECAR_VARS_ENV] = json.dumps({"status_socket": socket_path})
+    return socket_path
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run(args, scratch: Path) -> dict:
+    settings = {key: getattr(args, key) for key in DEFAULT_SETTINGS}
+    fake = FakeGridEngine.install(scratch / "sge", settings)
+    os.environ.update(fake.environ())
+    # keep the accounting index and the sidecar socket in the scratch dir
+    os.environ["TMPDIR"] = str(scratch)
+    tempfile.tempdir = str(scratch)
+    workdir = scratch / "work"
+    workdir.mkdir()
+    os.chdir(workdir)
+
+    submit = submit_spawned if args.spawn else submit_in_process
+    status = status_spawned if args.spawn else status_in_process
+    if args.sidecar:
+        start_sidecar(args.sidecar_interval)
+
+    jobscripts = write_jobscripts(workdir, args.jobs)
+    start = time.perf_counter()
+    active = {submit(jobscript): 0 for jobscript in jobscripts}
+    submit_seconds = time.perf_counter() - start
+
+    detected = {}
+    calls = {}
+    while active:
+        round_start = time.time()
+        for submitted in list(active):
+            state = status(submitted)
+            calls[submitted] = calls.get(submitted, 0) + 1
+            if state != "running":
+                detected[submitted] = (time.time(), state)
+                del active[submitted]
+        elapsed = time.time() - round_start
+        if active and elapsed < args.poll_interval:
+            time.sleep(args.poll_interval - elapsed)
+
+    ends = {
+        str(task["jobid"]): (task["end"], task["exit_status"])
+        for task in fake.tasks()
+    }
+    latencies = []
+    wrong = 0
+    for submitted, (detected_at, state) in detected.items():
+        end, exit_status = ends[submitted.split()[0]]
+        latencies.append(detected_at - end)
+        wrong += state != ("success" if exit_status == 0 else "failed")
+
+    return {
+        "jobs": args.jobs,
+        "submissions_per_second": args.jobs / submit_seconds,
+        "status_calls_per_job": sum(calls.values()) / args.jobs,
+        "qmaster_calls": fake.command_counts(),
+        "latency_median": statistics.median(latencies),
+        "latency_p95": percentile(latencies, 0.95),
+        "wrong_states": wrong,
+    }
+
+
+def main(argv=sys.argv[1:]):
+    p = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    p.add_argument("--jobs", type=int, default=200)
+    p.add_argument("--queue-wait", type=float, default=2.0)
+    p.add_argument("--runtime", type=float, default=5.0)
+    p.add_argument("--failure-rate", type=float, default=0.05)
+    p.add_argument("--accounting-lag", type=float, default=1.0)
+    p.add_argument("--hosts", type=int, default=DEFAULT_SETTINGS["hosts"])
+    p.add_argument("--seed", type=int, default=DEFAULT_SETTINGS["seed"])
+    p.add_argument(
+        "--poll-interval", type=float, default=1.0,
+        help="seconds between two status rounds over all active jobs")
+    p.add_argument("--sidecar", action="store_true")
+    p.add_argument("--sidecar-interval", type=float, default=1.0)
+    p.add_argument("--spawn", action="store_true")
+    p.add_argument("--json", action="store_true", help="print JSON")
+    p.add_argument("--keep", action="store_true", help="keep the scratch dir")
+    args = p.parse_args(argv)
+
+    scratch = Path(tempfile.mkdtemp(prefix="uge-bench-"))
+    cwd = os.getcwd()
+    try:
+        report = run(args, scratch)
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"scratch directory: {scratch}", file=sys.stderr)
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return 0
+    print(f"jobs:                 {report['jobs']}")
+    print(f"submissions/s:        {report['submissions_per_second']:.1f}")
+    print(f"status calls per job: {report['status_calls_per_job']:.2f}")
+    print("detection latency:    "
+          f"median {report['latency_median']:.2f} s, "
+          f"p95 {report['latency_p95']:.2f} s")
+    print(f"wrong final states:   {report['wrong_states']}")
+    print("qmaster calls:")
+    for command, count in sorted(report["qmaster_calls"].items()):
+        print(f"    {command:<12} {count:8d}  "
+              f"({count / report['jobs']:.2f} per job)")
+    return 0
+
+
+if __name__ == "__main__":
+    # the status checker warns about every job that left qstat
+    logging.basicConfig(level=logging.ERROR)
+    sys.exit(main())
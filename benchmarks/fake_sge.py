@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for a Grid Engine cluster.
+
+`install` creates a cluster root with `qsub`, `qstat`, `qacct`, `qdel`,
+`qhost` and `qconf` links to this script in `<root>/bin`; it dispatches on the
+name it is called by. Jobs are not run, a simulated scheduler decides when
+each task starts, how long it runs and whether it fails:
+
+    python benchmarks/fake_sge.py install /tmp/sge --runtime 5 --failure-rate 0.1
+    export PATH=/tmp/sge/bin:$PATH SGE_ROOT=/tmp/sge
+
+Queue wait and runtime are exponentially distributed around the configured
+means. Finished tasks are written to `$SGE_ROOT/default/common/accounting`
+(and become visible to `qacct`) only `accounting_lag` seconds after they
+end. Every invocation is counted, `python benchmarks/fake_sge.py stats
+/tmp/sge` prints the counts.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shlex
+import sqlite3
+import getpass
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+PathLike = Union[str, Path]
+
+COMMANDS = ["qsub", "qstat", "qacct", "qdel", "qhost", "qconf"]
+
+DEFAULT_SETTINGS = {
+    "queue_wait": 1.0,
+    "runtime": 5.0,
+    "failure_rate": 0.0,
+    "accounting_lag": 1.0,
+    "hosts": 4,
+    "seed": 0,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    jobid INTEGER,
+    taskid INTEGER,
+    name TEXT,
+    owner TEXT,
+    queue TEXT,
+    slots INTEGER,
+    submitted REAL,
+    start REAL,
+    end REAL,
+    exit_status INTEGER,
+    failed INTEGER DEFAULT 0,
+    accounted INTEGER DEFAULT 0,
+    PRIMARY KEY (jobid, taskid)
+);
+CREATE INDEX IF NOT EXISTS tasks_to_account ON tasks (accounted, end);
+CREATE TABLE IF NOT EXISTS counters (
+    command TEXT PRIMARY KEY,
+    count INTEGER
+);
+CREATE TABLE IF NOT EXISTS sequence (
+    jobid INTEGER
+);
+"""
+
+# number of fields of an accounting(5) record and the ones that are filled
+ACCOUNTING_FIELDS = 45
+QNAME, HOSTNAME, GROUP, OWNER, JOB_NAME, JOB_NUMBER = 0, 1, 2, 3, 4, 5
+SUBMISSION_TIME, START_TIME, END_TIME, FAILED, EXIT_STATUS = 8, 9, 10, 11, 12
+RU_WALLCLOCK, RU_MAXRSS, SLOTS, TASK_NUMBER = 13, 16, 34, 35
+PE_TASKID, MAXVMEM = 41, 42
+
+# failed code of a job deleted by qdel, see man accounting(5)
+FAILED_DELETED = 100
+
+
+def _timestamp(seconds: float) -> str:
+    return time.strftime("%m/%d/%Y %H:%M:%S", time.localtime(seconds))
+
+
+def _iso_timestamp(seconds: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(seconds))
+
+
+class FakeGridEngine:
+    def __init__(self, root: PathLike):
+        self._root = Path(root)
+        self._connection = None
+        self._settings = None
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    @property
+    def bin_dir(self) -> Path:
+        return self.root / "bin"
+
+    @property
+    def accounting_file(self) -> Path:
+        return self.root / "default" / "common" / "accounting"
+
+    @property
+    def settings(self) -> dict:
+        if self._settings is None:
+            with (self.root / "settings.json").open() as infile:
+                self._settings = dict(DEFAULT_SETTINGS, **json.load(infile))
+        return self._settings
+
+    @property
+    def hosts(self) -> List[str]:
+        return ["node{:02d}".format(i) for i in range(self.settings["hosts"])]
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(
+                str(self.root / "scheduler.db"), timeout=60,
+                isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    @staticmethod
+    def install(root: PathLike, settings: dict = None) -> "FakeGridEngine":
+        root = Path(root)
+        (root / "bin").mkdir(parents=True, exist_ok=True)
+        (root / "default" / "common").mkdir(parents=True, exist_ok=True)
+        with (root / "settings.json").open("w") as outfile:
+            json.dump(dict(DEFAULT_SETTINGS, **(settings or {})), outfile)
+        script = Path(__file__).absolute()
+        for command in COMMANDS:
+            link = root / "bin" / command
+            if link.is_symlink() or link.exists():
+                link.unlink()
+            link.symlink_to(script)
+        fake = FakeGridEngine(root)
+        fake.accounting_file.touch()
+        return fake
+
+    def environ(self, environ: dict = None) -> dict:
+        """Environment in which the profile talks to this cluster."""
+        environ = dict(os.environ if environ is None else environ)
+        environ["PATH"] = os.pathsep.join(
+            [str(self.bin_dir), environ.get("PATH", "")])
+        environ["SGE_ROOT"] = str(self.root)
+        environ["SGE_CELL"] = "default"
+        return environ
+
+    def count(self, command: str):
+        self.connection.execute(
+            "INSERT INTO counters VALUES (?, 1) ON CONFLICT(command) "
+            "DO UPDATE SET count = count + 1", (command,))
+
+    def command_counts(self) -> Dict[str, int]:
+        return {
+            row["command"]: row["count"]
+            for row in self.connection.execute("SELECT * FROM counters")
+        }
+
+    def _simulate(self, jobid: int, taskid: int, submitted: float) -> tuple:
+        settings = self.settings
+        rng = random.Random("{}:{}:{}".format(settings["seed"], jobid, taskid))
+
+        def draw(mean):
+            return rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+
+        start = submitted + draw(settings["queue_wait"])
+        end = start + draw(settings["runtime"])
+        exit_status = 1 if rng.random() < settings["failure_rate"] else 0
+        return start, end, exit_status
+
+    def submit(
+            self, name: str, queue: str = None, slots: int = 1,
+            tasks: Optional[range] = None) -> int:
+        now = time.time()
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT jobid FROM sequence").fetchone()
+            jobid = (row["jobid"] if row else 0) + 1
+            connection.execute("DELETE FROM sequence")
+            connection.execute("INSERT INTO sequence VALUES (?)", (jobid,))
+            for taskid in tasks or [0]:
+                start, end, exit_status = self._simulate(jobid, taskid, now)
+                connection.execute(
+                    "INSERT INTO tasks (jobid, taskid, name, owner, queue, "
+                    "slots, submitted, start, end, exit_status) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (jobid, taskid, name, getpass.getuser(), queue or "all.q",
+                     slots, now, start, end, exit_status))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return jobid
+
+    def tasks(self, jobid: int = None) -> List[sqlite3.Row]:
+        if jobid is None:
+            return self.connection.execute(
+                "SELECT * FROM tasks ORDER BY jobid, taskid").fetchall()
+        return self.connection.execute(
+            "SELECT * FROM tasks WHERE jobid = ? ORDER BY taskid",
+            (jobid,)).fetchall()
+
+    def active_tasks(self, now: float) -> List[sqlite3.Row]:
+        return self.connection.execute(
+            "SELECT * FROM tasks WHERE end > ? ORDER BY jobid, taskid",
+            (now,)).fetchall()
+
+    def host(self, task: sqlite3.Row) -> str:
+        hosts = self.hosts
+        return hosts[(task["jobid"] + task["taskid"]) % len(hosts)]
+
+    def accounting_line(self, task: sqlite3.Row) -> str:
+        fields = ["0"] * ACCOUNTING_FIELDS
+        fields[QNAME] = task["queue"]
+        fields[HOSTNAME] = self.host(task)
+        fields[GROUP] = "users"
+        fields[OWNER] = task["owner"]
+        fields[JOB_NAME] = task["name"]
+        fields[JOB_NUMBER] = str(task["jobid"])
+        fields[SUBMISSION_TIME] = str(int(task["submitted"]))
+        fields[START_TIME] = str(int(task["start"]))
+        fields[END_TIME] = str(int(task["end"]))
+        fields[FAILED] = str(task["failed"])
+        fields[EXIT_STATUS] = str(task["exit_status"])
+        fields[RU_WALLCLOCK] = "{:.3f}".format(task["end"] - task["start"])
+        fields[SLOTS] = str(task["slots"])
+        fields[TASK_NUMBER] = str(task["taskid"])
+        fields[PE_TASKID] = "NONE"
+        fields[RU_MAXRSS] = str(80 * 1024)
+        fields[MAXVMEM] = str(100 * 2 ** 20)
+        return ":".join(fields) + "\n"
+
+    def flush_accounting(self, now: float):
+        """Append the tasks that ended `accounting_lag` ago to the file."""
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            tasks = connection.execute(
+                "SELECT * FROM tasks WHERE accounted = 0 AND end <= ? "
+                "ORDER BY end",
+                (now - self.settings["accounting_lag"],)).fetchall()
+            if tasks:
+                with self.accounting_file.open("a") as outfile:
+                    outfile.writelines(
+                        self.accounting_line(task) for task in tasks)
+                connection.executemany(
+                    "UPDATE tasks SET accounted = 1 "
+                    "WHERE jobid = ? AND taskid = ?",
+                    [(task["jobid"], task["taskid"]) for task in tasks])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def delete(self, jobid: int, now: float, taskids=None) -> bool:
+        tasks = [
+            task for task in self.tasks(jobid)
+            if task["end"] > now
+            and (taskids is None or task["taskid"] in taskids)
+        ]
+        for task in tasks:
+            started = task["start"] <= now
+            # tasks that never started leave no accounting record
+            self.connection.execute(
+                "UPDATE tasks SET start = min(start, ?), end = ?, "
+                "failed = ?, exit_status = 137, accounted = ? "
+                "WHERE jobid = ? AND taskid = ?",
+                (now, now, FAILED_DELETED, 0 if started else -1,
+                 jobid, task["taskid"]))
+        return bool(tasks)
+
+
+def _state(task: sqlite3.Row, now: float) -> str:
+    return "r" if task["start"] <= now else "qw"
+
+
+def _parse_tasks(spec: str) -> range:
+    bounds, _, step = spec.partition(":")
+    first, _, last = bounds.partition("-")
+    return range(int(first), int(last or first) + 1, int(step or 1))
+
+
+def qsub(fake: FakeGridEngine, argv: List[str]) -> int:
+    fake.count("qsub")
+    name, queue, slots, tasks = None, None, 1, None
+    args = iter(argv)
+    jobscript = None
+    for arg in args:
+        if arg == "-N":
+            name = next(args)
+        elif arg == "-q":
+            queue = next(args)
+        elif arg == "-t":
+            tasks = _parse_tasks(next(args))
+        elif arg == "-pe":
+            next(args)
+            slots = int(next(args))
+        elif arg in ("-o", "-e", "-l", "-S", "-wd", "-j", "-hold_jid", "-M",
+                     "-m", "-P", "-A", "-v"):
+            next(args)
+        elif not arg.startswith("-"):
+            jobscript = arg
+    if jobscript is None:
+        print("Unable to read script file because of error: no script",
+              file=sys.stderr)
+        return 1
+    name = name or os.path.basename(jobscript)
+    jobid = fake.submit(name, queue=queue, slots=slots, tasks=tasks)
+    if tasks is None:
+        print('Your job {} ("{}") has been submitted'.format(jobid, name))
+    else:
+        print('Your job-array {}.{}-{}:{} ("{}") has been submitted'.format(
+            jobid, tasks.start, tasks[-1], tasks.step, name))
+    return 0
+
+
+def _qstat_job(fake: FakeGridEngine, jobids: str, now: float) -> int:
+    missing = []
+    for jobid in jobids.split(","):
+        tasks = [
+            task for task in fake.tasks(int(jobid)) if task["end"] > now
+        ] if jobid.isdigit() else []
+        if not tasks:
+            missing.append(jobid)
+            continue
+        first = tasks[0]
+        print("=" * 62)
+        print("{:<28}{}".format("job_number:", jobid))
+        print("{:<28}{}".format(
+            "submission_time:", _timestamp(first["submitted"])))
+        print("{:<28}{}".format("owner:", first["owner"]))
+        print("{:<28}{}".format("job_name:", first["name"]))
+        if first["taskid"]:
+            print("{:<28}{}".format(
+                "job-array tasks:", ",".join(str(t["taskid"]) for t in tasks)))
+        for task in tasks:
+            print("{:<22}{:>5}:    {}".format(
+                "job_state", task["taskid"] or 1, _state(task, now)))
+    if missing:
+        print("Following jobs do not exist: ", file=sys.stderr)
+        print(", ".join(missing), file=sys.stderr)
+        return 1
+    return 0
+
+
+def _job_list_xml(fake: FakeGridEngine, task: sqlite3.Row, now: float) -> str:
+    running = task["start"] <= now
+    lines = [
+        '    <job_list state="{}">'.format("running" if running else "pending"),
+        "      <JB_job_number>{}</JB_job_number>".format(task["jobid"]),
+        "      <JAT_prio>0.50500</JAT_prio>",
+        "      <JB_name>{}</JB_name>".format(task["name"]),
+        "      <JB_owner>{}</JB_owner>".format(task["owner"]),
+        "      <state>{}</state>".format(_state(task, now)),
+    ]
+    if running:
+        lines.append("      <JAT_start_time>{}</JAT_start_time>".format(
+            _iso_timestamp(task["start"])))
+        lines.append("      <queue_name>{}@{}</queue_name>".format(
+            task["queue"], fake.host(task)))
+    else:
+        lines.append("      <JB_submission_time>{}</JB_submission_time>"
+                     .format(_iso_timestamp(task["submitted"])))
+        lines.append("      <queue_name></queue_name>")
+    lines.append("      <slots>{}</slots>".format(task["slots"]))
+    if task["taskid"]:
+        lines.append("      <tasks>{}</tasks>".format(task["taskid"]))
+    lines.append("    </job_list>")
+    return "\n".join(lines)
+
+
+def _qstat_xml(fake: FakeGridEngine, now: float) -> int:
+    tasks = fake.active_tasks(now)
+    print("<?xml version='1.0'?>")
+    print("<job_info>")
+    print("  <queue_info>")
+    for task in tasks:
+        if task["start"] <= now:
+            print(_job_list_xml(fake, task, now))
+    print("  </queue_info>")
+    print("  <job_info>")
+    for task in tasks:
+        if task["start"] > now:
+            print(_job_list_xml(fake, task, now))
+    print("  </job_info>")
+    print("</job_info>")
+    return 0
+
+
+def _qstat_table(fake: FakeGridEngine, now: float) -> int:
+    tasks = fake.active_tasks(now)
+    if not tasks:
+        return 0
+    print("job-ID  prior   name       user         state submit/start at     "
+          "queue                          slots ja-task-ID")
+    print("-" * 113)
+    for task in tasks:
+        running = task["start"] <= now
+        print("{:>7} 0.50500 {:<10.10} {:<12.12} {:<5} {:<19} {:<30} {:>5} {}"
+              .format(
+                  task["jobid"], task["name"], task["owner"],
+                  _state(task, now),
+                  _timestamp(task["start"] if running else task["submitted"]),
+                  "{}@{}".format(task["queue"], fake.host(task))
+                  if running else "",
+                  task["slots"], task["taskid"] or ""))
+    return 0
+
+
+def _qstat_cluster_queues(fake: FakeGridEngine, now: float) -> int:
+    # every host offers 32 slots in every queue that has jobs
+    total = 32 * len(fake.hosts)
+    used = {}
+    for task in fake.active_tasks(now):
+        if task["start"] <= now:
+            used[task["queue"]] = used.get(task["queue"], 0) + task["slots"]
+    print("CLUSTER QUEUE                   CQLOAD   USED    RES  AVAIL  TOTAL "
+          "aoACDS  cdsuE")
+    print("-" * 80)
+    for queue in sorted(set(used) | {"all.q"}):
+        print("{:<30} {:>7.2f} {:>6} {:>6} {:>6} {:>6} {:>6} {:>6}".format(
+            queue, min(1.0, used.get(queue, 0) / total), used.get(queue, 0),
+            0, max(0, total - used.get(queue, 0)), total, 0, 0))
+    return 0
+
+
+def qstat(fake: FakeGridEngine, argv: List[str]) -> int:
+    now = time.time()
+    if "-g" in argv:
+        fake.count("qstat -g c")
+        return _qstat_cluster_queues(fake, now)
+    if "-j" in argv:
+        fake.count("qstat -j")
+        return _qstat_job(fake, argv[argv.index("-j") + 1], now)
+    if "-xml" in argv:
+        fake.count("qstat -xml")
+        return _qstat_xml(fake, now)
+    fake.count("qstat")
+    return _qstat_table(fake, now)
+
+
+def _qacct_record(fake: FakeGridEngine, task: sqlite3.Row) -> str:
+    fields = [
+        ("qname", task["queue"]),
+        ("hostname", fake.host(task)),
+        ("group", "users"),
+        ("owner", task["owner"]),
+        ("jobname", task["name"]),
+        ("jobnumber", task["jobid"]),
+        ("taskid", task["taskid"] or "undefined"),
+        ("pe_taskid", "NONE"),
+        ("qsub_time", _timestamp(task["submitted"])),
+        ("start_time", _timestamp(task["start"])),
+        ("end_time", _timestamp(task["end"])),
+        ("slots", task["slots"]),
+        ("failed", task["failed"]),
+        ("exit_status", task["exit_status"]),
+        ("ru_wallclock", "{:.3f}".format(task["end"] - task["start"])),
+        ("ru_maxrss", 80 * 1024),
+        ("maxvmem", "100.000M"),
+    ]
+    return "\n".join(["=" * 62] + [
+        "{:<13}{}".format(key, value) for key, value in fields])
+
+
+def qacct(fake: FakeGridEngine, argv: List[str]) -> int:
+    fake.count("qacct")
+    if "-j" not in argv:
+        print("error: only qacct -j is supported", file=sys.stderr)
+        return 1
+    jobid = argv[argv.index("-j") + 1]
+    taskid = argv[argv.index("-t") + 1] if "-t" in argv else None
+    tasks = [
+        task for task in fake.tasks(int(jobid))
+        if task["accounted"] == 1
+        and (taskid is None or str(task["taskid"]) == taskid)
+    ] if jobid.isdigit() else []
+    if not tasks:
+        print("error: job id {} not found".format(jobid), file=sys.stderr)
+        return 1
+    for task in tasks:
+        print(_qacct_record(fake, task))
+    return 0
+
+
+def qdel(fake: FakeGridEngine, argv: List[str]) -> int:
+    fake.count("qdel")
+    now = time.time()
+    returncode = 0
+    for arg in argv:
+        for jobid in arg.split(","):
+            # `<jobid>.<task range>` deletes some tasks of an array job
+            jobid, _, task_range = jobid.partition(".")
+            if not jobid.isdigit():
+                continue
+            sge_jobid = int(jobid)
+            taskids = _parse_tasks(task_range) if task_range else None
+            if fake.delete(sge_jobid, now, taskids):
+                print("{} has deleted job {}".format(
+                    getpass.getuser(), sge_jobid))
+            else:
+                print('denied: job "{}" does not exist'.format(sge_jobid),
+                      file=sys.stderr)
+                returncode = 1
+    return returncode
+
+
+def qhost(fake: FakeGridEngine, argv: List[str]) -> int:
+    fake.count("qhost")
+    print("HOSTNAME                ARCH         NCPU NSOC NCOR NTHR  LOAD  "
+          "MEMTOT  MEMUSE  SWAPTO  SWAPUS")
+    print("-" * 100)
+    print("global                  -               -    -    -    -     -"
+          "       -       -       -       -")
+    for host in fake.hosts:
+        print("{:<23} lx-amd64       32    2   16   32  0.50  "
+              "251.8G   12.3G    8.0G     0.0".format(host))
+    return 0
+
+
+COMPLEXES = [
+    ("arch", "a", "RESTRING", "==", "YES", "NO", "NONE", "0"),
+    ("h_rt", "h_rt", "TIME", "<=", "YES", "NO", "0:0:0", "0"),
+    ("h_vmem", "h_vmem", "MEMORY", "<=", "YES", "NO", "0", "0"),
+    ("hostname", "h", "HOST", "==", "YES", "NO", "NONE", "0"),
+    ("load_avg", "la", "DOUBLE", ">=", "NO", "NO", "0", "0"),
+    ("m_mem_free", "mfree", "MEMORY", "<=", "YES", "YES", "0", "0"),
+    ("qname", "q", "RESTRING", "==", "YES", "NO", "NONE", "0"),
+    ("slots", "s", "INT", "<=", "YES", "YES", "1", "1000"),
+]
+
+
+def qconf(fake: FakeGridEngine, argv: List[str]) -> int:
+    fake.count("qconf")
+    if argv != ["-sc"]:
+        print("error: only qconf -sc is supported", file=sys.stderr)
+        return 1
+    row = "{:<19} {:<10} {:<11} {:<5} {:<11} {:<10} {:<8} {}"
+    print(row.format(
+        "#name", "shortcut", "type", "relop", "requestable", "consumable",
+        "default", "urgency"))
+    print("#" + "-" * 88)
+    for complex_ in COMPLEXES:
+        print(row.format(*complex_))
+    return 0
+
+
+def main(argv=sys.argv[1:]):
+    p = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    p.add_argument("command", choices=["install", "stats"])
+    p.add_argument("root", help="cluster root, use it as SGE_ROOT")
+    for key, value in DEFAULT_SETTINGS.items():
+        p.add_argument(
+            "--{}".format(key.replace("_", "-")), type=type(value),
+            default=value)
+    args = p.parse_args(argv)
+
+    if args.command == "install":
+        settings = {key: getattr(args, key) for key in DEFAULT_SETTINGS}
+        fake = FakeGridEngine.install(args.root, settings)
+        print("export PATH={}:$PATH SGE_ROOT={} SGE_CELL=default".format(
+            shlex.quote(str(fake.bin_dir)), shlex.quote(str(fake.root))))
+    else:
+        fake = FakeGridEngine(args.root)
+        print(json.dumps(fake.command_counts(), indent=2, sort_keys=True))
+    return 0
+
+
+def dispatch(argv=sys.argv) -> int:
+    command = os.path.basename(argv[0])
+    if command not in COMMANDS:
+        return main(argv[1:])
+    # the links live in <root>/bin
+    root = os.environ.get("SGE_ROOT") or \
+        os.path.dirname(os.path.dirname(os.path.abspath(argv[0])))
+    fake = FakeGridEngine(root)
+    # the accounting file is written as time passes, not by a daemon
+    fake.flush_accounting(time.time())
+    return globals()[command](fake, argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(dispatch())
@@ -4,4 +4,17 @@
 # exit on first error
 set -o errexit
 
+# start and end stamps of the job for uge_trace.py, only when tracing
+if [ -n "${{UGE_TRACE:-}}" ] && [ -n "${{UGE_TRACE_ID:-}}" ]; then
+    uge_trace_stamp() {{
+        local now
+        now=$(date +%s.%N)
+        printf '{{"trace_id": "%s", "name": "%s", "start": %s, "end": %s, "jobid": "%s", "host": "%s", "exit_status": %s}}\n' \
+            "$UGE_TRACE_ID" "$1" "$now" "$now" "${{JOB_ID:-}}" \
+            "$(hostname)" "${{2:-null}}" >> "$UGE_TRACE" || true
+    }}
+    uge_trace_stamp job.start
+    trap 'uge_trace_stamp job.end $?' EXIT
+fi
+
 {exec_job}
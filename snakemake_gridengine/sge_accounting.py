@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import getpass
+import logging
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+from typing import Optional
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from snapshot_cache import file_lock, atomic_write, PathLike
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 4
+MAX_INDEXED_RECORDS = 200000
+
+# field positions in the accounting file, see man accounting(5)
+QNAME = 0
+HOSTNAME = 1
+OWNER = 3
+JOB_NUMBER = 5
+SUBMISSION_TIME = 8
+START_TIME = 9
+FAILED = 11
+EXIT_STATUS = 12
+RU_WALLCLOCK = 13
+RU_MAXRSS = 16
+TASK_NUMBER = 35
+PE_TASKID = 41
+MAXVMEM = 42
+
+
+AccountingRecord = namedtuple(
+    "AccountingRecord",
+    ["failed", "exit_status", "maxvmem", "wallclock", "hostname", "maxrss",
+     "qname", "wait"])
+
+
+def default_accounting_file() -> Optional[str]:
+    sge_root = os.environ.get("SGE_ROOT")
+    if not sge_root:
+        return None
+    return os.path.join(
+        sge_root, os.environ.get("SGE_CELL", "default"), "common", "accounting")
+
+
+def default_index_path() -> str:
+    return os.path.join(
+        tempfile.gettempdir(),
+        "sge-accounting-{user}.json".format(user=getpass.getuser()))
+
+
+def record_key(jobid, taskid=None) -> str:
+    if taskid in (None, "", "0", "undefined"):
+        return str(jobid)
+    return "{}.{}".format(jobid, taskid)
+
+
+def queue_wait(submitted: int, started: int) -> Optional[float]:
+    """Seconds a job waited to start, None if it never started."""
+    if started <= 0:
+        return None
+    wait = started - submitted
+    # Univa Grid Engine records the times in milliseconds
+    if submitted > 10 ** 11:
+        wait /= 1000
+    return wait
+
+
+def parse_accounting_line(line: str, owner: Optional[str] = None):
+    """Return (key, AccountingRecord) for one accounting line or None."""
+    if not line or line.startswith("#"):
+        return None
+    fields = line.rstrip("\n").split(":")
+    if len(fields) <= MAXVMEM:
+        return None
+    if owner is not None and fields[OWNER] != owner:
+        return None
+    # records of the slave tasks of a parallel job
+    if fields[PE_TASKID] != "NONE":
+        return None
+    try:
+        record = AccountingRecord(
+            failed=int(fields[FAILED]),
+            exit_status=int(fields[EXIT_STATUS]),
+            maxvmem=float(fields[MAXVMEM]),
+            wallclock=float(fields[RU_WALLCLOCK]),
+            hostname=fields[HOSTNAME],
+            # kilobytes, as reported by getrusage(2)
+            maxrss=float(fields[RU_MAXRSS]),
+            qname=fields[QNAME],
+            wait=queue_wait(
+                int(fields[SUBMISSION_TIME]), int(fields[START_TIME])),
+        )
+    except ValueError:
+        return None
+    return record_key(fields[JOB_NUMBER], fields[TASK_NUMBER]), record
+
+
+class AccountingIndex:
+    """
+    Incremental jobid index over the Grid Engine accounting file.
+
+    The accounting file is tailed from the byte offset saved in the index,
+    so every invocation only parses the records appended since the last
+    one. The records go to `<index>.records`, one JSON line each, which is
+    only ever appended to; the small index file itself holds the offsets.
+    When a job was rerun the last record wins. A truncated or replaced
+    (rotated) accounting file is read again from the start. Once the
+    records file holds twice `MAX_INDEXED_RECORDS` lines it is compacted to
+    the latest record of the most recent jobs.
+    """
+
+    def __init__(
+            self,
+            accounting_file: PathLike,
+            index_path: PathLike = None,
+            owner: Optional[str] = None):
+        self._accounting_file = Path(accounting_file)
+        self._index_path = Path(index_path or default_index_path())
+        self._owner = owner
+        self._index = None
+        self._records = None
+
+    @property
+    def accounting_file(self) -> Path:
+        return self._accounting_file
+
+    @property
+    def index_path(self) -> Path:
+        return self._index_path
+
+    @property
+    def records_path(self) -> Path:
+        return self._index_path.with_name(self._index_path.name + ".records")
+
+    @staticmethod
+    def from_cluster_config(cluster_config: dict) -> Optional["AccountingIndex"]:
+        defaults = cluster_config["__default__"]
+        accounting_file = defaults.get(
+            "accounting_file", default_accounting_file())
+        if not accounting_file or not os.path.isfile(accounting_file):
+            return None
+        return AccountingIndex(
+            accounting_file,
+            index_path=defaults.get("accounting_index_path"),
+            owner=getpass.getuser())
+
+    def _records_size(self) -> int:
+        try:
+            return self.records_path.stat().st_size
+        except OSError:
+            return 0
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path) as infile:
+                index = json.load(infile)
+            # records beyond the index were appended by an interrupted update
+            if index.get("version") == INDEX_VERSION and \
+                    index["records_size"] <= self._records_size():
+                return index
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return {
+            "version": INDEX_VERSION, "inode": None, "offset": 0,
+            "records_size": 0, "records_count": 0,
+        }
+
+    @staticmethod
+    def _is_current(index: dict, stat: os.stat_result) -> bool:
+        return index["inode"] == stat.st_ino and index["offset"] == stat.st_size
+
+    def _tail(self, index: dict, stat: os.stat_result) -> dict:
+        if index["inode"] != stat.st_ino or index["offset"] > stat.st_size:
+            logger.info("accounting file rotated, reading it from the start")
+            index["offset"] = 0
+        index["inode"] = stat.st_ino
+
+        lines = []
+        with open(self.accounting_file, "rb") as infile:
+            infile.seek(index["offset"])
+            for line in infile:
+                # the last line may still be written by the qmaster
+                if not line.endswith(b"\n"):
+                    break
+                index["offset"] += len(line)
+                parsed = parse_accounting_line(
+                    line.decode(errors="replace"), self._owner)
+                if parsed is None:
+                    continue
+                key, record = parsed
+                lines.append(json.dumps([key, list(record)]) + "\n")
+
+        data = "".join(lines).encode()
+        with open(self.records_path, "ab") as outfile:
+            # drop what an interrupted update appended after the last index
+            outfile.truncate(index["records_size"])
+            outfile.write(data)
+        index["records_size"] += len(data)
+        index["records_count"] += len(lines)
+        if index["records_count"] > 2 * MAX_INDEXED_RECORDS:
+            self._compact(index)
+        return index
+
+    def _compact(self, index: dict):
+        records = self._read_records(index)
+        # the dict keeps the order in which the jobs were last recorded
+        latest = {}
+        for line in records.splitlines(keepends=True):
+            key = line[2:line.index(b'"', 2)]
+            latest.pop(key, None)
+            latest[key] = line
+        data = b"".join(list(latest.values())[-MAX_INDEXED_RECORDS:])
+        atomic_write(self.records_path, data)
+        index["records_size"] = len(data)
+        index["records_count"] = min(len(latest), MAX_INDEXED_RECORDS)
+
+    def _read_records(self, index: dict) -> bytes:
+        if not index["records_size"]:
+            return b""
+        with open(self.records_path, "rb") as infile:
+            return infile.read(index["records_size"])
+
+    def update(self):
+        stat = self.accounting_file.stat()
+        index = self._load_index()
+        if not self._is_current(index, stat):
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            with file_lock(self.index_path):
+                index = self._load_index()
+                if not self._is_current(index, stat):
+                    index = self._tail(index, stat)
+                    atomic_write(
+                        self.index_path, json.dumps(index).encode())
+        self._index = index
+        self._records = None
+
+    def lookup(self, jobid, taskid=None) -> Optional[AccountingRecord]:
+        if self._index is None:
+            self.update()
+        if self._records is None:
+            self._records = self._read_records(self._index)
+        # the last line of the job is its latest record, found without
+        # decoding the others
+        needle = json.dumps([record_key(jobid, taskid)])[:-1].encode() + b","
+        start = len(self._records)
+        while True:
+            start = self._records.rfind(needle, 0, start)
+            if start < 0:
+                return None
+            if start == 0 or self._records[start - 1:start] == b"\n":
+                break
+        end = self._records.find(b"\n", start)
+        _, record = json.loads(self._records[start:end])
+        return AccountingRecord(*record)
@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import shlex
+import difflib
+import getpass
+import tempfile
+import subprocess
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from snapshot_cache import SnapshotCache, PathLike
+
+
+# `qconf -sc` changes rarely, an hour old copy is good enough
+COMPLEX_CACHE_TTL = 3600
+
+Complex = namedtuple(
+    "Complex", ["name", "shortcut", "type", "requestable"])
+
+
+class UnrequestableResourceError(ValueError):
+    pass
+
+
+def default_complex_cache_path() -> str:
+    return os.path.join(
+        tempfile.gettempdir(),
+        "sge-complexes-{user}.json".format(user=getpass.getuser()))
+
+
+def parse_complexes(output: str) -> Dict[str, Complex]:
+    """Parse the complex list printed by `qconf -sc`."""
+    complexes = {}
+    for line in output.splitlines():
+        if not line.strip() or line.startswith("#"):
+            continue
+        fields = line.split()
+        if len(fields) < 5:
+            continue
+        name, shortcut, complex_type, _, requestable = fields[:5]
+        complexes[name] = Complex(name, shortcut, complex_type, requestable)
+    return complexes
+
+
+def requestable_names(complexes: Dict[str, Complex]) -> Dict[str, str]:
+    """Map every requestable name and shortcut to its complex name."""
+    names = {}
+    for complex_ in complexes.values():
+        if complex_.requestable.upper() == "NO":
+            continue
+        names[complex_.name] = complex_.name
+        names.setdefault(complex_.shortcut, complex_.name)
+    return names
+
+
+def resource_names(qsub_args: str) -> List[str]:
+    """Names of the resources requested with `-l` in qsub arguments."""
+    names = []
+    args = shlex.split(qsub_args)
+    for flag, value in zip(args, args[1:]):
+        if flag != "-l":
+            continue
+        for request in value.split(","):
+            name = request.partition("=")[0].strip()
+            if name:
+                names.append(name)
+    return names
+
+
+def validate_resources(
+        names: Iterable[str], complexes: Dict[str, Complex]):
+    """Raise UnrequestableResourceError for unknown or fixed resources."""
+    requestable = requestable_names(complexes)
+    errors = []
+    for name in names:
+        if name in requestable:
+            continue
+        if name in complexes:
+            errors.append(f"resource '{name}' is not requestable")
+            continue
+        error = f"unknown resource '{name}'"
+        close = difflib.get_close_matches(name, requestable, n=3)
+        if close:
+            error += ", did you mean {}?".format(
+                " or ".join(f"'{c}'" for c in close))
+        errors.append(error)
+    if errors:
+        raise UnrequestableResourceError("; ".join(errors))
+
+
+class ComplexCache(SnapshotCache):
+    """The `qconf -sc` complex list shared by all submit processes."""
+
+    def __init__(self, path: PathLike = None, ttl: float = COMPLEX_CACHE_TTL):
+        super().__init__(path or default_complex_cache_path(), ttl)
+
+    @property
+    def qconf_cmd(self) -> str:
+        return "qconf -sc"
+
+    def build(self) -> bytes:
+        completed_process = subprocess.run(
+            self.qconf_cmd,
+            check=False, shell=True,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output = completed_process.stdout.decode()
+        if completed_process.returncode != 0 or \
+                not output.startswith("#name"):
+            # remember that the list is not available until the ttl expires
+            return json.dumps(None).encode()
+        complexes = parse_complexes(output)
+        return json.dumps(
+            {name: list(complex_) for name, complex_ in complexes.items()}
+        ).encode()
+
+    def complexes(self) -> Optional[Dict[str, Complex]]:
+        """The complexes of the cluster, None when qconf is not available."""
+        data = json.loads(self.read().decode())
+        if data is None:
+            return None
+        return {name: Complex(*fields) for name, fields in data.items()}
+
+    def validate(self, names: Iterable[str]):
+        complexes = self.complexes()
+        if complexes is None:
+            return
+        validate_resources(names, complexes)
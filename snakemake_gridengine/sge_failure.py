@@ -0,0 +1,56 @@
+from typing import Optional
+
+# failure classes stored in the job ledger
+MEMORY = "memory"
+RUNTIME = "runtime"
+NODE = "node"
+KILLED = "killed"
+ERROR = "error"
+
+# `failed` codes of the accounting record, see man accounting(5)
+FAILED_LIMIT = 37  # qmaster enforced h_rt, h_cpu or h_vmem limit
+FAILED_AFTER_JOB = 100  # ended by a signal, e.g. qdel or a hard limit
+
+# how close to its limit a job has to get to have been stopped by it
+MEMORY_TOLERANCE = 0.95
+RUNTIME_TOLERANCE = 0.99
+
+
+def leading_int(value) -> int:
+    """`100 : assumedly after job` and `0` both as integers."""
+    return int(str(value).split()[0])
+
+
+def classify(
+        failed: int,
+        exit_status: int,
+        maxvmem: float = None,
+        wallclock: float = None,
+        mem_mb: float = None,
+        runtime: int = None) -> Optional[str]:
+    """
+    Classify the outcome of a finished job, None when it succeeded.
+
+    `maxvmem` (bytes) and `wallclock` (seconds) come from the accounting
+    record, `mem_mb` and `runtime` (minutes) are the limits the job was
+    submitted with. Jobs that ran into their memory or runtime limit are
+    told apart from jobs that never started properly on their host, were
+    killed by a signal, or exited with an error of their own.
+    """
+    if failed == 0 and exit_status == 0:
+        return None
+    # mem_mb is in decimal megabytes, as in memory_units
+    if mem_mb and maxvmem is not None \
+            and maxvmem >= mem_mb * 1000 ** 2 * MEMORY_TOLERANCE:
+        return MEMORY
+    if runtime and wallclock is not None \
+            and wallclock >= runtime * 60 * RUNTIME_TOLERANCE:
+        return RUNTIME
+    if failed == FAILED_LIMIT:
+        return RUNTIME if runtime else MEMORY
+    if failed not in (0, FAILED_AFTER_JOB):
+        # the job did not get to run to its end on the execution host
+        return NODE
+    if exit_status > 128:
+        return KILLED
+    return ERROR
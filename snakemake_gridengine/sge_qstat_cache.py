@@ -0,0 +1,121 @@
+import os
+import sys
+import mmap
+import getpass
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from snapshot_cache import SnapshotCache, PathLike, file_lock, atomic_write
+from sge_qstat_xml import query_qstat_xml, qstat_states, qstat_xml_cmd
+
+
+SNAPSHOT_HEADER = "qstat-snapshot {jobid_width} {state_width} {newest}\n"
+
+
+def default_snapshot_path() -> str:
+    return os.path.join(
+        tempfile.gettempdir(),
+        "sge-qstat-{user}.snapshot".format(user=getpass.getuser()))
+
+
+def job_number(jobid) -> int:
+    """The number of a `<jobid>[.<taskid>]`, -1 for anything else."""
+    number = str(jobid).partition(".")[0]
+    return int(number) if number.isdigit() else -1
+
+
+def encode_snapshot(states: Dict[str, str], newest: int = 0) -> bytes:
+    """
+    Encode job states as fixed width records sorted by jobid.
+
+    Job ids are right aligned so the lexical order of the records is the
+    numeric order of the ids and a lookup is a binary search over the file.
+    The header records the newest job number the snapshot covers, the
+    highest listed one or `newest` if that is higher.
+    """
+    jobid_width = max((len(k) for k in states), default=1)
+    state_width = max((len(v) for v in states.values()), default=1)
+    records = sorted(
+        "{jobid:>{jw}} {state:<{sw}}\n".format(
+            jobid=jobid, state=state, jw=jobid_width, sw=state_width)
+        for jobid, state in states.items()
+    )
+    newest = max([newest] + [job_number(jobid) for jobid in states])
+    header = SNAPSHOT_HEADER.format(
+        jobid_width=jobid_width, state_width=state_width, newest=newest)
+    return (header + "".join(records)).encode()
+
+
+def snapshot_newest(data) -> int:
+    """The newest job number a snapshot covers, -1 if it does not say."""
+    fields = data[:data.find(b"\n")].split()
+    return int(fields[3]) if len(fields) > 3 else -1
+
+
+def lookup_snapshot(data, jobid: str) -> Optional[str]:
+    header_end = data.find(b"\n") + 1
+    jobid_width, state_width = data[:header_end].split()[1:3]
+    jobid_width, state_width = int(jobid_width), int(state_width)
+    if len(jobid) > jobid_width:
+        return None
+
+    key = jobid.rjust(jobid_width).encode()
+    record_size = jobid_width + state_width + 2
+    low, high = 0, (len(data) - header_end) // record_size
+    while low < high:
+        middle = (low + high) // 2
+        start = header_end + middle * record_size
+        current = data[start:start + jobid_width]
+        if current < key:
+            low = middle + 1
+        elif current > key:
+            high = middle
+        else:
+            state_start = start + jobid_width + 1
+            return data[state_start:state_start + state_width].decode().strip()
+    return None
+
+
+class QstatSnapshotCache(SnapshotCache):
+    """Shared `qstat -xml` snapshot for all concurrent status processes."""
+
+    def __init__(
+            self, path: PathLike = None, ttl: float = 10, user: str = None):
+        super().__init__(path or default_snapshot_path(), ttl)
+        self._user = user
+        self._newest = 0
+
+    @property
+    def qstat_cmd(self) -> str:
+        return qstat_xml_cmd(self._user)
+
+    def build(self) -> bytes:
+        return encode_snapshot(
+            qstat_states(query_qstat_xml(self._user)), self._newest)
+
+    def _lookup(self, jobid) -> Tuple[Optional[str], bool]:
+        """The state of a job and whether the snapshot predates the job."""
+        with open(self.path, "rb") as infile:
+            if os.fstat(infile.fileno()).st_size == 0:
+                return None, True
+            with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                state = lookup_snapshot(data, str(jobid))
+                return state, job_number(jobid) > snapshot_newest(data)
+
+    def lookup(self, jobid) -> Optional[str]:
+        self.ensure_fresh()
+        state, newer = self._lookup(jobid)
+        if state is not None or not newer:
+            return state
+        # submitted after the snapshot was taken, it would look finished
+        # until the ttl expires
+        with file_lock(self.path):
+            state, newer = self._lookup(jobid)
+            if state is None and newer:
+                # a finished job stays covered and is not asked about again
+                self._newest = job_number(jobid)
+                atomic_write(self.path, self.build())
+                state, _ = self._lookup(jobid)
+        return state
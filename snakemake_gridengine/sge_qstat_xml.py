@@ -0,0 +1,100 @@
+import getpass
+import subprocess
+from collections import namedtuple
+from typing import BinaryIO, Dict, Iterator, Optional
+from xml.etree.ElementTree import iterparse
+
+
+QstatJob = namedtuple(
+    "QstatJob",
+    ["jobid", "taskid", "state", "queue", "slots", "start_time",
+     "submission_time"])
+
+# largest pending task range that is expanded into single tasks
+MAX_EXPANDED_TASKS = 100000
+
+
+def _job_from_element(element) -> QstatJob:
+    fields = {child.tag: (child.text or "").strip() for child in element}
+    slots = fields.get("slots", "")
+    return QstatJob(
+        jobid=fields.get("JB_job_number", ""),
+        taskid=fields.get("tasks") or None,
+        state=fields.get("state", ""),
+        queue=fields.get("queue_name") or None,
+        slots=int(slots) if slots.isdigit() else None,
+        start_time=fields.get("JAT_start_time") or None,
+        submission_time=fields.get("JB_submission_time") or None,
+    )
+
+
+def iter_qstat_xml(stream: BinaryIO) -> Iterator[QstatJob]:
+    """
+    Incrementally parse `qstat -xml` output into QstatJob records.
+
+    Every <job_list> element is dropped from the tree as soon as it has
+    been converted, so memory use does not grow with the number of jobs.
+    """
+    parents = []
+    for event, element in iterparse(stream, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag == "job_list":
+            yield _job_from_element(element)
+            if parents:
+                parents[-1].remove(element)
+
+
+def expand_tasks(taskid: Optional[str]) -> list:
+    """Expand a qstat task range like `1-10:2` or `3,5` into task ids."""
+    if not taskid:
+        return []
+    tasks = []
+    for part in taskid.split(","):
+        bounds, _, step = part.partition(":")
+        first, _, last = bounds.partition("-")
+        if not first.isdigit():
+            continue
+        last = last if last.isdigit() else first
+        step = int(step) if step.isdigit() else 1
+        if (int(last) - int(first)) // step > MAX_EXPANDED_TASKS:
+            continue
+        tasks.extend(str(t) for t in range(int(first), int(last) + 1, step))
+    return tasks
+
+
+def qstat_states(jobs: Iterator[QstatJob]) -> Dict[str, str]:
+    """
+    Map jobids to qstat states.
+
+    Array tasks are additionally stored as `<jobid>.<taskid>`, pending task
+    ranges are expanded.
+    """
+    states = {}
+    for job in jobs:
+        states.setdefault(job.jobid, job.state)
+        for taskid in expand_tasks(job.taskid):
+            states["{}.{}".format(job.jobid, taskid)] = job.state
+    return states
+
+
+def qstat_xml_cmd(user: str = None) -> str:
+    return "qstat -xml -u {}".format(user or getpass.getuser())
+
+
+def query_qstat_xml(user: str = None) -> Iterator[QstatJob]:
+    """Run `qstat -xml -u <user>` and stream its jobs."""
+    process = subprocess.Popen(
+        qstat_xml_cmd(user), shell=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        yield from iter_qstat_xml(process.stdout)
+    finally:
+        process.stdout.close()
+        error = process.stderr.read().decode().strip()
+        process.stderr.close()
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(
+                process.returncode, qstat_xml_cmd(user), stderr=error)
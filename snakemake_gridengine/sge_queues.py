@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import getpass
+import tempfile
+import statistics
+import subprocess
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from snapshot_cache import SnapshotCache, PathLike
+from sge_accounting import QNAME, SUBMISSION_TIME, START_TIME, PE_TASKID, \
+    default_accounting_file, queue_wait
+
+
+# slot counts change with every job, keep the summary short lived
+QUEUE_CACHE_TTL = 30
+# only the end of the accounting file is read for the queue wait times
+WAIT_TAIL_BYTES = 1024 ** 2
+WAIT_WINDOW = 100
+
+QueueSummary = namedtuple(
+    "QueueSummary", ["name", "load", "used", "reserved", "available", "total"])
+
+
+def default_queue_cache_path() -> str:
+    return os.path.join(
+        tempfile.gettempdir(),
+        "sge-queues-{user}.json".format(user=getpass.getuser()))
+
+
+def parse_cluster_queues(output: str) -> Dict[str, QueueSummary]:
+    """Parse the cluster queue summary printed by `qstat -g c`."""
+    queues = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) < 6 or fields[0] == "CLUSTER":
+            continue
+        try:
+            # the load is "-NA-" while no host of the queue reports one
+            load = float(fields[1]) if fields[1] != "-NA-" else None
+            used, reserved, available, total = map(int, fields[2:6])
+        except ValueError:
+            continue
+        queues[fields[0]] = QueueSummary(
+            fields[0], load, used, reserved, available, total)
+    return queues
+
+
+def recent_queue_waits(
+        accounting_file: PathLike,
+        tail_bytes: int = WAIT_TAIL_BYTES,
+        window: int = WAIT_WINDOW) -> Dict[str, float]:
+    """
+    Median seconds from submission to start of the latest jobs per queue.
+
+    Only the last `tail_bytes` of the accounting file are read, which holds
+    the latest few thousand jobs of all users.
+    """
+    waits = {}
+    with open(accounting_file, "rb") as infile:
+        infile.seek(0, os.SEEK_END)
+        size = infile.tell()
+        infile.seek(max(0, size - tail_bytes))
+        if infile.tell() > 0:
+            # drop the partial line at the start of the tail
+            infile.readline()
+        for line in infile:
+            fields = line.decode(errors="replace").split(":")
+            if len(fields) <= PE_TASKID or fields[PE_TASKID] != "NONE":
+                continue
+            try:
+                wait = queue_wait(
+                    int(fields[SUBMISSION_TIME]), int(fields[START_TIME]))
+            except ValueError:
+                continue
+            # jobs deleted before they started
+            if wait is None:
+                continue
+            waits.setdefault(fields[QNAME], []).append(wait)
+    return {
+        queue: statistics.median(values[-window:])
+        for queue, values in waits.items()
+    }
+
+
+def queue_rank(
+        summary: Optional[QueueSummary],
+        wait: Optional[float],
+        slots: int = 1) -> tuple:
+    """Sort key of a candidate queue, lower is better."""
+    if summary is None:
+        return (2, 0, 0, 0)
+    has_room = summary.available >= slots
+    free = summary.available / summary.total if summary.total else 0
+    load = summary.load if summary.load is not None else 1
+    # coarse buckets, so that nearly equal queues are told apart by their
+    # recent wait times
+    return (
+        0 if has_room else 1,
+        -round(free, 1),
+        round(load, 1),
+        wait if wait is not None else float("inf"),
+    )
+
+
+def choose_queue(
+        candidates: List[str],
+        queues: Dict[str, QueueSummary],
+        waits: Dict[str, float] = None,
+        slots: int = 1) -> str:
+    """The least busy of the candidate queues, the first one on a tie."""
+    if waits is None:
+        waits = {}
+    return min(
+        candidates,
+        key=lambda name: queue_rank(queues.get(name), waits.get(name), slots))
+
+
+class QueueCache(SnapshotCache):
+    """The `qstat -g c` summary and recent queue wait times of all queues."""
+
+    def __init__(
+            self,
+            path: PathLike = None,
+            ttl: float = QUEUE_CACHE_TTL,
+            accounting_file: PathLike = None):
+        super().__init__(path or default_queue_cache_path(), ttl)
+        self._accounting_file = accounting_file or default_accounting_file()
+
+    @property
+    def qstat_cmd(self) -> str:
+        return "qstat -g c"
+
+    def _waits(self) -> Dict[str, float]:
+        if not self._accounting_file:
+            return {}
+        try:
+            return recent_queue_waits(self._accounting_file)
+        except OSError:
+            return {}
+
+    def build(self) -> bytes:
+        completed_process = subprocess.run(
+            self.qstat_cmd,
+            check=False, shell=True,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if completed_process.returncode != 0:
+            # the first candidate queue is used until the ttl expires
+            return json.dumps(None).encode()
+        queues = parse_cluster_queues(completed_process.stdout.decode())
+        return json.dumps({
+            "queues": {name: list(queue) for name, queue in queues.items()},
+            "waits": self._waits(),
+        }).encode()
+
+    def summary(self) -> Optional[tuple]:
+        """The queues and their wait times, None when qstat failed."""
+        data = json.loads(self.read().decode())
+        if data is None:
+            return None
+        queues = {
+            name: QueueSummary(*fields)
+            for name, fields in data["queues"].items()
+        }
+        return queues, data["waits"]
+
+    def choose(self, candidates: List[str], slots: int = 1) -> str:
+        summary = self.summary()
+        if summary is None:
+            return candidates[0]
+        queues, waits = summary
+        return choose_queue(candidates, queues, waits, slots)
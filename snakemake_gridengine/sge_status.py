@@ -5,65 +5,156 @@ import shlex
 import sys
 import time
 import logging
+from pathlib import Path
+from typing import Dict, List
+from xml.etree.ElementTree import ParseError
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from uge_utils import load_cluster_config
+from sge_qstat_cache import QstatSnapshotCache
+from sge_accounting import AccountingIndex
 
 logger = logging.getLogger(__name__)
 
 
 STATUS_ATTEMPTS = 20
 
-jobid = int(sys.argv[1])
-job_status = "running"
+cluster_config = load_cluster_config("cluster.yaml")
+qstat_cache = QstatSnapshotCache(
+    path=cluster_config["__default__"].get("qstat_cache_path"),
+    ttl=cluster_config["__default__"].get("qstat_cache_ttl", 10))
+accounting = AccountingIndex.from_cluster_config(cluster_config)
 
 # WARNING this currently has no support for task array jobs
 
-for i in range(STATUS_ATTEMPTS):
-    # first try qstat to see if job is running
-    # we can use `qstat -s pr -u "*"` to check for all running and pending jobs
+
+def qstat_status(state: str) -> str:
+    # job is in an unspecified error state
+    if "E" in state:
+        return "failed"
+    return "running"
+
+
+def accounting_status(jobid, update=True):
+    """
+    The status from the indexed accounting file, None when it cannot be
+    read. A job the up to date index does not know is still running as far
+    as the accounting is concerned, qacct would scan the same file in vain.
+    """
+    if accounting is None:
+        return None
     try:
-        qstat_res = sp.check_output(shlex.split(f"qstat -s pr")).decode().strip()
+        if update:
+            accounting.update()
+        record = accounting.lookup(jobid)
+    except OSError as e:
+        logger.warning("accounting file error")
+        logger.warning(e)
+        return None
+    if record is None:
+        return "running"
+    # a non-zero failed code marks jobs the execd killed or never started
+    if record.failed != 0 or record.exit_status != 0:
+        return "failed"
+    return "success"
 
-        # skip the header using [2:]
-        res = {
-            int(x.split()[0]) : x.split()[4] for x in qstat_res.splitlines()[2:]
-        }
 
-        # job is in an unspecified error state
-        if "E" in res[jobid]:
-            job_status = "failed"
-            break
+def qacct_status(jobid) -> str:
+    qacct_res = sp.check_output(shlex.split(f"qacct -j {jobid}"))
 
-        job_status = "running"
-        break
+    exit_code = int(re.search("exit_status  ([0-9]+)", qacct_res.decode()).group(1))
 
-    except sp.CalledProcessError as e:
-        logger.error("qstat process error")
-        logger.error(e)
-    except KeyError as e:
-        # if the job has finished it won't appear in qstat and we should check qacct
-        # this will also provide the exit status (0 on success, 128 + exit_status on fail)
-        # Try getting job with scontrol instead in case sacct is misconfigured
-        try:
-            qacct_res = sp.check_output(shlex.split(f"qacct -j {jobid}"))
+    if exit_code == 0:
+        return "success"
+    return "failed"
 
-            exit_code = int(re.search("exit_status  ([0-9]+)", qacct_res.decode()).group(1))
 
-            if exit_code == 0:
-                job_status = "success"
-                break
+def job_status(jobid) -> str:
+    job_status = "running"
+    for i in range(STATUS_ATTEMPTS):
+        # first try qstat to see if job is running
+        # `qstat -xml -u <user>` lists all running and pending jobs of the user
+        # the table is shared by all status processes through an on-disk snapshot
+        try:
+            state = qstat_cache.lookup(jobid)
+            if state is None:
+                raise KeyError(jobid)
+            job_status = qstat_status(state)
+            break
 
-            if exit_code != 0:
-                job_status = "failed"
+        except (sp.CalledProcessError, ParseError) as e:
+            logger.error("qstat process error")
+            logger.error(e)
+        except KeyError as e:
+            # if the job has finished it won't appear in qstat and we should check qacct
+            # this will also provide the exit status (0 on success, 128 + exit_status on fail)
+            status = accounting_status(jobid)
+            if status == "running":
+                # not accounted yet, wait for the qmaster to write the record
+                if i >= STATUS_ATTEMPTS - 1:
+                    job_status = "failed"
+                    break
+                time.sleep(5)
+                continue
+            if status is not None:
+                job_status = status
                 break
 
-        except sp.CalledProcessError as e:
-            logger.warning("qacct process error")
-            logger.warning(e)
-            if i >= STATUS_ATTEMPTS - 1:
-                job_status = "failed"
+            try:
+                job_status = qacct_status(jobid)
                 break
+            except sp.CalledProcessError as e:
+                logger.warning("qacct process error")
+                logger.warning(e)
+                if i >= STATUS_ATTEMPTS - 1:
+                    job_status = "failed"
+                    break
+                else:
+                    # qacct can be quite slow to update on large servers
+                    time.sleep(5)
+    return job_status
+
+
+def job_statuses(jobids: List[int]) -> Dict[int, str]:
+    """
+    The status of many jobs from one qstat snapshot and one accounting pass.
+
+    Jobs missing from both are reported as running, the caller polls again;
+    qacct is only asked, once, when the accounting file cannot be read.
+    """
+    statuses = {}
+    missing = []
+    try:
+        for jobid in jobids:
+            state = qstat_cache.lookup(jobid)
+            if state is None:
+                missing.append(jobid)
             else:
-                # qacct can be quite slow to update on large servers
-                time.sleep(5)
-        pass
+                statuses[jobid] = qstat_status(state)
+    except (sp.CalledProcessError, ParseError) as e:
+        logger.error("qstat process error")
+        logger.error(e)
+        return {jobid: job_status(jobid) for jobid in jobids}
+
+    for i, jobid in enumerate(missing):
+        status = accounting_status(jobid, update=i == 0)
+        if status is None:
+            try:
+                status = qacct_status(jobid)
+            except sp.CalledProcessError as e:
+                logger.warning("qacct process error")
+                logger.warning(e)
+                status = "running"
+        statuses[jobid] = status
+    return {jobid: statuses[jobid] for jobid in jobids}
+
 
-print(job_status)
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--batch"]:
+        # jobids as arguments or one per line of stdin
+        lines = sys.argv[2:] or sys.stdin.read().splitlines()
+        jobids = [line.split()[0] for line in lines if line.strip()]
+        for jobid, status in job_statuses([int(j) for j in jobids]).items():
+            print(f"{jobid} {status}")
+    else:
+        print(job_status(int(sys.argv[1])))
@@ -6,6 +6,7 @@ import re
 import math
 import argparse
 import subprocess
+from pathlib import Path
 
 # use warnings.warn() rather than print() to output info in this script
 # because snakemake expects the jobid to be the only output
@@ -14,6 +15,10 @@ import warnings
 from snakemake import io
 from snakemake.utils import read_job_properties
 
+sys.path.append(str(Path(__file__).parent.absolute()))
+from sge_complexes import ComplexCache, UnrequestableResourceError, \
+    COMPLEX_CACHE_TTL
+
 
 DEFAULT_JOB_NAME = "snakemake_job"
 QSUB_DEFAULTS = "-cwd -V -j"
@@ -86,6 +91,27 @@ RESOURCE_MAPPING = {
 }
 
 
+def build_alias_index(mapping):
+    """Invert a canonical key -> aliases mapping, the first mapping wins."""
+    index = {}
+    for key, aliases in mapping.items():
+        for alias in aliases:
+            index.setdefault(alias, key)
+    return index
+
+
+RESOURCE_ALIASES = build_alias_index(RESOURCE_MAPPING)
+OPTION_ALIASES = build_alias_index(OPTION_MAPPING)
+
+
+def alias_index(mapping):
+    if mapping is RESOURCE_MAPPING:
+        return RESOURCE_ALIASES
+    if mapping is OPTION_MAPPING:
+        return OPTION_ALIASES
+    return build_alias_index(mapping)
+
+
 def parse_jobscript(argv=sys.argv[1:]):
     """Minimal CLI to require/only accept single positional argument."""
     p = argparse.ArgumentParser(description="SGE snakemake submit script")
@@ -116,26 +142,21 @@ def parse_qsub_settings(
     if type(source) != dict:
         return job_options
 
+    resource_aliases = alias_index(resource_mapping)
+    option_aliases = alias_index(option_mapping)
     for skey, sval in source.items():
-        found = False
-        for rkey, rval in resource_mapping.items():
-            if skey in rval:
-                found = True
-                # Snakemake resources can only be defined as integers, but SGE interprets
-                # plain integers for memory as bytes. This hack means we interpret memory
-                # requests as gigabytes
-                if (rkey == 's_vmem') or (rkey == 'h_vmem'):
-                    job_options["resources"].update({rkey : str(sval) + 'G'})
-                else:
-                    job_options["resources"].update({rkey : sval})
-                break
-        if found: continue
-        for okey, oval in option_mapping.items():
-            if skey in oval:
-                found = True
-                job_options["options"].update({okey : sval})
-                break
-        if not found:
+        if skey in resource_aliases:
+            rkey = resource_aliases[skey]
+            # Snakemake resources can only be defined as integers, but SGE interprets
+            # plain integers for memory as bytes. This hack means we interpret memory
+            # requests as gigabytes
+            if (rkey == 's_vmem') or (rkey == 'h_vmem'):
+                job_options["resources"].update({rkey : str(sval) + 'G'})
+            else:
+                job_options["resources"].update({rkey : sval})
+        elif skey in option_aliases:
+            job_options["options"].update({option_aliases[skey] : sval})
+        else:
             raise KeyError(f"Unknown SGE option or resource: {skey}")
 
     return job_options
@@ -253,6 +274,17 @@ if __name__ == "__main__":
         qsub_settings,
         parse_qsub_settings(job_properties.get("cluster", {})))
 
+    # fail before qsub on resources the cluster does not know
+    if cluster_config["__default__"].get("validate_complexes", True):
+        try:
+            ComplexCache(
+                cluster_config["__default__"].get("complex_cache_path"),
+                ttl=cluster_config["__default__"].get(
+                    "complex_cache_ttl", COMPLEX_CACHE_TTL),
+            ).validate(qsub_settings["resources"])
+        except UnrequestableResourceError as e:
+            sys.exit(f"Invalid SGE resource request: {e}")
+
     # ensure qsub output dirs exist
     for o in ("o", "e"):
         ensure_directory_exists(qsub_settings["options"][o]) \
@@ -0,0 +1,83 @@
+import os
+import time
+import fcntl
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Union
+
+PathLike = Union[str, Path]
+
+
+@contextmanager
+def file_lock(path: PathLike):
+    """Hold an exclusive fcntl lock on `<path>.lock` for the block."""
+    lock_path = "{}.lock".format(path)
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def atomic_write(path: PathLike, data: bytes):
+    """Write data next to path and rename it into place."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as outfile:
+            outfile.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class SnapshotCache:
+    """
+    On-disk snapshot shared by concurrent processes.
+
+    The first caller that finds the snapshot older than `ttl` seconds
+    rebuilds it under a file lock, everybody else reads the cached copy.
+    Subclasses implement `build()`.
+    """
+
+    def __init__(self, path: PathLike, ttl: float):
+        self._path = Path(path)
+        self._ttl = ttl
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def ttl(self) -> float:
+        return self._ttl
+
+    def age(self) -> float:
+        try:
+            return time.time() - self.path.stat().st_mtime
+        except FileNotFoundError:
+            return float("inf")
+
+    def is_fresh(self) -> bool:
+        return self.age() < self.ttl
+
+    def build(self) -> bytes:
+        raise NotImplementedError
+
+    def ensure_fresh(self):
+        if self.is_fresh():
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.path):
+            # somebody else may have refreshed it while we were waiting
+            if not self.is_fresh():
+                atomic_write(self.path, self.build())
+
+    def read(self) -> bytes:
+        self.ensure_fresh()
+        return self.path.read_bytes()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Coalesce submissions of the same rule into Grid Engine task arrays.
+
+Snakemake submits jobs one at a time and expects a jobid back right away,
+so jobs are not held back: the first job of a resource signature opens a
+batch in the spool directory and starts a detached flusher, every job with
+the same signature that arrives within the window is appended as the next
+task. When the window closes the flusher seals the batch and submits it as
+a single `qsub -t 1-N` whose tasks pick their jobscript from the batch's
+dispatch file by `$SGE_TASK_ID`.
+
+Snakemake gets `<batchid>.<taskid>` as the jobid. The status checker
+resolves it to `<sge jobid>.<taskid>` once the batch has been submitted.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import logging
+import subprocess
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from snapshot_cache import file_lock, atomic_write
+
+
+logger = logging.getLogger(__name__)
+
+PathLike = Union[str, Path]
+
+BATCH_PREFIX = "a"
+
+DISPATCH_SCRIPT = """\
+#!/bin/bash
+# dispatch file: line N holds the jobscript of task N
+jobscript=$(sed -n "${{SGE_TASK_ID}}p" "{tasks}")
+exec "$jobscript"
+"""
+
+
+def is_batch_jobid(jobid) -> bool:
+    return str(jobid).startswith(BATCH_PREFIX)
+
+
+def split_jobid(jobid) -> Tuple[str, Optional[str]]:
+    jobid, _, taskid = str(jobid).partition(".")
+    return jobid, taskid or None
+
+
+def parse_qsub_jobid(output: str) -> int:
+    match = re.search(r"Your job(?:-array)? (\d+)", output)
+    return int(match.group(1))
+
+
+class ArrayCoalescer:
+    # jobids handed to Snakemake start with the prefix, the flusher is
+    # started as `<flusher> flush ...`
+    batch_prefix = BATCH_PREFIX
+    flusher = os.path.abspath(__file__)
+
+    def __init__(
+            self,
+            spool_dir: PathLike,
+            window: float = 5,
+            max_tasks: int = 1000):
+        self._spool_dir = Path(spool_dir).absolute()
+        self._window = window
+        self._max_tasks = max_tasks
+
+    @property
+    def spool_dir(self) -> Path:
+        return self._spool_dir
+
+    @property
+    def window(self) -> float:
+        return self._window
+
+    @property
+    def max_tasks(self) -> int:
+        return self._max_tasks
+
+    def batch_dir(self, batch: str) -> Path:
+        return self.spool_dir / batch
+
+    def _open_batch_file(self, signature: str) -> Path:
+        return self.spool_dir / "{}.open".format(signature)
+
+    @staticmethod
+    def _read_json(path: Path) -> Optional[dict]:
+        try:
+            with open(path) as infile:
+                return json.load(infile)
+        except (OSError, ValueError):
+            return None
+
+    def _new_batch(self, signature: str, qsub: dict) -> dict:
+        batch = "{}{}".format(self.batch_prefix, os.urandom(6).hex())
+        batch_dir = self.batch_dir(batch)
+        batch_dir.mkdir(parents=True)
+        meta = dict(qsub, batch=batch, signature=signature, created=time.time())
+        atomic_write(batch_dir / "meta.json", json.dumps(meta).encode())
+        (batch_dir / "tasks").touch()
+        return meta
+
+    def add(
+            self, signature: str, jobscript: PathLike, qsub: dict,
+            task_meta: dict = None) -> str:
+        """
+        Append a jobscript to the open batch of its signature.
+
+        `qsub` holds the submission parameters shared by the batch: `params`
+        (list of qsub arguments), `jobname` and `logdir`. `task_meta` is
+        stored as `task-<taskid>.json` next to the task's jobscript, with
+        `$JOB_ID` in its strings replaced by the identifier of the job like
+        qsub does for log paths. Returns the `<batchid>.<taskid>` identifier
+        of the job.
+        """
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        open_batch_file = self._open_batch_file(signature)
+        spawn_flusher = False
+        with file_lock(self.spool_dir / signature):
+            meta = self._read_json(open_batch_file)
+            if meta is None:
+                meta = self._new_batch(signature, qsub)
+                atomic_write(open_batch_file, json.dumps(meta).encode())
+                spawn_flusher = True
+
+            batch_dir = self.batch_dir(meta["batch"])
+            tasks = batch_dir / "tasks"
+            with open(tasks) as infile:
+                taskid = sum(1 for _ in infile) + 1
+            task_script = batch_dir / "task-{}.sh".format(taskid)
+            shutil.copyfile(jobscript, task_script)
+            task_script.chmod(0o755)
+            if task_meta is not None:
+                jobid = "{}.{}".format(meta["batch"], taskid)
+                task_meta = {
+                    key: value.replace("$JOB_ID", jobid)
+                    if isinstance(value, str) else value
+                    for key, value in task_meta.items()
+                }
+                atomic_write(
+                    batch_dir / "task-{}.json".format(taskid),
+                    json.dumps(task_meta).encode())
+            with open(tasks, "a") as outfile:
+                outfile.write("{}\n".format(task_script))
+
+            if taskid >= self.max_tasks:
+                # full, the next job of this signature opens a new batch
+                open_batch_file.unlink()
+
+        if spawn_flusher:
+            self._spawn_flusher(signature, meta["batch"])
+        return "{}.{}".format(meta["batch"], taskid)
+
+    def _spawn_flusher(self, signature: str, batch: str):
+        # the flusher must not hold on to our stdout, Snakemake reads it
+        # until EOF to get the jobid
+        subprocess.Popen(
+            [
+                sys.executable, self.flusher, "flush",
+                str(self.spool_dir), signature, batch, str(self.window),
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+    def seal(self, signature: str, batch: str) -> int:
+        """Close the batch for new tasks and return its number of tasks."""
+        open_batch_file = self._open_batch_file(signature)
+        with file_lock(self.spool_dir / signature):
+            meta = self._read_json(open_batch_file)
+            if meta is not None and meta["batch"] == batch:
+                open_batch_file.unlink()
+            with open(self.batch_dir(batch) / "tasks") as infile:
+                return sum(1 for _ in infile)
+
+    def submit_cmd(self, batch: str, ntasks: int) -> str:
+        batch_dir = self.batch_dir(batch)
+        meta = self._read_json(batch_dir / "meta.json")
+        logdir = meta["logdir"]
+        dispatch = batch_dir / "dispatch.sh"
+        # $TASK_ID is expanded by Grid Engine, not by the shell
+        params = [
+            "qsub -cwd -V",
+            "-t 1-{}".format(ntasks),
+            " ".join(meta["params"]),
+            "-o '{}/array.{}.$TASK_ID.out'".format(logdir, batch),
+            "-e '{}/array.{}.$TASK_ID.err'".format(logdir, batch),
+            '-N "{}"'.format(meta["jobname"]),
+            str(dispatch),
+        ]
+        return " ".join(p for p in params if p)
+
+    def write_dispatch(self, batch: str, ntasks: int):
+        batch_dir = self.batch_dir(batch)
+        dispatch = batch_dir / "dispatch.sh"
+        dispatch.write_text(
+            DISPATCH_SCRIPT.format(tasks=batch_dir / "tasks"))
+        dispatch.chmod(0o755)
+
+    def flush(self, signature: str, batch: str) -> Optional[int]:
+        ntasks = self.seal(signature, batch)
+        batch_dir = self.batch_dir(batch)
+        if (batch_dir / "cancelled").exists():
+            atomic_write(batch_dir / "error", b"cancelled before submission")
+            return None
+        self.write_dispatch(batch, ntasks)
+
+        completed_process = subprocess.run(
+            self.submit_cmd(batch, ntasks),
+            check=False, shell=True,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        output = completed_process.stdout.decode().strip()
+        try:
+            assert completed_process.returncode == 0
+            jobid = parse_qsub_jobid(output)
+        except (AssertionError, AttributeError):
+            error = completed_process.stderr.decode().strip() or output
+            logger.error(f"qsub of batch {batch} failed: {error}")
+            atomic_write(batch_dir / "error", error.encode())
+            return None
+
+        atomic_write(batch_dir / "jobid", str(jobid).encode())
+        return jobid
+
+    def cancel(self, batch: str):
+        """Keep a batch that is still in its window from being submitted."""
+        atomic_write(self.batch_dir(batch) / "cancelled", b"")
+
+    def resolve(self, batch: str) -> Tuple[Optional[int], bool]:
+        """
+        Return (sge jobid, failed) of a batch.
+
+        The jobid is None while the batch is still waiting to be submitted.
+        """
+        batch_dir = self.batch_dir(batch)
+        jobid_file = batch_dir / "jobid"
+        if jobid_file.exists():
+            return int(jobid_file.read_text()), False
+        if (batch_dir / "error").exists() or not batch_dir.exists():
+            return None, True
+        return None, False
+
+
+def main(argv=sys.argv[1:], coalescer_class=ArrayCoalescer):
+    command, spool_dir, signature, batch, window = argv
+    assert command == "flush"
+    coalescer = coalescer_class(spool_dir, float(window))
+    time.sleep(coalescer.window)
+    coalescer.flush(signature, batch)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Resource requests sized from the history of a rule.
+
+The status script stores the peak memory (`maxvmem`, `ru_maxrss`) and the
+wallclock time of every finished job in the job ledger. With `autotune_mem`
+enabled the submitter requests the `autotune_mem_percentile` of the peaks
+of the latest `autotune_window` successful jobs of the rule plus
+`autotune_mem_margin`, but never more than the rule asks for. With
+`autotune_runtime` enabled rules without an explicit runtime get an `h_rt`
+limit from the `autotune_runtime_percentile` of their wallclock times.
+With `autotune_by_input_size` the history is split into buckets of similar
+total input size (powers of two).
+
+    uge_autotune.py report
+
+shows the memory and runtime every rule requests next to what would be
+proposed.
+"""
+
+import os
+import sys
+import math
+import argparse
+from pathlib import Path
+from typing import List, Optional
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from memory_units import Memory, Unit
+from uge_ledger import JobLedger, PathLike
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linearly interpolated percentile, `q` between 0 and 100."""
+    values = sorted(values)
+    if not values:
+        raise ValueError("percentile of no values")
+    position = (len(values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def size_bucket(input_size: Optional[int]) -> Optional[int]:
+    if input_size is None:
+        return None
+    return int(math.log2(input_size)) if input_size > 0 else 0
+
+
+def peak_memory(job: dict) -> float:
+    """Peak memory of a finished job in bytes."""
+    # ru_maxrss is reported in kilobytes
+    return max(job["maxvmem"] or 0, (job["maxrss"] or 0) * 1024)
+
+
+class UsageModel:
+    """Rolling percentile model of the resource usage of each rule."""
+
+    def __init__(self, ledger: JobLedger, settings: dict = None,
+                 workdir: PathLike = None):
+        if settings is None:
+            settings = {}
+        self._ledger = ledger
+        self._settings = settings
+        self._workdir = workdir
+
+    def _setting(self, key: str, default):
+        return self._settings.get(key, default)
+
+    @property
+    def window(self) -> int:
+        return self._setting("autotune_window", 50)
+
+    @property
+    def min_samples(self) -> int:
+        return self._setting("autotune_min_samples", 5)
+
+    @property
+    def by_input_size(self) -> bool:
+        return self._setting("autotune_by_input_size", False)
+
+    @property
+    def mem_percentile(self) -> float:
+        return self._setting("autotune_mem_percentile", 95)
+
+    @property
+    def mem_margin(self) -> float:
+        return self._setting("autotune_mem_margin", 0.2)
+
+    @property
+    def runtime_percentile(self) -> float:
+        return self._setting("autotune_runtime_percentile", 99)
+
+    @property
+    def runtime_margin(self) -> float:
+        return self._setting("autotune_runtime_margin", 0.2)
+
+    @property
+    def runtime_min(self) -> int:
+        """Shortest limit in minutes that is ever requested."""
+        return self._setting("autotune_runtime_min", 10)
+
+    def history(self, rule: str, input_size: int = None) -> List[dict]:
+        jobs = self._ledger.usage_history(rule, self._workdir, self.window)
+        if self.by_input_size and input_size is not None:
+            bucket = size_bucket(input_size)
+            similar = [
+                job for job in jobs
+                if size_bucket(job["input_size"]) == bucket
+            ]
+            # fall back to the whole rule until the bucket has enough jobs
+            if len(similar) >= self.min_samples:
+                return similar
+        return jobs
+
+    def mem_mb(self, rule: str, input_size: int = None) -> Optional[int]:
+        """Proposed memory request in MB, None without enough history."""
+        jobs = self.history(rule, input_size)
+        if len(jobs) < self.min_samples:
+            return None
+        peak = percentile(
+            [peak_memory(job) for job in jobs], self.mem_percentile)
+        proposed = Memory(peak * (1 + self.mem_margin), unit=Unit.BYTES)
+        return max(1, math.ceil(proposed.to(Unit.MEGA).value))
+
+    def tune_mem_mb(
+            self, rule: str, requested: float,
+            input_size: int = None) -> float:
+        """The request for the next job, never above what the rule asks."""
+        proposed = self.mem_mb(rule, input_size)
+        if proposed is None:
+            return requested
+        return min(requested, proposed)
+
+    def runtime_minutes(
+            self, rule: str, input_size: int = None) -> Optional[int]:
+        """Proposed `h_rt` in minutes, None without enough history."""
+        jobs = self.history(rule, input_size)
+        if len(jobs) < self.min_samples:
+            return None
+        wallclock = percentile(
+            [job["wallclock"] or 0 for job in jobs], self.runtime_percentile)
+        proposed = math.ceil(wallclock * (1 + self.runtime_margin) / 60)
+        return max(self.runtime_min, proposed)
+
+    def tune_runtime(
+            self, rule: str, requested: Optional[int],
+            input_size: int = None) -> Optional[int]:
+        """The runtime limit in minutes, an explicit one is kept."""
+        if requested:
+            return requested
+        return self.runtime_minutes(rule, input_size)
+
+
+def _or_dash(value) -> str:
+    return "-" if value is None else str(value)
+
+
+def report(model: UsageModel, ledger: JobLedger, workdir: PathLike):
+    print("\t".join([
+        "rule", "jobs", "requested_mb", "peak_mb", "proposed_mb",
+        "requested_min", "longest_min", "proposed_min",
+    ]))
+    for rule in ledger.rules(workdir):
+        jobs = model.history(rule)
+        requested_mb = [job["mem_mb"] for job in jobs if job["mem_mb"]]
+        requested_min = [job["runtime"] for job in jobs if job["runtime"]]
+        peaks = [peak_memory(job) for job in jobs]
+        peak_mb = math.ceil(
+            Memory(max(peaks), unit=Unit.BYTES).to(Unit.MEGA).value) \
+            if peaks else None
+        longest = [job["wallclock"] or 0 for job in jobs]
+        print("\t".join(_or_dash(value) for value in [
+            rule,
+            len(jobs),
+            max(requested_mb) if requested_mb else None,
+            peak_mb,
+            model.mem_mb(rule),
+            max(requested_min) if requested_min else None,
+            math.ceil(max(longest) / 60) if longest else None,
+            model.runtime_minutes(rule),
+        ]))
+
+
+def main(argv=sys.argv[1:]):
+    from uge_utils import load_cluster_config
+
+    p = argparse.ArgumentParser(description="UGE snakemake resource autotuner")
+    p.add_argument("command", choices=["report"])
+    p.add_argument("--ledger", help="ledger file, defaults to cluster.yaml")
+    p.add_argument("--workdir", default=os.getcwd())
+    args = p.parse_args(argv)
+
+    cluster_config = load_cluster_config("cluster.yaml")
+    if args.ledger:
+        ledger = JobLedger(args.ledger)
+    else:
+        ledger = JobLedger.from_cluster_config(cluster_config)
+    if ledger is None or not ledger.path.exists():
+        return
+
+    model = UsageModel(ledger, cluster_config["__default__"], args.workdir)
+    report(model, ledger, args.workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Bundle small jobs into one multi-slot Grid Engine job.
+
+Jobs that run for a few seconds spend more time in the scheduler than on a
+host. With `bundle` enabled, jobs with a runtime of at most
+`bundle_max_runtime` minutes and at most `bundle_max_mem_mb` of memory are
+collected like task arrays (see uge_array): the jobs of one resource
+signature that arrive within `bundle_window` seconds go into one batch, at
+most `bundle_max_jobs` of them. The batch is submitted as a single job with
+`-pe smp k`, `k` being at most `bundle_slots`, whose runner executes the
+jobscripts k at a time:
+
+    uge_bundle.py run <batch dir> <slots>
+
+The runner writes the exit status of every member to `status/<taskid>` in
+the batch directory before it moves on. Snakemake gets `<batchid>.<taskid>`
+as the jobid and the status checker answers from the member's record; a
+member without a record once the bundle job has left the cluster failed.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from snapshot_cache import atomic_write
+from uge_array import ArrayCoalescer, main as flusher_main
+
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_PREFIX = "b"
+
+BUNDLE_SCRIPT = """\
+#!/bin/bash
+exec "{python}" "{runner}" run "{batch_dir}" {slots}
+"""
+
+
+def is_bundle_jobid(jobid) -> bool:
+    return str(jobid).startswith(BUNDLE_PREFIX)
+
+
+class BundleCoalescer(ArrayCoalescer):
+    batch_prefix = BUNDLE_PREFIX
+    flusher = os.path.abspath(__file__)
+
+    def slots(self, batch: str, ntasks: int) -> int:
+        meta = self._read_json(self.batch_dir(batch) / "meta.json")
+        return max(1, min(meta["slots"], ntasks))
+
+    def write_dispatch(self, batch: str, ntasks: int):
+        batch_dir = self.batch_dir(batch)
+        dispatch = batch_dir / "dispatch.sh"
+        dispatch.write_text(BUNDLE_SCRIPT.format(
+            python=sys.executable, runner=os.path.abspath(__file__),
+            batch_dir=batch_dir, slots=self.slots(batch, ntasks)))
+        dispatch.chmod(0o755)
+
+    def submit_cmd(self, batch: str, ntasks: int) -> str:
+        batch_dir = self.batch_dir(batch)
+        meta = self._read_json(batch_dir / "meta.json")
+        slots = self.slots(batch, ntasks)
+        params = [
+            "qsub -cwd -V",
+            "-pe smp {}".format(slots),
+            " ".join(meta["params"]),
+        ]
+        if meta.get("runtime"):
+            # the members run one wave of `slots` jobs after the other
+            runtime = math.ceil(ntasks / slots) * meta["runtime"]
+            params.append("-l h_rt={}:{}:00".format(
+                runtime // 60, runtime % 60))
+        params.extend([
+            "-o '{}/bundle.{}.out'".format(meta["logdir"], batch),
+            "-e '{}/bundle.{}.err'".format(meta["logdir"], batch),
+            '-N "{}"'.format(meta["jobname"]),
+            str(batch_dir / "dispatch.sh"),
+        ])
+        return " ".join(p for p in params if p)
+
+    def member_status(self, batch: str, taskid) -> Optional[dict]:
+        """The exit status record of a member, None until it finished."""
+        return self._read_json(
+            self.batch_dir(batch) / "status" / str(taskid))
+
+
+def run_member(batch_dir: Path, taskid: int, jobscript: str) -> int:
+    try:
+        with open(batch_dir / "task-{}.json".format(taskid)) as infile:
+            logs = json.load(infile)
+    except (OSError, ValueError):
+        logs = {}
+    outlog = logs.get("outlog", os.devnull)
+    errlog = logs.get("errlog", os.devnull)
+    env = dict(os.environ, NSLOTS="1")
+    started = time.time()
+    with open(outlog, "wb") as out:
+        if errlog == outlog:
+            exit_status = subprocess.run(
+                [jobscript], stdout=out, stderr=subprocess.STDOUT,
+                env=env).returncode
+        else:
+            with open(errlog, "wb") as err:
+                exit_status = subprocess.run(
+                    [jobscript], stdout=out, stderr=err, env=env).returncode
+    record = {
+        "exit_status": exit_status, "started": started, "ended": time.time(),
+    }
+    atomic_write(
+        batch_dir / "status" / str(taskid), json.dumps(record).encode())
+    return exit_status
+
+
+def run(batch_dir: Path, slots: int) -> int:
+    """Run the members of a bundle, `slots` at a time."""
+    (batch_dir / "status").mkdir(exist_ok=True)
+    with open(batch_dir / "tasks") as infile:
+        jobscripts = [line.strip() for line in infile if line.strip()]
+    with ThreadPoolExecutor(max_workers=max(1, slots)) as executor:
+        exit_statuses = list(executor.map(
+            lambda task: run_member(batch_dir, *task),
+            enumerate(jobscripts, start=1)))
+    failed = sum(1 for status in exit_statuses if status != 0)
+    logger.info(
+        f"bundle ran {len(exit_statuses)} jobs, {failed} of them failed")
+    # the members are reported one by one, the bundle itself succeeded
+    return 0
+
+
+def main(argv=sys.argv[1:]):
+    if argv[0] == "run":
+        return run(Path(argv[1]), int(argv[2]))
+    return flusher_main(argv, coalescer_class=BundleCoalescer)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
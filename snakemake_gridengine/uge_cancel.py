@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Cancel the jobs of a workflow, the `--cluster-cancel` script of the profile.
+
+Snakemake calls it with the lines printed by the submit script, up to
+`--cluster-cancel-nargs` of them per call, when a workflow is interrupted.
+The jobids are turned into `qdel` arguments: plain jobs as they are, array
+tasks as `<jobid>.<task range>` with neighbouring tasks merged into one
+range, coalesced array tasks and bundled jobs through their batch. Batches
+still waiting in their window are marked so that they are never submitted.
+The arguments go to Grid Engine in bulk `qdel` calls of at most
+`cancel_chunk_size` ids, `cancel_parallel` of them at a time, and a single
+`qstat -xml` afterwards confirms that the jobs are gone or being deleted:
+
+    uge_cancel.py <jobid> [<jobid> ...]
+
+Jobs that are still listed without a deletion state are printed and make
+the script exit with 1.
+"""
+
+import sys
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from uge_array import ArrayCoalescer, is_batch_jobid, split_jobid
+from uge_bundle import BundleCoalescer, is_bundle_jobid
+
+
+logger = logging.getLogger(__name__)
+
+# stays far below the argv limit of any system, whatever the chunk size
+QDEL_MAX_BYTES = 64 * 1024
+
+
+def task_ranges(taskids: Iterable[int]) -> List[str]:
+    """Merge task ids into `first-last` ranges, e.g. 1 2 3 5 to 1-3 5."""
+    ranges = []
+    for taskid in sorted(set(taskids)):
+        if ranges and ranges[-1][1] == taskid - 1:
+            ranges[-1][1] = taskid
+        else:
+            ranges.append([taskid, taskid])
+    return [
+        str(first) if first == last else "{}-{}".format(first, last)
+        for first, last in ranges
+    ]
+
+
+def chunks(targets: List[str], size: int,
+           max_bytes: int = QDEL_MAX_BYTES) -> List[List[str]]:
+    """Split qdel arguments into calls of at most `size` ids."""
+    calls = []
+    length = 0
+    for target in targets:
+        if not calls or len(calls[-1]) >= size or \
+                length + len(target) + 1 > max_bytes:
+            calls.append([])
+            length = 0
+        calls[-1].append(target)
+        length += len(target) + 1
+    return calls
+
+
+class Canceller:
+    def __init__(self, cluster_config: dict):
+        self._defaults = cluster_config["__default__"]
+
+    @property
+    def chunk_size(self) -> int:
+        return self._defaults.get("cancel_chunk_size", 500)
+
+    @property
+    def parallel(self) -> int:
+        return self._defaults.get("cancel_parallel", 4)
+
+    @property
+    def array_spool_dir(self) -> str:
+        return self._defaults.get("array_spool_dir", ".snakemake/uge_arrays")
+
+    @property
+    def bundle_spool_dir(self) -> str:
+        return self._defaults.get(
+            "bundle_spool_dir", ".snakemake/uge_bundles")
+
+    @staticmethod
+    def qdel_cmd(targets: List[str]) -> str:
+        return "qdel {}".format(" ".join(targets))
+
+    def _resolve_batch(
+            self, jobid: str) -> Tuple[Optional[str], Optional[str]]:
+        """The Grid Engine jobid and task of a coalesced job, if submitted."""
+        batch, taskid = split_jobid(jobid)
+        if is_bundle_jobid(batch):
+            coalescer = BundleCoalescer(self.bundle_spool_dir)
+            # the members of a bundle all belong to the interrupted workflow
+            taskid = None
+        else:
+            coalescer = ArrayCoalescer(self.array_spool_dir)
+        sge_jobid, failed = coalescer.resolve(batch)
+        if sge_jobid is None and not failed:
+            coalescer.cancel(batch)
+            # the flusher may have submitted it in the meantime
+            sge_jobid, failed = coalescer.resolve(batch)
+        if sge_jobid is None:
+            return None, None
+        return str(sge_jobid), taskid
+
+    def targets(self, jobids: Iterable[str]) -> Dict[str, Set[int]]:
+        """The tasks to delete by Grid Engine jobid, an empty set for all."""
+        whole_jobs = set()
+        tasks = {}
+        for jobid in jobids:
+            if is_batch_jobid(jobid) or is_bundle_jobid(jobid):
+                sge_jobid, taskid = self._resolve_batch(jobid)
+            else:
+                sge_jobid, taskid = split_jobid(jobid)
+            if sge_jobid is None or not sge_jobid.isdigit():
+                continue
+            if taskid is None:
+                whole_jobs.add(sge_jobid)
+            else:
+                tasks.setdefault(sge_jobid, set()).add(int(taskid))
+        targets = {sge_jobid: set() for sge_jobid in whole_jobs}
+        for sge_jobid, taskids in tasks.items():
+            targets.setdefault(sge_jobid, taskids)
+        return targets
+
+    @staticmethod
+    def qdel_args(targets: Dict[str, Set[int]]) -> List[str]:
+        args = []
+        for sge_jobid, tasks in targets.items():
+            if not tasks:
+                args.append(sge_jobid)
+            else:
+                args.extend(
+                    "{}.{}".format(sge_jobid, task_range)
+                    for task_range in task_ranges(tasks))
+        return args
+
+    def qdel(self, args: List[str]) -> int:
+        completed_process = subprocess.run(
+            self.qdel_cmd(args),
+            check=False, shell=True,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if completed_process.returncode != 0:
+            # jobs that finished in the meantime are reported as missing
+            logger.info(
+                "qdel: %s", completed_process.stderr.decode().strip())
+        return completed_process.returncode
+
+    @staticmethod
+    def remaining(
+            targets: Dict[str, Set[int]],
+            states: Dict[str, str]) -> List[str]:
+        """The targets qstat still lists without a deletion state."""
+        alive = {
+            jobid for jobid, state in states.items() if "d" not in state
+        }
+        alive_jobs = {jobid.partition(".")[0] for jobid in alive}
+        remaining = []
+        for sge_jobid, tasks in targets.items():
+            if not tasks:
+                if sge_jobid in alive_jobs:
+                    remaining.append(sge_jobid)
+                continue
+            remaining.extend(
+                "{}.{}".format(sge_jobid, task) for task in sorted(tasks)
+                if "{}.{}".format(sge_jobid, task) in alive)
+        return remaining
+
+    def cancel(self, jobids: Iterable[str]) -> List[str]:
+        """Delete the jobs, return the ones Grid Engine still runs."""
+        from xml.etree.ElementTree import ParseError
+        from sge_qstat_xml import query_qstat_xml, qstat_states
+
+        targets = self.targets(jobids)
+        if not targets:
+            return []
+        calls = chunks(self.qdel_args(targets), self.chunk_size)
+        with ThreadPoolExecutor(max_workers=max(1, self.parallel)) as executor:
+            list(executor.map(self.qdel, calls))
+        try:
+            states = qstat_states(query_qstat_xml())
+        except (subprocess.CalledProcessError, ParseError) as ex:
+            logger.warning(f"qstat after qdel failed: {ex}")
+            return self.qdel_args(targets)
+        return self.remaining(targets, states)
+
+
+def main(argv=sys.argv[1:]):
+    from uge_utils import load_cluster_config
+
+    # every argument is a `<jobid> <errlog>` line of the submit script
+    jobids = [arg.split()[0] for arg in argv if arg.strip()]
+    canceller = Canceller(load_cluster_config("cluster.yaml"))
+    remaining = canceller.cancel(jobids)
+    if remaining:
+        print("jobs still queued or running: {}".format(" ".join(remaining)),
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
@@ -1,13 +1,13 @@
-from typing import TextIO, Union, List, Any
-
-import yaml
+from typing import TextIO, Union, List, Any, Dict
 
 
 class Config:
-    def __init__(self, data: dict = None):
+    def __init__(self, data: dict = None, params: Dict[str, str] = None):
         if data is None:
             data = dict()
         self._data = data
+        # the qsub parameters per rule, resolved in advance by the snapshot
+        self._params = params or {}
 
     def __bool__(self) -> bool:
         return bool(self._data)
@@ -28,11 +28,15 @@ class Config:
         return self.concatenate_params(self.get("__default__", ""))
 
     def params_for_rule(self, rulename: str) -> str:
+        if self._params:
+            return self._params.get(rulename, self._params["__default__"])
         default_params = self.default_params()
         rule_params = self.concatenate_params(self.get(rulename, ""))
         return self.concatenate_params([default_params, rule_params])
 
     @staticmethod
     def from_stream(stream: TextIO) -> "Config":
+        import yaml
+
         data = yaml.safe_load(stream)
         return Config(data)
@@ -0,0 +1,128 @@
+"""
+Compiled snapshot of the profile configuration.
+
+Every submit and status process needs the cluster config, every submission
+also the qsub parameters of its rule from `uge.yaml`. Instead of parsing
+both YAML files each time, the first process compiles them into a pickle in
+`.snakemake/` of the working directory: the cluster config as a dict and
+the qsub parameter string of every rule in `uge.yaml`, already merged with
+the `__default__` ones. The snapshot records the path, mtime and size of
+both source files and is rebuilt under a file lock by the first process
+that finds one of them changed, a missing `uge.yaml` included.
+"""
+
+import os
+import sys
+import pickle
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from snapshot_cache import file_lock, atomic_write, PathLike
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIR = ".snakemake"
+SNAPSHOT_KEYS = ("cluster_config", "uge_config", "uge_params")
+
+
+def source_key(cluster_config_path: PathLike, uge_config_path: PathLike):
+    key = []
+    for path in (cluster_config_path, uge_config_path):
+        try:
+            stat = os.stat(path)
+            key.append((str(path), stat.st_mtime_ns, stat.st_size))
+        except (OSError, TypeError):
+            key.append((str(path), None, None))
+    return key
+
+
+def snapshot_path(
+        cluster_config_path: PathLike, uge_config_path: PathLike,
+        directory: PathLike = None) -> Path:
+    # one snapshot per pair of sources, so that two profiles used from the
+    # same working directory do not keep replacing each other's snapshot
+    sources = hashlib.sha1("{}\0{}".format(
+        cluster_config_path, uge_config_path or "").encode()).hexdigest()
+    return Path(directory or SNAPSHOT_DIR) / "uge_config.{}.pickle".format(
+        sources[:12])
+
+
+def compile_config(
+        cluster_config_path: PathLike,
+        uge_config_path: Optional[PathLike]) -> dict:
+    """Parse the config files into the contents of a snapshot."""
+    import yaml
+    from uge_config import Config
+
+    with open(cluster_config_path) as stream:
+        cluster_config = yaml.safe_load(stream) or {}
+    uge_data = {}
+    if uge_config_path and os.path.exists(uge_config_path):
+        with open(uge_config_path) as stream:
+            uge_data = yaml.safe_load(stream) or {}
+    uge_config = Config(uge_data)
+    uge_params = {
+        rule: uge_config.params_for_rule(rule) for rule in uge_data
+    }
+    uge_params["__default__"] = uge_config.default_params()
+    return {
+        "cluster_config": cluster_config,
+        "uge_config": uge_data,
+        "uge_params": uge_params,
+    }
+
+
+def _load(path: Path, key) -> Optional[dict]:
+    try:
+        with open(path, "rb") as infile:
+            # only unpickle a snapshot written by ourselves
+            if os.fstat(infile.fileno()).st_uid != os.getuid():
+                return None
+            snapshot = pickle.load(infile)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError,
+            ValueError, ImportError, IndexError, TypeError):
+        # a truncated or foreign file is rebuilt like a stale one
+        return None
+    if not isinstance(snapshot, dict) or \
+            snapshot.get("version") != SNAPSHOT_VERSION or \
+            snapshot.get("key") != key or \
+            not all(name in snapshot for name in SNAPSHOT_KEYS):
+        return None
+    return snapshot
+
+
+def load_compiled_config(
+        cluster_config_path: PathLike,
+        uge_config_path: PathLike = None,
+        directory: PathLike = None) -> dict:
+    """The compiled config, rebuilt first if a source file changed."""
+    # the same files reached through different paths share one snapshot
+    cluster_config_path = os.path.realpath(cluster_config_path)
+    if uge_config_path:
+        uge_config_path = os.path.realpath(uge_config_path)
+    key = source_key(cluster_config_path, uge_config_path)
+    path = snapshot_path(cluster_config_path, uge_config_path, directory)
+    snapshot = _load(path, key)
+    if snapshot is not None:
+        return snapshot
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(path):
+            # somebody else may have rebuilt it while we were waiting
+            snapshot = _load(path, key)
+            if snapshot is None:
+                snapshot = dict(
+                    compile_config(cluster_config_path, uge_config_path),
+                    version=SNAPSHOT_VERSION, key=key)
+                atomic_write(path, pickle.dumps(
+                    snapshot, protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError as ex:
+        # e.g. a read-only working directory, parse the files every time
+        logger.warning(f"writing the config snapshot failed: {ex}")
+        snapshot = compile_config(cluster_config_path, uge_config_path)
+    return snapshot
@@ -0,0 +1,136 @@
+"""
+Read the job properties of a Snakemake jobscript without decoding all of it.
+
+`snakemake.utils.read_job_properties` decodes the whole `# properties =`
+line, which holds the complete `input` and `output` file lists of the job.
+For aggregation rules with many thousand files that is most of the line,
+while the submit script only looks at a handful of small keys. This reader
+walks the top-level keys of the JSON object and decodes only the wanted
+values. Lists of strings, such as the file lists, are stepped over by
+looking for their closing bracket with `str.find`, which builds no Python
+objects; other values, and lists with brackets or escapes in their file
+names, are decoded like the wanted ones. Whatever the reader does not
+understand makes it decode the whole line.
+"""
+
+import re
+import json
+from typing import Iterable, Optional
+
+PROPERTIES_PREFIX = "# properties = "
+
+# the keys the submit script uses, `input` is read separately and only when
+# the input size is needed
+SUBMITTER_KEYS = (
+    "type", "rule", "jobid", "groupid", "threads", "resources", "cluster",
+    "wildcards",
+)
+
+_WHITESPACE = re.compile(r"\s*")
+_STRING = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+_KEY = re.compile(r"\s*(" + _STRING + r")\s*:\s*")
+
+_decoder = json.JSONDecoder()
+
+
+def _skip_string_list(line: str, pos: int) -> Optional[int]:
+    """
+    The position after the list of strings starting at pos, None if it is
+    not a flat list of strings without escapes.
+    """
+    first = _WHITESPACE.match(line, pos + 1).end()
+    if line[first:first + 1] == "]":
+        return first + 1
+    if line[first:first + 1] != '"':
+        return None
+    # without backslashes every quote opens or closes a string, so a bracket
+    # is outside of the strings after an even number of quotes
+    quotes = 0
+    counted = first
+    end = first
+    while True:
+        end = line.find("]", end + 1)
+        if end < 0:
+            return None
+        quotes += line.count('"', counted, end)
+        counted = end
+        if quotes % 2 == 0:
+            break
+    if line.find("\\", first, end) >= 0:
+        return None
+    if line.find("[", first, end) >= 0 or line.find("{", first, end) >= 0:
+        return None
+    return end + 1
+
+
+def _skip_value(line: str, pos: int) -> int:
+    """The position after the JSON value starting at pos."""
+    if line[pos:pos + 1] == "[":
+        end = _skip_string_list(line, pos)
+        if end is not None:
+            return end
+    return _decoder.raw_decode(line, pos)[1]
+
+
+def _parse_keys(line: str, wanted: set) -> Optional[dict]:
+    """The wanted keys, None if the object did not parse to its end."""
+    properties = {}
+    pos = _WHITESPACE.match(line).end()
+    if line[pos:pos + 1] != "{":
+        return None
+    pos = _WHITESPACE.match(line, pos + 1).end()
+    if line[pos:pos + 1] == "}":
+        return properties
+    while wanted:
+        match = _KEY.match(line, pos)
+        if match is None:
+            return None
+        key = json.loads(match.group(1))
+        pos = match.end()
+        if key in wanted:
+            properties[key], pos = _decoder.raw_decode(line, pos)
+            wanted.discard(key)
+        else:
+            pos = _skip_value(line, pos)
+        pos = _WHITESPACE.match(line, pos).end()
+        if line[pos:pos + 1] == "}":
+            return properties
+        if line[pos:pos + 1] != ",":
+            return None
+        pos += 1
+    return properties
+
+
+def parse_properties(line: str, keys: Optional[Iterable[str]] = None) -> dict:
+    """Decode the wanted top-level keys of a JSON object, all without keys."""
+    if keys is None:
+        return json.loads(line)
+    keys = set(keys)
+    try:
+        properties = _parse_keys(line, set(keys))
+    except ValueError:
+        properties = None
+    if properties is None:
+        # anything the lean parser does not understand is decoded in full,
+        # a missing key must never mean a job with default resources
+        properties = json.loads(line)
+        if not isinstance(properties, dict):
+            raise ValueError("job properties are not a JSON object")
+        properties = {
+            key: value for key, value in properties.items() if key in keys
+        }
+    return properties
+
+
+def read_job_properties(jobscript, keys: Optional[Iterable[str]] = None):
+    """
+    The job properties of a jobscript, only `keys` if given.
+
+    Drop-in for `snakemake.utils.read_job_properties` without `keys`.
+    """
+    with open(jobscript) as infile:
+        for line in infile:
+            if line.startswith(PROPERTIES_PREFIX):
+                return parse_properties(
+                    line[len(PROPERTIES_PREFIX):], keys)
+    return None
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+SQLite ledger of the jobs submitted by the profile.
+
+The submitter records every submission, the status checker records the
+terminal state of a job once it is known, so that later status queries of
+that job never reach qstat or qacct again. After a restart the ledger tells
+which jobs of a previous run are still active:
+
+    uge_ledger.py active [--check]
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Union
+
+PathLike = Union[str, Path]
+
+TERMINAL_STATES = ("success", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    jobid TEXT PRIMARY KEY,
+    snakemake_jobid TEXT,
+    rule TEXT,
+    wildcards TEXT,
+    workdir TEXT,
+    outlog TEXT,
+    errlog TEXT,
+    state TEXT,
+    submitted_at REAL,
+    updated_at REAL,
+    mem_mb REAL,
+    input_size INTEGER,
+    maxvmem REAL,
+    maxrss REAL,
+    wallclock REAL,
+    runtime INTEGER,
+    failed INTEGER,
+    exit_status INTEGER,
+    failure TEXT,
+    queue TEXT,
+    queues TEXT,
+    archived INTEGER,
+    trace_id TEXT,
+    log_archive INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_by_rule ON jobs (workdir, rule, state);
+CREATE INDEX IF NOT EXISTS jobs_by_target ON jobs (workdir, rule, wildcards);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state);
+CREATE TABLE IF NOT EXISTS moves (
+    jobid TEXT,
+    rule TEXT,
+    from_queue TEXT,
+    to_queue TEXT,
+    pending REAL,
+    moved_at REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS moves_by_job ON moves (jobid);
+"""
+
+# columns added after the first release, added to older ledgers on open
+ADDED_COLUMNS = [
+    ("mem_mb", "REAL"),
+    ("input_size", "INTEGER"),
+    ("maxvmem", "REAL"),
+    ("maxrss", "REAL"),
+    ("wallclock", "REAL"),
+    ("runtime", "INTEGER"),
+    ("failed", "INTEGER"),
+    ("exit_status", "INTEGER"),
+    ("failure", "TEXT"),
+    ("queue", "TEXT"),
+    ("queues", "TEXT"),
+    ("archived", "INTEGER"),
+    ("trace_id", "TEXT"),
+    ("log_archive", "INTEGER"),
+]
+
+
+def _migrate(connection: sqlite3.Connection):
+    columns = {
+        row[1] for row in connection.execute("PRAGMA table_info(jobs)")}
+    with connection:
+        for name, column_type in ADDED_COLUMNS:
+            if name not in columns:
+                connection.execute(
+                    f"ALTER TABLE jobs ADD COLUMN {name} {column_type}")
+
+
+class JobLedger:
+    def __init__(self, path: PathLike, journal_mode: str = "WAL"):
+        self._path = Path(path)
+        self._journal_mode = journal_mode
+        self._connection = None
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # many short lived submit and status processes write concurrently
+            connection = sqlite3.connect(str(self.path), timeout=30)
+            connection.row_factory = sqlite3.Row
+            # WAL needs shared memory between the processes and fails on
+            # some network filesystems, the default journal is kept then
+            if self._journal_mode:
+                try:
+                    connection.execute(
+                        f"PRAGMA journal_mode={self._journal_mode}")
+                except sqlite3.OperationalError:
+                    pass
+            connection.executescript(SCHEMA)
+            _migrate(connection)
+            self._connection = connection
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @staticmethod
+    def from_cluster_config(cluster_config: dict) -> Optional["JobLedger"]:
+        path = cluster_config["__default__"].get(
+            "ledger_path", ".snakemake/uge_ledger.db")
+        if not path:
+            return None
+        return JobLedger(
+            path, cluster_config["__default__"].get(
+                "ledger_journal_mode", "WAL"))
+
+    def record_submission(
+            self,
+            jobid,
+            snakemake_jobid,
+            rule: str,
+            wildcards: dict,
+            outlog: PathLike,
+            errlog: PathLike,
+            workdir: PathLike = None,
+            mem_mb: float = None,
+            input_size: int = None,
+            runtime: int = None,
+            queue: str = None,
+            queues: List[str] = None,
+            trace_id: str = None,
+            log_archive: bool = False):
+        now = time.time()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO jobs (jobid, snakemake_jobid, rule, "
+                "wildcards, workdir, outlog, errlog, submitted_at, "
+                "updated_at, mem_mb, input_size, runtime, queue, queues, "
+                "trace_id, log_archive) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(jobid), str(snakemake_jobid), rule,
+                    json.dumps(wildcards, sort_keys=True),
+                    str(Path(workdir or os.getcwd()).resolve()),
+                    str(outlog), str(errlog), now, now, mem_mb, input_size,
+                    runtime, queue or None,
+                    json.dumps(queues) if queues else None, trace_id,
+                    int(log_archive),
+                ))
+
+    def record_state(self, jobid, state: str):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE jobid = ?",
+                (state, time.time(), str(jobid)))
+
+    def record_usage(
+            self, jobid, maxvmem: float, maxrss: float, wallclock: float,
+            failed: int = None, exit_status: int = None):
+        """Resource usage of a finished job, from the accounting record."""
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET maxvmem = ?, maxrss = ?, wallclock = ?, "
+                "failed = ?, exit_status = ? WHERE jobid = ?",
+                (maxvmem, maxrss, wallclock, failed, exit_status, str(jobid)))
+
+    def record_failure(self, jobid, failure: Optional[str]):
+        """Failure class of a failed job, see sge_failure."""
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET failure = ? WHERE jobid = ?",
+                (failure, str(jobid)))
+
+    def record_move(
+            self, jobid, rule: str, from_queue: str, to_queue: str,
+            pending: float, error: str = None):
+        """A pending job moved to another queue with qalter, for auditing."""
+        now = time.time()
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO moves (jobid, rule, from_queue, to_queue, "
+                "pending, moved_at, error) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(jobid), rule, from_queue, to_queue, pending, now, error))
+            if error is None:
+                self.connection.execute(
+                    "UPDATE jobs SET queue = ? WHERE jobid = ?",
+                    (to_queue, str(jobid)))
+
+    def moves(self, jobid=None) -> List[dict]:
+        query = "SELECT * FROM moves"
+        params = []
+        if jobid is not None:
+            query += " WHERE jobid = ?"
+            params.append(str(jobid))
+        query += " ORDER BY moved_at"
+        return [dict(row) for row in self.connection.execute(query, params)]
+
+    def unarchived_jobs(
+            self, workdir: PathLike = None, limit: int = 1000) -> List[dict]:
+        """
+        Finished jobs whose logs have not been archived yet, of the jobs
+        submitted with the log archive; the logs of the others are named
+        after the rule and may already belong to a rerun.
+        """
+        query = (
+            "SELECT * FROM jobs WHERE state IN (?, ?) AND archived IS NULL "
+            "AND log_archive = 1")
+        params = list(TERMINAL_STATES)
+        if workdir is not None:
+            query += " AND workdir = ?"
+            params.append(str(Path(workdir).resolve()))
+        query += " ORDER BY updated_at LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self.connection.execute(query, params)]
+
+    def record_archived(self, jobids: List[str]):
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE jobs SET archived = 1 WHERE jobid = ?",
+                [(str(jobid),) for jobid in jobids])
+
+    def get(self, jobid) -> Optional[dict]:
+        row = self.connection.execute(
+            "SELECT * FROM jobs WHERE jobid = ?", (str(jobid),)).fetchone()
+        return dict(row) if row is not None else None
+
+    def terminal_state(self, jobid) -> Optional[str]:
+        job = self.get(jobid)
+        if job is None or job["state"] not in TERMINAL_STATES:
+            return None
+        return job["state"]
+
+    def active_jobs(self, workdir: PathLike = None) -> List[dict]:
+        query = "SELECT * FROM jobs WHERE state IS NULL OR state NOT IN (?, ?)"
+        params = list(TERMINAL_STATES)
+        if workdir is not None:
+            query += " AND workdir = ?"
+            params.append(str(Path(workdir).resolve()))
+        query += " ORDER BY submitted_at"
+        return [dict(row) for row in self.connection.execute(query, params)]
+
+    def find_active(
+            self, rule: str, wildcards: dict,
+            workdir: PathLike = None) -> Optional[dict]:
+        """Latest non-terminal submission of a rule with these wildcards."""
+        row = self.connection.execute(
+            "SELECT * FROM jobs WHERE workdir = ? AND rule = ? "
+            "AND wildcards = ? AND (state IS NULL OR state NOT IN (?, ?)) "
+            "ORDER BY submitted_at DESC LIMIT 1",
+            (
+                str(Path(workdir or os.getcwd()).resolve()), rule,
+                json.dumps(wildcards, sort_keys=True), *TERMINAL_STATES,
+            )).fetchone()
+        return dict(row) if row is not None else None
+
+    def find_latest(
+            self, rule: str, wildcards: dict,
+            workdir: PathLike = None) -> Optional[dict]:
+        """Latest submission of a rule with these wildcards in any state."""
+        row = self.connection.execute(
+            "SELECT * FROM jobs WHERE workdir = ? AND rule = ? "
+            "AND wildcards = ? ORDER BY submitted_at DESC LIMIT 1",
+            (
+                str(Path(workdir or os.getcwd()).resolve()), rule,
+                json.dumps(wildcards, sort_keys=True),
+            )).fetchone()
+        return dict(row) if row is not None else None
+
+    def usage_history(
+            self, rule: str, workdir: PathLike = None,
+            limit: int = 50) -> List[dict]:
+        """Resource usage of the latest successful jobs of a rule."""
+        return [dict(row) for row in self.connection.execute(
+            "SELECT * FROM jobs WHERE workdir = ? AND rule = ? "
+            "AND state = 'success' AND maxvmem IS NOT NULL "
+            "ORDER BY updated_at DESC LIMIT ?",
+            (str(Path(workdir or os.getcwd()).resolve()), rule, limit))]
+
+    def rules(self, workdir: PathLike = None) -> List[str]:
+        return [row[0] for row in self.connection.execute(
+            "SELECT DISTINCT rule FROM jobs WHERE workdir = ? ORDER BY rule",
+            (str(Path(workdir or os.getcwd()).resolve()),))]
+
+
+def is_alive(jobid) -> bool:
+    sge_jobid = str(jobid).partition(".")[0]
+    if not sge_jobid.isdigit():
+        return False
+    completed_process = subprocess.run(
+        f"qstat -j {sge_jobid}",
+        check=False, shell=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    return completed_process.returncode == 0
+
+
+def main(argv=sys.argv[1:]):
+    sys.path.append(str(Path(__file__).parent.absolute()))
+    from uge_utils import load_cluster_config
+
+    p = argparse.ArgumentParser(description="UGE snakemake job ledger")
+    p.add_argument("command", choices=["active"])
+    p.add_argument("--ledger", help="ledger file, defaults to cluster.yaml")
+    p.add_argument(
+        "--workdir", default=os.getcwd(),
+        help="only list jobs submitted from this directory")
+    p.add_argument(
+        "--check", action="store_true",
+        help="only list jobs that qstat still knows about")
+    args = p.parse_args(argv)
+
+    if args.ledger:
+        ledger = JobLedger(args.ledger)
+    else:
+        ledger = JobLedger.from_cluster_config(
+            load_cluster_config("cluster.yaml"))
+    if ledger is None or not ledger.path.exists():
+        return
+
+    for job in ledger.active_jobs(args.workdir):
+        if args.check and not is_alive(job["jobid"]):
+            continue
+        print("\t".join([
+            job["jobid"], job["snakemake_jobid"], job["rule"],
+            job["wildcards"], job["errlog"],
+        ]))
+
+
+if __name__ == "__main__":
+    main()
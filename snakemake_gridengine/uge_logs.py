@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Per-rule archive of the logs of finished jobs.
+
+Every job writes a `.out` and an `.err` file to `<log_dir>/<rule>/`, which
+on a network file system means two inodes and a handful of metadata
+operations per job. With `log_archive: true` the log files of finished jobs
+are appended, gzip compressed, to `<log_dir>/<rule>/archive.gz` and removed.
+`archive.idx` next to it holds the offset and length of every log in the
+archive, so one job's log is read with a single seek. Concatenated gzip
+members are a valid gzip file, `zcat archive.gz` prints all of them.
+
+The status script archives the logs of the jobs it saw finish in batches,
+at most once every `log_archive_interval` seconds. Jobs submitted with the
+archive enabled get log files named after their Grid Engine jobid, so the
+submit script never has to remove the logs of a previous attempt.
+
+    uge_logs.py consolidate
+    uge_logs.py show <jobid | rule | rule/wildcard=value,...> [--stream err]
+"""
+
+import os
+import sys
+import gzip
+import json
+import getpass
+import logging
+import argparse
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from snapshot_cache import SnapshotCache, PathLike, file_lock
+from uge_ledger import JobLedger
+
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_NAME = "archive.gz"
+INDEX_NAME = "archive.idx"
+STREAMS = ("out", "err")
+
+IndexEntry = namedtuple("IndexEntry", ["jobid", "stream", "offset", "length"])
+
+
+def default_consolidate_path() -> str:
+    return os.path.join(
+        tempfile.gettempdir(),
+        "sge-log-archive-{user}.json".format(user=getpass.getuser()))
+
+
+def job_path(job: dict, key: str) -> Path:
+    """A log path of a ledger job, relative ones are in its workdir."""
+    return Path(job["workdir"] or ".") / job[key]
+
+
+class LogArchive:
+    """The append-only log archive of one rule's log directory."""
+
+    def __init__(self, logdir: PathLike):
+        self._logdir = Path(logdir)
+
+    @property
+    def archive_path(self) -> Path:
+        return self._logdir / ARCHIVE_NAME
+
+    @property
+    def index_path(self) -> Path:
+        return self._logdir / INDEX_NAME
+
+    def add(self, jobs: List[dict]) -> List[str]:
+        """
+        Append the logs of finished ledger jobs, return their jobids.
+
+        The log files are removed once they are in the archive. A job whose
+        files are gone, e.g. because it was deleted before it started, is
+        returned all the same so it is not looked at again.
+        """
+        added = []
+        lines = []
+        with file_lock(self.archive_path):
+            with self.archive_path.open("ab") as archive:
+                for job in jobs:
+                    for stream, path in self._logs(job).items():
+                        try:
+                            data = path.read_bytes()
+                        except FileNotFoundError:
+                            continue
+                        member = gzip.compress(data)
+                        lines.append("{}\t{}\t{}\t{}\n".format(
+                            job["jobid"], stream, archive.tell(), len(member)))
+                        archive.write(member)
+                    added.append(job["jobid"])
+                archive.flush()
+                os.fsync(archive.fileno())
+            # the index is written after the data it points to
+            with self.index_path.open("a") as index:
+                index.writelines(lines)
+        for job in jobs:
+            for path in self._logs(job).values():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return added
+
+    @staticmethod
+    def _logs(job: dict) -> Dict[str, Path]:
+        logs = {"out": job_path(job, "outlog")}
+        # Snakemake's default log settings send both streams to one file
+        if job["errlog"] != job["outlog"]:
+            logs["err"] = job_path(job, "errlog")
+        return logs
+
+    def entries(self) -> List[IndexEntry]:
+        try:
+            with self.index_path.open() as index:
+                return [
+                    IndexEntry(jobid, stream, int(offset), int(length))
+                    for jobid, stream, offset, length in
+                    (line.split("\t") for line in index)
+                ]
+        except FileNotFoundError:
+            return []
+
+    def find(self, jobid) -> Dict[str, IndexEntry]:
+        """The archived logs of a job by stream, the last ones on a rerun."""
+        return {
+            entry.stream: entry for entry in self.entries()
+            if entry.jobid == str(jobid)
+        }
+
+    def read(self, entry: IndexEntry) -> bytes:
+        with self.archive_path.open("rb") as archive:
+            archive.seek(entry.offset)
+            return gzip.decompress(archive.read(entry.length))
+
+
+def consolidate(
+        ledger: JobLedger, workdir: PathLike = None,
+        limit: int = 1000) -> int:
+    """Archive the logs of up to `limit` finished jobs, grouped by rule."""
+    jobs = ledger.unarchived_jobs(workdir, limit)
+    by_logdir = {}
+    for job in jobs:
+        by_logdir.setdefault(job_path(job, "outlog").parent, []).append(job)
+    archived = 0
+    for logdir, logdir_jobs in by_logdir.items():
+        if not logdir.is_dir():
+            ledger.record_archived([job["jobid"] for job in logdir_jobs])
+            continue
+        jobids = LogArchive(logdir).add(logdir_jobs)
+        ledger.record_archived(jobids)
+        archived += len(jobids)
+    logger.info(f"archived the logs of {archived} jobs")
+    return archived
+
+
+class ConsolidatePass(SnapshotCache):
+    """
+    Log archiving triggered by the status script.
+
+    Whichever status process finds the last pass older than
+    `log_archive_interval` seconds archives the logs finished since.
+    """
+
+    def __init__(self, ledger: JobLedger, path: PathLike = None,
+                 ttl: float = 300, workdir: PathLike = None):
+        super().__init__(path or default_consolidate_path(), ttl)
+        self._ledger = ledger
+        self._workdir = workdir
+
+    def build(self) -> bytes:
+        return json.dumps(
+            {"archived": consolidate(self._ledger, self._workdir)}).encode()
+
+
+def find_job(ledger: JobLedger, target: str) -> Optional[dict]:
+    """The ledger job of a jobid, a rule or `rule/wildcard=value,...`."""
+    job = ledger.get(target)
+    if job is not None:
+        return job
+    rule, _, wildcards = target.partition("/")
+    wildcards = dict(
+        pair.split("=", 1) for pair in wildcards.split(",") if pair)
+    return ledger.find_latest(rule, wildcards)
+
+
+def show(ledger: JobLedger, target: str, streams=STREAMS) -> Dict[str, bytes]:
+    """The logs of one job by stream, from the archive or the log files."""
+    job = find_job(ledger, target)
+    if job is None:
+        raise KeyError(f"no job {target} in the job ledger")
+    archive = LogArchive(job_path(job, "outlog").parent)
+    entries = archive.find(job["jobid"]) if job["archived"] else {}
+    logs = {}
+    for stream, path in LogArchive._logs(job).items():
+        if stream not in streams:
+            continue
+        if stream in entries:
+            logs[stream] = archive.read(entries[stream])
+        elif path.is_file():
+            logs[stream] = path.read_bytes()
+    return logs
+
+
+def main(argv=sys.argv[1:]):
+    from uge_utils import load_cluster_config
+
+    p = argparse.ArgumentParser(description="UGE snakemake log archive")
+    p.add_argument("command", choices=["consolidate", "show"])
+    p.add_argument("target", nargs="?", help="jobid or rule[/wildcards]")
+    p.add_argument("--ledger", help="ledger file, defaults to cluster.yaml")
+    p.add_argument("--workdir", default=os.getcwd())
+    p.add_argument("--stream", choices=STREAMS)
+    args = p.parse_args(argv)
+
+    if args.ledger:
+        ledger = JobLedger(args.ledger)
+    else:
+        ledger = JobLedger.from_cluster_config(
+            load_cluster_config("cluster.yaml"))
+    if ledger is None or not ledger.path.exists():
+        return 1
+
+    if args.command == "consolidate":
+        print(consolidate(ledger, args.workdir, limit=-1))
+        return 0
+
+    if not args.target:
+        p.error("show needs a jobid or rule")
+    try:
+        logs = show(ledger, args.target, [args.stream] if args.stream
+                    else STREAMS)
+    except KeyError as error:
+        sys.exit(error.args[0])
+    for stream, data in logs.items():
+        if len(logs) > 1:
+            print(f"==> {stream} <==", flush=True)
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
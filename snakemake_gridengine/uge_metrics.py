@@ -0,0 +1,193 @@
+"""
+Profile metrics for the node exporter textfile collector.
+
+With `metrics_textfile` set in the cluster config, the submit and status
+scripts count what they do: submit latency by rule, the latency and
+failures of the qstat, qacct and qsub calls that reach the qmaster, the
+outcome of every status call and how long finished jobs waited in the
+queue, by rule and queue. Each process keeps its samples in memory and
+merges them into the running totals in `<textfile>.json` under a file lock
+when it is done, then rewrites the textfile from the totals in the
+OpenMetrics text format. Both files are replaced atomically, so the many
+short-lived processes of a workflow never lose each other's samples and
+the exporter never reads a partial file.
+"""
+
+import sys
+import json
+import time
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from snapshot_cache import file_lock, atomic_write, PathLike
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUEUE_WAIT_BUCKETS = (10, 30, 60, 300, 900, 1800, 3600, 7200, 21600, 86400)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    "uge_submit_seconds": (
+        "histogram", "Time taken by the submit script per job.",
+        LATENCY_BUCKETS),
+    "uge_command_seconds": (
+        "histogram", "Latency of the Grid Engine commands run by the profile.",
+        LATENCY_BUCKETS),
+    "uge_command_errors": (
+        "counter", "Grid Engine commands that exited with an error.", None),
+    "uge_status_calls": (
+        "counter", "Status calls by outcome, none when they gave up.", None),
+    "uge_queue_wait_seconds": (
+        "histogram", "Time finished jobs waited in the queue.",
+        QUEUE_WAIT_BUCKETS),
+}
+
+
+def _labels_key(labels: Optional[dict]) -> str:
+    return json.dumps(sorted((labels or {}).items()))
+
+
+def _format_labels(pairs) -> str:
+    if not pairs:
+        return ""
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\")
+                         .replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render(totals: dict) -> str:
+    """The OpenMetrics text of the merged totals."""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        samples = totals.get(name)
+        if not samples:
+            continue
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"# HELP {name} {help_text}")
+        for key, value in sorted(samples.items()):
+            pairs = [tuple(pair) for pair in json.loads(key)]
+            if kind == "counter":
+                lines.append("{}_total{} {}".format(
+                    name, _format_labels(pairs), _format_value(value)))
+                continue
+            for bound, count in zip(buckets, value["buckets"]):
+                lines.append("{}_bucket{} {}".format(
+                    name, _format_labels(pairs + [("le", bound)]), count))
+            lines.append("{}_bucket{} {}".format(
+                name, _format_labels(pairs + [("le", "+Inf")]),
+                value["count"]))
+            lines.append("{}_count{} {}".format(
+                name, _format_labels(pairs), value["count"]))
+            lines.append("{}_sum{} {}".format(
+                name, _format_labels(pairs), _format_value(value["sum"])))
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def merge(totals: dict, samples: dict) -> dict:
+    for name, values in samples.items():
+        merged = totals.setdefault(name, {})
+        for key, value in values.items():
+            if not isinstance(value, dict):
+                merged[key] = merged.get(key, 0) + value
+                continue
+            if key not in merged:
+                merged[key] = value
+                continue
+            merged[key]["count"] += value["count"]
+            merged[key]["sum"] += value["sum"]
+            merged[key]["buckets"] = [
+                a + b for a, b in zip(merged[key]["buckets"], value["buckets"])
+            ]
+    return totals
+
+
+class Metrics:
+    """The samples of one process, nothing is kept without a textfile."""
+
+    def __init__(self, textfile: PathLike = None):
+        self._textfile = Path(textfile) if textfile else None
+        self._samples = {}
+
+    @staticmethod
+    def from_cluster_config(cluster_config: dict) -> "Metrics":
+        return Metrics(cluster_config["__default__"].get("metrics_textfile"))
+
+    @property
+    def enabled(self) -> bool:
+        return self._textfile is not None
+
+    @property
+    def textfile(self) -> Optional[Path]:
+        return self._textfile
+
+    @property
+    def totals_path(self) -> Optional[Path]:
+        if self._textfile is None:
+            return None
+        return self._textfile.with_name(self._textfile.name + ".json")
+
+    def inc(self, name: str, labels: dict = None, value: float = 1):
+        if not self.enabled:
+            return
+        samples = self._samples.setdefault(name, {})
+        key = _labels_key(labels)
+        samples[key] = samples.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict = None):
+        if not self.enabled:
+            return
+        buckets = METRICS[name][2]
+        sample = self._samples.setdefault(name, {}).setdefault(
+            _labels_key(labels),
+            {"count": 0, "sum": 0, "buckets": [0] * len(buckets)})
+        sample["count"] += 1
+        sample["sum"] += value
+        # buckets are cumulative
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                sample["buckets"][i] += 1
+
+    @contextmanager
+    def timer(self, name: str, labels: dict = None):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - started, labels)
+
+    def _load_totals(self) -> dict:
+        try:
+            with open(self.totals_path) as infile:
+                return json.load(infile)
+        except (OSError, ValueError):
+            return {}
+
+    def flush(self):
+        """Merge the samples into the totals and rewrite the textfile."""
+        if not self.enabled or not self._samples:
+            return
+        try:
+            self._textfile.parent.mkdir(parents=True, exist_ok=True)
+            with file_lock(self.totals_path):
+                totals = merge(self._load_totals(), self._samples)
+                atomic_write(self.totals_path, json.dumps(totals).encode())
+                atomic_write(self._textfile, render(totals).encode())
+        except OSError as ex:
+            logger.warning(f"writing the metrics textfile failed: {ex}")
+            return
+        self._samples = {}
+
+    def samples(self) -> Dict[str, dict]:
+        return self._samples
@@ -0,0 +1,74 @@
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+
+class PollingPolicy:
+    """
+    Delay between status polls keyed on what the last poll found.
+
+    Every state has a base delay that grows exponentially with the number
+    of consecutive polls in that state, capped at `poll_max_delay` and
+    randomised by `poll_jitter` so that concurrent pollers spread out:
+
+    * accounting_lag -- the job has left qstat but is not in the accounting
+      yet; it is about to be reported so it is polled again quickly
+    * qstat_error -- qstat itself failed; back off hard to spare the qmaster
+    * pending -- nothing is running, so nothing can finish before it starts
+
+    The deprecated `wait_between_tries` is used as the base delay of the
+    retry states when their own `poll_*_delay` is not set.
+    """
+
+    ACCOUNTING_LAG = "accounting_lag"
+    QSTAT_ERROR = "qstat_error"
+    PENDING = "pending"
+
+    DEFAULTS = {
+        ACCOUNTING_LAG: (0.5, 1.5),
+        QSTAT_ERROR: (5, 3.0),
+        PENDING: (30, 2.0),
+    }
+
+    def __init__(self, settings: dict = None, rng: random.Random = None):
+        if settings is None:
+            settings = {}
+        self._settings = settings
+        if "wait_between_tries" in settings:
+            logger.warning(
+                "wait_between_tries is deprecated, use "
+                "poll_accounting_lag_delay and poll_qstat_error_delay instead")
+        self._rng = rng or random.Random()
+
+    def _setting(self, key: str, default):
+        return self._settings.get(key, default)
+
+    @property
+    def max_delay(self) -> float:
+        return self._setting("poll_max_delay", 120)
+
+    @property
+    def max_wait(self) -> float:
+        """Upper bound of the total time one status call may sleep."""
+        return self._setting("poll_max_wait", 120)
+
+    @property
+    def jitter(self) -> float:
+        return self._setting("poll_jitter", 0.2)
+
+    def base_delay(self, state: str) -> float:
+        default = self.DEFAULTS[state][0]
+        if state in (self.ACCOUNTING_LAG, self.QSTAT_ERROR):
+            default = self._setting("wait_between_tries", default)
+        return self._setting(f"poll_{state}_delay", default)
+
+    def backoff(self, state: str) -> float:
+        return self._setting(f"poll_{state}_backoff", self.DEFAULTS[state][1])
+
+    def delay(self, state: str, attempt: int = 0) -> float:
+        delay = self.base_delay(state) * self.backoff(state) ** attempt
+        delay = min(delay, self.max_delay)
+        if self.jitter:
+            delay *= 1 + self._rng.uniform(-self.jitter, self.jitter)
+        return max(delay, 0)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Move long pending jobs to a less busy queue.
+
+Rules that list several candidate queues are submitted to the one that is
+least busy at that moment (see sge_queues). When that queue fills up, a job
+can still wait there long after another candidate has become free. The
+rebalancer looks at the jobs of the ledger that are pending (`qw`) for
+longer than `rebalance_after` seconds, which can be set per rule in the
+cluster config, and moves them with `qalter -q` to a candidate queue that
+ranks better now. The jobid stays the same, so Snakemake does not notice.
+Each job is moved at most `rebalance_max_moves` times and every move is
+recorded in the `moves` table of the ledger:
+
+    uge_rebalance.py run [--loop SECONDS]
+    uge_rebalance.py moves
+
+With `rebalance: true` the sidecar, or without it the status script, runs a
+pass at most every `rebalance_interval` seconds.
+"""
+
+import os
+import sys
+import json
+import time
+import getpass
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from snapshot_cache import SnapshotCache, PathLike
+from sge_queues import QueueCache, choose_queue, queue_rank
+from uge_ledger import JobLedger
+
+
+logger = logging.getLogger(__name__)
+
+PENDING = "qw"
+
+
+def default_rebalance_path() -> str:
+    return os.path.join(
+        tempfile.gettempdir(),
+        "sge-rebalance-{user}.json".format(user=getpass.getuser()))
+
+
+class Rebalancer:
+    def __init__(
+            self,
+            ledger: JobLedger,
+            cluster_config: dict,
+            queue_cache: QueueCache = None,
+            workdir: PathLike = None):
+        self._ledger = ledger
+        self._cluster_config = cluster_config
+        self._defaults = cluster_config["__default__"]
+        self._queue_cache = queue_cache or QueueCache(
+            self._defaults.get("queue_cache_path"),
+            ttl=self._defaults.get("queue_cache_ttl", 30))
+        self._workdir = workdir
+
+    def rebalance_after(self, rule: str) -> float:
+        """Seconds a job of the rule may pend before it is moved."""
+        return self._cluster_config.get(rule, {}).get(
+            "rebalance_after", self._defaults.get("rebalance_after", 900))
+
+    @property
+    def max_moves(self) -> int:
+        return self._defaults.get("rebalance_max_moves", 2)
+
+    @staticmethod
+    def qalter_cmd(jobid, queue: str) -> str:
+        return f"qalter -q {queue} {jobid}"
+
+    def pending_jobs(self, states: Dict[str, str]) -> List[dict]:
+        """Pending jobs with other candidate queues, longest waiting first."""
+        now = time.time()
+        jobs = []
+        for job in self._ledger.active_jobs(self._workdir):
+            # coalesced array tasks share their job with the other tasks
+            if not job["jobid"].isdigit() or not job["queues"]:
+                continue
+            if states.get(job["jobid"]) != PENDING:
+                continue
+            moves = self._ledger.moves(job["jobid"])
+            if len(moves) >= self.max_moves:
+                continue
+            # a moved job starts waiting in its new queue afresh
+            since = max([job["submitted_at"]] + [
+                move["moved_at"] for move in moves])
+            job["pending"] = now - since
+            if job["pending"] >= self.rebalance_after(job["rule"]):
+                jobs.append(job)
+        return sorted(jobs, key=lambda job: -job["pending"])
+
+    def target_queue(self, job: dict, summary) -> Optional[str]:
+        """A better candidate queue for the job, None to leave it."""
+        queues, waits = summary
+        candidates = json.loads(job["queues"])
+        best = choose_queue(candidates, queues, waits)
+        if best == job["queue"]:
+            return None
+        current = queue_rank(queues.get(job["queue"]), waits.get(job["queue"]))
+        if queue_rank(queues.get(best), waits.get(best)) >= current:
+            return None
+        return best
+
+    def move(self, job: dict, queue: str) -> Optional[str]:
+        completed_process = subprocess.run(
+            self.qalter_cmd(job["jobid"], queue),
+            check=False, shell=True,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        error = None
+        if completed_process.returncode != 0:
+            error = completed_process.stderr.decode().strip() or \
+                f"qalter exited with {completed_process.returncode}"
+            logger.warning(
+                f"moving job {job['jobid']} to {queue} failed: {error}")
+        else:
+            logger.info(
+                f"moved job {job['jobid']} of rule {job['rule']} from "
+                f"{job['queue']} to {queue} after {job['pending']:.0f} s")
+        self._ledger.record_move(
+            job["jobid"], job["rule"], job["queue"], queue, job["pending"],
+            error=error)
+        return error
+
+    def run(self, states: Dict[str, str] = None) -> List[dict]:
+        """One pass over the pending jobs, returns the moves made."""
+        if states is None:
+            from sge_qstat_xml import query_qstat_xml, qstat_states
+
+            states = qstat_states(query_qstat_xml())
+        jobs = self.pending_jobs(states)
+        if not jobs:
+            return []
+        summary = self._queue_cache.summary()
+        if summary is None:
+            return []
+        moves = []
+        for job in jobs:
+            queue = self.target_queue(job, summary)
+            if queue is None:
+                continue
+            error = self.move(job, queue)
+            moves.append({
+                "jobid": job["jobid"], "from_queue": job["queue"],
+                "to_queue": queue, "error": error,
+            })
+        return moves
+
+    def run_forever(
+            self, stop_event: threading.Event, interval: float,
+            states=None):
+        """Rebalance every `interval` seconds, `states` returns qstat states."""
+        while not stop_event.wait(interval):
+            try:
+                self.run(states() if states is not None else None)
+            except Exception as ex:
+                logger.warning("unexpected exception in rebalance: %s", ex)
+
+
+class RebalancePass(SnapshotCache):
+    """
+    Rebalancing triggered by the status script.
+
+    The snapshot holds the moves of the last pass, whichever status process
+    finds it older than `rebalance_interval` runs the next one.
+    """
+
+    def __init__(self, rebalancer: Rebalancer, path: PathLike = None,
+                 ttl: float = 300):
+        super().__init__(path or default_rebalance_path(), ttl)
+        self._rebalancer = rebalancer
+
+    def build(self) -> bytes:
+        return json.dumps(self._rebalancer.run()).encode()
+
+
+def main(argv=sys.argv[1:]):
+    from uge_utils import load_cluster_config
+
+    p = argparse.ArgumentParser(description="UGE snakemake queue rebalancer")
+    p.add_argument("command", choices=["run", "moves"])
+    p.add_argument("--ledger", help="ledger file, defaults to cluster.yaml")
+    p.add_argument("--workdir", default=os.getcwd())
+    p.add_argument(
+        "--loop", type=float, metavar="SECONDS",
+        help="keep rebalancing every SECONDS")
+    args = p.parse_args(argv)
+
+    cluster_config = load_cluster_config("cluster.yaml")
+    if args.ledger:
+        ledger = JobLedger(args.ledger)
+    else:
+        ledger = JobLedger.from_cluster_config(cluster_config)
+    if ledger is None or not ledger.path.exists():
+        return
+
+    if args.command == "moves":
+        for move in ledger.moves():
+            print("\t".join(str(move[key]) for key in [
+                "jobid", "rule", "from_queue", "to_queue", "pending",
+                "moved_at", "error",
+            ]))
+        return
+
+    rebalancer = Rebalancer(ledger, cluster_config, workdir=args.workdir)
+    if args.loop:
+        rebalancer.run_forever(threading.Event(), args.loop)
+        return
+    for move in rebalancer.run():
+        print("\t".join(str(value) for value in move.values()))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
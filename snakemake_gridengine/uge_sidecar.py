@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Cluster sidecar for the UGE profile.
+
+Snakemake starts this process once per workflow through `--cluster-sidecar`.
+It polls `qstat -xml -u $USER` once per interval and answers job state queries
+from `uge_status.py` over a Unix socket, so that status checks of running
+jobs do not hit the qmaster at all. With `submit_server` enabled it also
+runs the warm submit server of `uge_submit_server.py`, with `rebalance`
+it moves long pending jobs to less busy queues (see `uge_rebalance.py`).
+
+The first line printed on stdout is passed by Snakemake to the submit and
+status scripts in the SNAKEMAKE_CLUSTER_SIDECAR_VARS environment variable.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import shutil
+import getpass
+import logging
+import tempfile
+import threading
+import subprocess
+import socketserver
+from pathlib import Path
+from xml.etree.ElementTree import ParseError
+from typing import Dict
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from uge_polling import PollingPolicy
+from sge_qstat_xml import query_qstat_xml, qstat_states, qstat_xml_cmd
+
+
+logger = logging.getLogger(__name__)
+
+
+class QstatPoller:
+    def __init__(
+            self,
+            user: str,
+            interval: float,
+            policy: PollingPolicy = None):
+        self._user = user
+        self._interval = interval
+        self._policy = policy or PollingPolicy()
+        self._lock = threading.Lock()
+        self._states = {}
+        self._finished = set()
+        self._updated_at = None
+        self._attempts = {}
+        self._wake = threading.Event()
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    @property
+    def qstat_cmd(self) -> str:
+        return qstat_xml_cmd(self._user)
+
+    def poll(self) -> bool:
+        try:
+            states = qstat_states(query_qstat_xml(self._user))
+        except subprocess.CalledProcessError as error:
+            logger.warning(
+                f"qstat poll exitted with non zero code: {error.stderr}")
+            return False
+        except ParseError as error:
+            logger.warning(f"qstat returned malformed xml: {error}")
+            return False
+        self.update(states)
+        return True
+
+    def update(self, states: Dict[str, str]):
+        with self._lock:
+            self._finished.update(set(self._states) - set(states))
+            self._finished.difference_update(states)
+            self._states = states
+            self._updated_at = time.time()
+
+    def wake(self):
+        self._wake.set()
+
+    def states(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._states)
+
+    def lookup(self, jobid: str) -> dict:
+        with self._lock:
+            if jobid not in self._states and jobid not in self._finished \
+                    and PollingPolicy.QSTAT_ERROR not in self._attempts:
+                # a job submitted since the last poll, stop backing off
+                self._attempts = {}
+                self._wake.set()
+            return {
+                "state": self._states.get(jobid),
+                "finished": jobid in self._finished,
+                "updated_at": self._updated_at,
+            }
+
+    def next_delay(self, succeeded: bool) -> float:
+        if not succeeded:
+            state = PollingPolicy.QSTAT_ERROR
+        elif not any(s[-1:] in "rtR" for s in self._states.values()):
+            # nothing is running, so nothing can finish before the next poll
+            state = PollingPolicy.PENDING
+        else:
+            self._attempts = {}
+            return self.interval
+        attempt = self._attempts.get(state, 0)
+        self._attempts = {state: attempt + 1}
+        return max(self.interval, self._policy.delay(state, attempt))
+
+    def run_forever(self, stop_event: threading.Event):
+        while not stop_event.is_set():
+            started = time.time()
+            try:
+                succeeded = self.poll()
+            except Exception as ex:
+                logger.warning("unexpected exception in qstat poll: %s", ex)
+                succeeded = False
+            self._wake.clear()
+            self._wake.wait(self.next_delay(succeeded))
+            # being woken up never polls more often than the regular interval
+            stop_event.wait(max(0, started + self.interval - time.time()))
+
+
+class _QueryHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        jobid = self.rfile.readline().decode().strip()
+        if not jobid:
+            return
+        reply = self.server.poller.lookup(jobid)
+        self.wfile.write((json.dumps(reply) + "\n").encode())
+
+
+class SidecarServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, poller: QstatPoller):
+        self.poller = poller
+        super().__init__(socket_path, _QueryHandler)
+
+
+def default_socket_path() -> str:
+    """The status socket in a new private (0700) temporary directory."""
+    directory = tempfile.mkdtemp(
+        prefix="uge-sidecar-{user}-".format(user=getpass.getuser()))
+    return os.path.join(directory, "status.sock")
+
+
+def start_submit_server(socket_path: str) -> subprocess.Popen:
+    """Start the warm submit server and wait until it listens."""
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            str(Path(__file__).parent.absolute() / "uge_submit_server.py"),
+            "--socket", socket_path,
+        ],
+        stdout=subprocess.PIPE,
+    )
+    ready = process.stdout.readline()
+    if not ready:
+        raise RuntimeError("submit server failed to start")
+    return process
+
+
+def start_rebalancer(
+        cluster_config: dict, poller: QstatPoller,
+        stop_event: threading.Event):
+    from uge_ledger import JobLedger
+    from uge_rebalance import Rebalancer
+
+    ledger = JobLedger.from_cluster_config(cluster_config)
+    if ledger is None:
+        return
+    rebalancer = Rebalancer(ledger, cluster_config, workdir=os.getcwd())
+    interval = cluster_config["__default__"].get("rebalance_interval", 300)
+    threading.Thread(
+        target=rebalancer.run_forever,
+        args=(stop_event, interval, poller.states), daemon=True).start()
+
+
+def main():
+    from uge_utils import load_cluster_config
+
+    cluster_config = load_cluster_config("cluster.yaml")
+    interval = cluster_config["__default__"].get("sidecar_poll_interval", 10)
+
+    socket_path = default_socket_path()
+    socket_dir = os.path.dirname(socket_path)
+    sidecar_vars = {"status_socket": socket_path}
+
+    submit_server = None
+    if cluster_config["__default__"].get("submit_server", False):
+        # the submit server qsubs whatever it is sent, only the user may
+        # reach it through the private directory
+        submit_socket = os.path.join(socket_dir, "submit.sock")
+        try:
+            submit_server = start_submit_server(submit_socket)
+            sidecar_vars["submit_socket"] = submit_socket
+        except (OSError, RuntimeError) as ex:
+            logger.warning("submit server not started: %s", ex)
+
+    poller = QstatPoller(
+        getpass.getuser(), interval,
+        PollingPolicy(cluster_config["__default__"]))
+    server = SidecarServer(socket_path, poller)
+    stop_event = threading.Event()
+
+    def shutdown(signum, frame):
+        stop_event.set()
+        poller.wake()
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    threading.Thread(
+        target=poller.run_forever, args=(stop_event,), daemon=True).start()
+    if cluster_config["__default__"].get("rebalance", False):
+        start_rebalancer(cluster_config, poller, stop_event)
+
+    print(json.dumps(sidecar_vars), flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if submit_server is not None:
+            submit_server.terminate()
+            submit_server.wait()
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,104 @@
+import os
+import json
+import socket
+import logging
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_VARS_ENV = "SNAKEMAKE_CLUSTER_SIDECAR_VARS"
+
+
+def sidecar_var(name: str, environ=os.environ) -> Optional[str]:
+    sidecar_vars = environ.get(SIDECAR_VARS_ENV)
+    if not sidecar_vars:
+        return None
+    try:
+        return json.loads(sidecar_vars).get(name)
+    except (ValueError, AttributeError):
+        return None
+
+
+class SidecarClient:
+    def __init__(self, socket_path: str, timeout: float = 5.0):
+        self._socket_path = socket_path
+        self._timeout = timeout
+
+    @property
+    def socket_path(self) -> str:
+        return self._socket_path
+
+    @staticmethod
+    def from_environ(environ=os.environ) -> Optional["SidecarClient"]:
+        socket_path = sidecar_var("status_socket", environ)
+        if not socket_path:
+            return None
+        return SidecarClient(socket_path)
+
+    def query(self, jobid) -> Optional[dict]:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self._timeout)
+                sock.connect(self.socket_path)
+                sock.sendall(f"{jobid}\n".encode())
+                with sock.makefile("rb") as stream:
+                    reply = stream.readline()
+        except OSError as ex:
+            logger.debug("sidecar query failed: %s", ex)
+            return None
+        if not reply:
+            return None
+        return json.loads(reply.decode())
+
+
+class SubmitClient:
+    def __init__(self, socket_path: str, timeout: float = 600.0):
+        self._socket_path = socket_path
+        self._timeout = timeout
+
+    @property
+    def socket_path(self) -> str:
+        return self._socket_path
+
+    @staticmethod
+    def from_environ(environ=os.environ) -> Optional["SubmitClient"]:
+        socket_path = sidecar_var("submit_socket", environ)
+        if not socket_path:
+            return None
+        return SubmitClient(socket_path)
+
+    def submit(self, jobscript: str, cluster_cmds: list) -> Optional[dict]:
+        """
+        Forward a jobscript to the submit server.
+
+        Returns None only if the server could not be reached, in which case
+        the caller submits the job itself. Once the request has been sent
+        the job may have been submitted, so later errors are returned as
+        `{"error": ...}` rather than None.
+        """
+        request = {
+            "jobscript": os.path.abspath(jobscript),
+            "cluster_cmds": cluster_cmds,
+            "cwd": os.getcwd(),
+            "env": dict(os.environ),
+        }
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self._timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError as ex:
+                logger.debug("submit server not reachable: %s", ex)
+                return None
+            try:
+                sock.sendall((json.dumps(request) + "\n").encode())
+                with sock.makefile("rb") as stream:
+                    reply = stream.readline()
+            except OSError as ex:
+                return {"error": "submit server failed: {}".format(ex)}
+        finally:
+            sock.close()
+        if not reply:
+            return {"error": "submit server closed the connection"}
+        return json.loads(reply.decode())
@@ -1,18 +1,25 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import time
 import re
 import subprocess
 from pathlib import Path
+from typing import Dict, Iterable, Optional
 import logging
 
 sys.path.append(str(Path(__file__).parent.absolute()))
 from uge_utils import load_cluster_config
+from uge_sidecar_client import SidecarClient
+from uge_polling import PollingPolicy
+from sge_failure import classify, leading_int
 
 
 logger = logging.getLogger(__name__)
 
+QACCT_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
 
 class StatusChecker:
     SUCCESS = "success"
@@ -46,51 +53,138 @@ class StatusChecker:
             jobid: int,
             outlog: str):
         self._jobid = jobid
+        self._submitted_jobid = str(jobid)
         self._outlog = outlog
-        self._cluster_config = load_cluster_config("cluster.yaml")
+        self._cluster_config = None
+        self._ledger = None
+        self._qstat_failed = False
+        self._accounting = None
+        self._accounting_index = None
+        self._accounting_indexed = False
+        self._failure = None
+        self._metrics = None
+        self._tracer = None
 
     @property
     def jobid(self) -> int:
         return self._jobid
 
+    @property
+    def sge_jobid(self) -> str:
+        return str(self.jobid).partition(".")[0]
+
+    @property
+    def taskid(self) -> Optional[str]:
+        return str(self.jobid).partition(".")[2] or None
+
     @property
     def outlog(self) -> str:
         return self._outlog
 
+    @property
+    def cluster_config(self) -> dict:
+        # most status calls are answered by the sidecar, so the cluster
+        # config is only parsed once it is needed
+        if self._cluster_config is None:
+            self._cluster_config = load_cluster_config("cluster.yaml")
+        return self._cluster_config
+
     @property
     def max_status_checks(self) -> int:
-        return self._cluster_config["__default__"]\
+        return self.cluster_config["__default__"]\
             .get("max_status_checks", 30)
 
     @property
-    def wait_between_tries(self) -> float:
-        return self._cluster_config["__default__"]\
-            .get("wait_between_tries", 1)
+    def ledger(self):
+        if self._ledger is None:
+            # sqlite is only needed once the sidecar could not answer
+            from uge_ledger import JobLedger
+
+            self._ledger = JobLedger.from_cluster_config(self.cluster_config)
+        return self._ledger
+
+    @property
+    def metrics(self):
+        if self._metrics is None:
+            from uge_metrics import Metrics
+
+            self._metrics = Metrics.from_cluster_config(self.cluster_config)
+        return self._metrics
+
+    @property
+    def tracer(self):
+        if self._tracer is None:
+            from uge_trace import Tracer
+
+            self._tracer = Tracer.from_environ(jobid=self._submitted_jobid)
+            if self._tracer.enabled:
+                self._tracer.trace_id = self._trace_id()
+        return self._tracer
+
+    def _trace_id(self) -> Optional[str]:
+        from sqlite3 import Error
+
+        try:
+            job = self.ledger.get(self._submitted_jobid) if self.ledger \
+                else None
+        except Error as ex:
+            logger.warning(f"job ledger lookup failed: {ex}")
+            return None
+        return job["trace_id"] if job is not None else None
+
+    @property
+    def polling_policy(self) -> PollingPolicy:
+        return PollingPolicy(self.cluster_config["__default__"])
+
+    @property
+    def array_spool_dir(self) -> str:
+        return self.cluster_config["__default__"]\
+            .get("array_spool_dir", ".snakemake/uge_arrays")
+
+    @property
+    def bundle_spool_dir(self) -> str:
+        return self.cluster_config["__default__"]\
+            .get("bundle_spool_dir", ".snakemake/uge_bundles")
 
     @property
     def qstat_query_cmd(self) -> str:
-        return f"qstat -j {self.jobid}"
+        return f"qstat -j {self.sge_jobid}"
 
     @property
     def qacct_query_cmd(self) -> str:
-        return f"qacct -j {self.jobid}"
+        if self.taskid:
+            return f"qacct -j {self.sge_jobid} -t {self.taskid}"
+        return f"qacct -j {self.sge_jobid}"
 
     @property
     def qdel_cmd(self) -> str:
-        return f"qdel -j {self.jobid}"
+        return f"qdel {self.jobid}"
+
+    def _query_sidecar(self) -> Optional[dict]:
+        client = SidecarClient.from_environ()
+        if client is None:
+            return None
+        return client.query(self.jobid)
 
     def _query_status_using_qstat(self) -> str:
-        completed_process = subprocess.run(
-            self.qstat_query_cmd,
-            check=False, shell=True,
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
+        with self.metrics.timer("uge_command_seconds", {"command": "qstat"}), \
+                self.tracer.span("status.qstat"):
+            completed_process = subprocess.run(
+                self.qstat_query_cmd,
+                check=False, shell=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
 
         if completed_process.returncode != 0:
             error = completed_process.stderr.decode().strip()
+            # a finished job is simply gone, anything else is a qstat failure
+            self._qstat_failed = "do not exist" not in error
+            if self._qstat_failed:
+                self.metrics.inc("uge_command_errors", {"command": "qstat"})
             logger.warning(
                 f"qstat for {self.jobid} exitted with non zero code: {error}")
             return None
+        self._qstat_failed = False
 
         if not completed_process.stdout:
             logger.warning(
@@ -98,24 +192,92 @@ class StatusChecker:
             return None
 
         output = completed_process.stdout.decode().strip()
-        status = self._qstat_job_state(output)
+        status = self._qstat_job_state(output, self.taskid)
         logger.debug("qstat job state: %s", status)
 
+        if self.taskid and not status:
+            # only running tasks have a job_state line, the task is either
+            # still pending or already finished
+            state = self._qstat_task_state()
+            if state:
+                return self.STATUS_TABLE.get(state[-2:].strip(), self.RUNNING)
+            status = self._query_status_using_qacct()
+            return status if status is not None else self.RUNNING
+
         if status not in self.STATUS_TABLE.keys():
             logger.warning(
                 f"qstat unknown job status '{status}' for {self.jobid}")
             return None
         return self.STATUS_TABLE[status]
 
+    def _qstat_task_state(self) -> Optional[str]:
+        """
+        The state of an array task from the shared `qstat -xml` snapshot,
+        which lists pending tasks by their ranges; None once it is gone.
+        """
+        from xml.etree.ElementTree import ParseError
+        from sge_qstat_cache import QstatSnapshotCache
+
+        defaults = self.cluster_config["__default__"]
+        cache = QstatSnapshotCache(
+            defaults.get("qstat_cache_path"),
+            ttl=defaults.get("qstat_cache_ttl", 10))
+        try:
+            return cache.lookup(self.jobid)
+        except (subprocess.CalledProcessError, ParseError, OSError) as ex:
+            logger.warning(f"qstat of all jobs failed: {ex}")
+            # qstat -j has just listed the job, assume the task still waits
+            return "qw"
+
+    def _query_status_using_accounting(self) -> Optional[str]:
+        from sge_accounting import AccountingIndex
+
+        try:
+            accounting = self._accounting_index
+            if accounting is None:
+                accounting = AccountingIndex.from_cluster_config(
+                    self.cluster_config)
+            if accounting is None:
+                return None
+            record = accounting.lookup(self.sge_jobid, self.taskid)
+        except OSError as ex:
+            logger.warning(f"reading the accounting file failed: {ex}")
+            return None
+        # the index is up to date, a missing record is accounting lag that
+        # qacct, scanning the same file, would not see past either
+        self._accounting_indexed = True
+
+        if record is None:
+            return None
+        if record.wait is not None:
+            self._observe_queue_wait(record.qname, record.wait)
+        self._accounting = {
+            "failed": record.failed,
+            "exit_status": record.exit_status,
+            "maxvmem": record.maxvmem,
+            "maxrss": record.maxrss,
+            "wallclock": record.wallclock,
+        }
+        if record.failed == 0 and record.exit_status == 0:
+            return self.SUCCESS
+        return self.FAILED
+
     def _query_status_using_qacct(self) -> str:
-        completed_process = subprocess.run(
-            self.qacct_query_cmd,
-            check=False, shell=True,
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
+        status = self._query_status_using_accounting()
+        if status is not None or self._accounting_indexed:
+            return status
+
+        with self.metrics.timer("uge_command_seconds", {"command": "qacct"}), \
+                self.tracer.span("status.qacct"):
+            completed_process = subprocess.run(
+                self.qacct_query_cmd,
+                check=False, shell=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
 
         if completed_process.returncode != 0:
             error = completed_process.stderr.decode().strip()
+            self.metrics.inc("uge_command_errors", {"command": "qacct"})
             logger.warning(
                     f"qacct failed on job {self.jobid} with: {error}")
             return None
@@ -125,6 +287,7 @@ class StatusChecker:
                 f"qacct failed on job {self.jobid} with empty output")
             return None
         output = completed_process.stdout.decode().strip()
+        self._accounting = self._qacct_usage(output)
         status = self._qacct_job_state(output)
         if status not in self.STATUS_TABLE.keys():
             logger.warning(
@@ -133,43 +296,438 @@ class StatusChecker:
         return self.STATUS_TABLE[status]
 
     @staticmethod
-    def _qstat_job_state(output) -> str:
+    def _qstat_job_state(output, taskid=None) -> str:
         state = ""
         for line in output.split("\n"):
-            if line.startswith("job_state"):
+            if not line.startswith("job_state"):
+                continue
+            if taskid is not None:
+                # array jobs list one `job_state <taskid>: <state>` per task
+                match = re.match(rf"job_state\s+{taskid}:\s+(\S+)", line)
+                if not match:
+                    continue
+                state = match.group(1)[-2:]
+            else:
                 state = line.strip()[-2:].strip()
-                break  # exit for loop
+            break  # exit for loop
         return state
 
     @staticmethod
-    def _qacct_job_state(output_stream) -> str:
-        exit_state = ""
-        failed = ""
-
+    def _qacct_fields(output_stream) -> dict:
+        """Fields of the last record printed by qacct."""
+        fields = {}
         for line in output_stream.split("\n"):
-            if line.startswith("failed"):
-                failed = line.strip()[-1]
-            if line.startswith("exit_status"):
-                exit_state = line.strip()[-1]
-            if failed != "" and exit_state != "":
-                break
-        if failed == "0" and exit_state == "0":
+            if line.startswith("====="):
+                # a rerun job has one record per run, the last one counts
+                fields = {}
+                continue
+            key, _, value = line.partition(" ")
+            if key:
+                fields[key] = value.strip()
+        return fields
+
+    @staticmethod
+    def _qacct_job_state(output_stream) -> str:
+        fields = StatusChecker._qacct_fields(output_stream)
+        try:
+            failed = leading_int(fields["failed"])
+            exit_status = leading_int(fields["exit_status"])
+        except (KeyError, IndexError, ValueError):
+            return "FAIL"
+        if failed == 0 and exit_status == 0:
             return "SUCCESS"
         else:
             return "FAIL"
 
-    def get_status(self) -> str:
-        status = None
-        for _ in range(self.max_status_checks):
-            try:
-                status = self._query_status_using_qstat()
-                if status is not None:
-                    return status
+    @staticmethod
+    def _qacct_usage(output_stream) -> Optional[dict]:
+        fields = StatusChecker._qacct_fields(output_stream)
+        try:
+            # qacct prints maxvmem with a binary unit suffix, e.g. 17.488M
+            maxvmem = fields["maxvmem"]
+            scale = 1
+            if maxvmem[-1:] in QACCT_UNITS:
+                scale = QACCT_UNITS[maxvmem[-1]]
+                maxvmem = maxvmem[:-1]
+            return {
+                "failed": leading_int(fields["failed"]),
+                "exit_status": leading_int(fields["exit_status"]),
+                "maxvmem": float(maxvmem) * scale,
+                "maxrss": float(fields.get("ru_maxrss", 0)),
+                "wallclock": float(fields.get("ru_wallclock", 0)),
+            }
+        except (KeyError, IndexError, ValueError):
+            return None
+
+    def _observe_queue_wait(self, queue: str, wait: float):
+        from sqlite3 import Error
+
+        if not self.metrics.enabled:
+            return
+        rule = "unknown"
+        try:
+            job = self.ledger.get(self._submitted_jobid) if self.ledger \
+                else None
+            if job is not None:
+                rule = job["rule"]
+        except Error as ex:
+            logger.warning(f"job ledger lookup failed: {ex}")
+        self.metrics.observe(
+            "uge_queue_wait_seconds", wait, {"rule": rule, "queue": queue})
+
+    def _resolve_array_jobid(self) -> Optional[str]:
+        from uge_array import ArrayCoalescer
+
+        batch, taskid = self.sge_jobid, self.taskid
+        coalescer = ArrayCoalescer(self.array_spool_dir)
+        sge_jobid, failed = coalescer.resolve(batch)
+        if failed:
+            logger.warning(f"task array {batch} could not be submitted")
+            return self.FAILED
+        if sge_jobid is None:
+            # still waiting in the coalescing window
+            return self.RUNNING
+        self._jobid = f"{sge_jobid}.{taskid}"
+        return None
+
+    def _is_active(self, sge_jobid) -> bool:
+        """Whether Grid Engine still knows a job, True when unsure."""
+        client = SidecarClient.from_environ()
+        if client is not None:
+            reply = client.query(str(sge_jobid))
+            if reply is not None and (reply.get("state") or
+                                      reply.get("finished")):
+                return bool(reply.get("state"))
+        completed_process = subprocess.run(
+            f"qstat -j {sge_jobid}",
+            check=False, shell=True,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        if completed_process.returncode == 0:
+            return True
+        return "do not exist" not in completed_process.stderr.decode()
+
+    def _get_bundle_member_status(self) -> str:
+        from uge_bundle import BundleCoalescer
+
+        status = self._query_status_using_ledger()
+        if status is not None:
+            return status
+        bundler = BundleCoalescer(self.bundle_spool_dir)
+        batch, taskid = self.sge_jobid, self.taskid
+        record = bundler.member_status(batch, taskid)
+        if record is None:
+            sge_jobid, failed = bundler.resolve(batch)
+            if failed:
+                logger.warning(f"bundle {batch} could not be submitted")
+            elif sge_jobid is None or self._is_active(sge_jobid):
+                return self.RUNNING
+            else:
+                # the runner records every member before the bundle job ends
+                record = bundler.member_status(batch, taskid)
+        status = self.FAILED
+        if record is not None and record["exit_status"] == 0:
+            status = self.SUCCESS
+        self._record_status_in_ledger(status)
+        if status == self.FAILED:
+            self._report_failure()
+        return status
+
+    def _query_status_using_ledger(self) -> Optional[str]:
+        from sqlite3 import Error
 
-                status = self._query_status_using_qacct()
+        try:
+            if self.ledger is None:
+                return None
+            return self.ledger.terminal_state(self._submitted_jobid)
+        except Error as ex:
+            logger.warning(f"job ledger lookup failed: {ex}")
+            return None
+
+    def _record_usage_in_ledger(self, status: str):
+        accounting = self._accounting
+        self.ledger.record_usage(self._submitted_jobid, **accounting)
+        if status != self.FAILED:
+            return
+        job = self.ledger.get(self._submitted_jobid)
+        if job is None:
+            return
+        failure = classify(
+            accounting["failed"], accounting["exit_status"],
+            maxvmem=accounting["maxvmem"], wallclock=accounting["wallclock"],
+            mem_mb=job["mem_mb"], runtime=job["runtime"])
+        logger.info(f"job {self.jobid} failed, classified as {failure}")
+        self.ledger.record_failure(self._submitted_jobid, failure)
+        self._failure = failure
+
+    def _record_status_in_ledger(self, status: str):
+        from sqlite3 import Error
+
+        try:
+            if self.ledger is not None:
+                self.ledger.record_state(self._submitted_jobid, status)
+                if self._accounting is not None:
+                    self._record_usage_in_ledger(status)
+        except Error as ex:
+            logger.warning(f"recording {status} in the job ledger failed: {ex}")
+
+    def get_status(self, retry: bool = True) -> Optional[str]:
+        """
+        The status of the job, None when the cluster did not tell. Without
+        retry the cluster is asked once, without polling.
+        """
+        with self.tracer.span("status") as span:
+            span["status"] = self._get_status(retry)
+        return span["status"]
+
+    def _get_status(self, retry: bool = True) -> Optional[str]:
+        if not self.sge_jobid.isdigit():
+            from uge_bundle import is_bundle_jobid
+
+            if is_bundle_jobid(self.sge_jobid):
+                return self._get_bundle_member_status()
+            status = self._resolve_array_jobid()
+            if status is not None:
+                return status
+
+        queries = [
+            self._query_status_using_qstat,
+            self._query_status_using_qacct,
+        ]
+
+        reply = self._query_sidecar()
+        if reply is not None:
+            state = reply.get("state")
+            if state:
+                status = self.STATUS_TABLE.get(state[-2:].strip())
                 if status is not None:
                     return status
-                time.sleep(self.wait_between_tries)
+            elif reply.get("finished"):
+                # the sidecar saw the job leave qstat, go straight to qacct
+                queries = [self._query_status_using_qacct]
+
+        # terminal states are final, no need to ask the cluster again
+        status = self._query_status_using_ledger()
+        if status is not None:
+            return status
+
+        status = self._settle(self._poll_status(queries, retry))
+        self.metrics.flush()
+        return status
+
+    def _settle(self, status: Optional[str]) -> Optional[str]:
+        """Bookkeeping once the cluster has answered for the job."""
+        self.metrics.inc("uge_status_calls", {"status": status or "none"})
+        if status in (self.SUCCESS, self.FAILED):
+            self._record_status_in_ledger(status)
+            if status == self.FAILED:
+                self._report_failure()
+            self._consolidate_logs()
+        elif status == self.RUNNING:
+            self._rebalance()
+        return status
+
+    @classmethod
+    def get_statuses(
+            cls, jobids: Iterable[str],
+            cluster_config: dict = None) -> Dict[str, str]:
+        """
+        The status of many jobs at once.
+
+        One `qstat -xml` covers all jobs and one pass over the accounting
+        index the ones that have left qstat; jobs missing from both are
+        reported as running, `qacct` is only asked, once, when there is no
+        accounting file to index. Nothing is retried, callers poll again.
+        """
+        from sge_accounting import AccountingIndex
+
+        if cluster_config is None:
+            cluster_config = load_cluster_config("cluster.yaml")
+        checkers = {}
+        statuses = {}
+        ledger = None
+        metrics = None
+        for jobid in jobids:
+            checker = cls(jobid, "")
+            checker._cluster_config = cluster_config
+            if ledger is not None:
+                checker._ledger = ledger
+            checker._metrics = metrics
+            ledger = checker.ledger
+            metrics = checker.metrics
+            checkers[jobid] = checker
+            if not checker.sge_jobid.isdigit():
+                # bundle members and coalesced array tasks
+                statuses[jobid] = checker.get_status(retry=False) or \
+                    cls.RUNNING
+                continue
+            status = checker._query_status_using_ledger()
+            if status is not None:
+                statuses[jobid] = status
+
+        pending = [jobid for jobid in checkers if jobid not in statuses]
+        if not pending:
+            return statuses
+        with metrics.timer("uge_command_seconds", {"command": "qstat -xml"}):
+            states = cls._qstat_states()
+        if states is None:
+            metrics.inc("uge_command_errors", {"command": "qstat -xml"})
+        accounting = None
+        for jobid in pending:
+            checker = checkers[jobid]
+            if states is None:
+                # qstat failed, one checker at a time, each asked once
+                statuses[jobid] = checker.get_status(retry=False) or \
+                    cls.RUNNING
+                continue
+            state = states.get(str(checker.jobid))
+            if state is not None:
+                statuses[jobid] = checker._settle(
+                    cls.STATUS_TABLE.get(state[-2:].strip(), cls.RUNNING))
+                continue
+            if accounting is None:
+                try:
+                    accounting = AccountingIndex.from_cluster_config(
+                        cluster_config) or False
+                    if accounting:
+                        accounting.update()
+                except OSError as ex:
+                    logger.warning(f"reading the accounting file failed: {ex}")
+                    accounting = False
+            checker._accounting_index = accounting or None
+            status = checker._query_status_using_qacct()
+            statuses[jobid] = checker._settle(status or cls.RUNNING)
+        metrics.flush()
+        return statuses
+
+    @staticmethod
+    def _qstat_states() -> Optional[Dict[str, str]]:
+        from xml.etree.ElementTree import ParseError
+        from sge_qstat_xml import query_qstat_xml, qstat_states
+
+        try:
+            return qstat_states(query_qstat_xml())
+        except (subprocess.CalledProcessError, ParseError) as ex:
+            logger.warning(f"qstat of all jobs failed: {ex}")
+            return None
+
+    def _job_logs(self) -> dict:
+        """The log files of the job by stream, from the ledger if it can."""
+        from sqlite3 import Error
+
+        job = None
+        try:
+            if self.ledger is not None:
+                job = self.ledger.get(self._submitted_jobid)
+        except Error as ex:
+            logger.warning(f"job ledger lookup failed: {ex}")
+        if job is None:
+            # the submit script passes the error log to the status script
+            return {"err": self.outlog} if self.outlog else {}
+        logs = {"err": job["errlog"]}
+        if job["outlog"] != job["errlog"]:
+            logs["out"] = job["outlog"]
+        return logs
+
+    def failure_report(self, num_lines: int = 20) -> str:
+        """Accounting fields and the end of the logs of a failed job."""
+        from OSLayer import OSLayer, TailError
+
+        lines = [f"job {self.jobid} failed"]
+        if self._failure is not None:
+            lines[0] += f", classified as {self._failure}"
+        accounting = self._accounting
+        if accounting is not None:
+            lines.append(
+                "failed {failed}  exit_status {exit_status}  "
+                "maxvmem {maxvmem:.0f} MB  wallclock {wallclock:.0f} s".format(
+                    failed=accounting["failed"],
+                    exit_status=accounting["exit_status"],
+                    maxvmem=(accounting["maxvmem"] or 0) / 1000 ** 2,
+                    wallclock=accounting["wallclock"] or 0))
+        for stream, path in self._job_logs().items():
+            try:
+                tail = OSLayer.tail(path, num_lines)
+            except (FileNotFoundError, TailError):
+                lines.append(f"--- {path}: not readable")
+                continue
+            lines.append(f"--- last {len(tail)} lines of {path}")
+            lines.extend(
+                line.decode(errors="replace").rstrip("\n") for line in tail)
+        return "\n".join(lines) + "\n"
+
+    def _report_failure(self):
+        """Write a failure report next to the logs and to stderr."""
+        defaults = self.cluster_config["__default__"]
+        num_lines = defaults.get("failure_report_lines", 20)
+        if not num_lines:
+            return
+        report = self.failure_report(num_lines)
+        sys.stderr.write(report)
+        report_dir = Path(defaults.get(
+            "failure_report_dir",
+            Path(defaults.get("log_dir", "cluster_logs")) / "failures"))
+        try:
+            report_dir.mkdir(parents=True, exist_ok=True)
+            (report_dir / f"{self._submitted_jobid}.txt").write_text(report)
+        except OSError as ex:
+            logger.warning(f"writing the failure report failed: {ex}")
+
+    def _consolidate_logs(self):
+        """Archive finished logs, at most once per `log_archive_interval`."""
+        defaults = self.cluster_config["__default__"]
+        if not defaults.get("log_archive", False) or self.ledger is None:
+            return
+        from uge_logs import ConsolidatePass
+
+        try:
+            ConsolidatePass(
+                self.ledger, defaults.get("log_archive_path"),
+                ttl=defaults.get("log_archive_interval", 300),
+                workdir=os.getcwd()).ensure_fresh()
+        except Exception as ex:
+            logger.warning(f"archiving job logs failed: {ex}")
+
+    def _rebalance(self):
+        """Move long pending jobs, at most once per `rebalance_interval`."""
+        defaults = self.cluster_config["__default__"]
+        if not defaults.get("rebalance", False) or self.ledger is None:
+            return
+        from uge_rebalance import Rebalancer, RebalancePass
+
+        rebalancer = Rebalancer(
+            self.ledger, self.cluster_config, workdir=os.getcwd())
+        try:
+            RebalancePass(
+                rebalancer, defaults.get("rebalance_path"),
+                ttl=defaults.get("rebalance_interval", 300)).ensure_fresh()
+        except Exception as ex:
+            logger.warning(f"rebalancing pending jobs failed: {ex}")
+
+    def _poll_status(self, queries, retry: bool = True) -> Optional[str]:
+        policy = self.polling_policy
+        attempts = {}
+        waited = 0
+        status = None
+        for _ in range(self.max_status_checks):
+            try:
+                for query in queries:
+                    status = query()
+                    if status is not None:
+                        return status
+                if not retry:
+                    break
+                if self._qstat_failed:
+                    state = PollingPolicy.QSTAT_ERROR
+                else:
+                    state = PollingPolicy.ACCOUNTING_LAG
+                attempt = attempts.get(state, 0)
+                attempts = {state: attempt + 1}
+                delay = min(policy.delay(state, attempt), policy.max_wait - waited)
+                if delay <= 0:
+                    break
+                time.sleep(delay)
+                waited += delay
             except Exception as ex:
                 logger.warning("unexpected exception in get_status()", ex)
                 raise ex
@@ -181,8 +739,19 @@ if __name__ == "__main__":
     root = logging.getLogger()
     root.setLevel(logging.ERROR)
 
-    jobid = int(sys.argv[1])
-    outlog = sys.argv[2]
+    if sys.argv[1:2] == ["--batch"]:
+        # `<jobid> [<errlog>]` per argument or per line of stdin
+        lines = sys.argv[2:] or sys.stdin.read().splitlines()
+        jobids = [line.split()[0] for line in lines if line.strip()]
+        for jobid, status in StatusChecker.get_statuses(jobids).items():
+            print(f"{jobid} {status}")
+        sys.exit(0)
+
+    # Snakemake passes the whole `<jobid> <errlog>` line printed by the
+    # submit script as a single argument
+    args = " ".join(sys.argv[1:]).split()
+    jobid = args[0]
+    outlog = args[1] if len(args) > 1 else ""
     try:
         status_checker = StatusChecker(jobid, outlog)
         print(status_checker.get_status())
@@ -1,20 +1,31 @@
 #!/usr/bin/env python3
 import os
+import json
 import math
+import hashlib
 import re
 import subprocess
 import sys
+import time
 import shutil
+import sqlite3
+import warnings
 from pathlib import Path
 from typing import List, Union, Optional
 
-from snakemake.utils import read_job_properties
-
 sys.path.append(str(Path(__file__).parent.absolute()))
 
 from uge_config import Config
-from uge_utils import load_cluster_config
+from uge_utils import load_cluster_config, profile_path
 from memory_units import Unit, Memory
+from uge_array import ArrayCoalescer, split_jobid
+from uge_sidecar_client import SubmitClient
+from uge_ledger import JobLedger, is_alive
+from uge_autotune import UsageModel
+from uge_metrics import Metrics
+from uge_trace import Tracer, TRACE_ID_ENV, trace_id
+from uge_job_properties import SUBMITTER_KEYS, read_job_properties
+from sge_failure import MEMORY, RUNTIME, ERROR
 
 PathLike = Union[str, Path]
 
@@ -25,25 +36,45 @@ class QsubInvocationError(Exception):
 class JobidNotFoundError(Exception):
     pass
 
+class JobNotRetriedError(Exception):
+    pass
+
 class Submitter:
     def __init__(
             self,
             jobscript: PathLike,
             cluster_cmds: List[str] = None,
             memory_units: Unit = Unit.GIGA,
-            uge_config: Optional[Config] = None):
-
+            uge_config: Optional[Config] = None,
+            cluster_config: Optional[dict] = None):
         if cluster_cmds is None:
             cluster_cmds = []
         if uge_config is None:
             uge_config = Config()
+        if cluster_config is None:
+            cluster_config = load_cluster_config("cluster.yaml")
 
         self._jobscript = jobscript
         self._cluster_cmd = " ".join(cluster_cmds)
         self._memory_units = memory_units
-        self._job_properties = read_job_properties(self._jobscript)
+        started = time.time()
+        # the input file lists of large jobs are only read when needed
+        self._job_properties = read_job_properties(
+            self._jobscript, SUBMITTER_KEYS)
         self.uge_config = uge_config
-        self._cluster_config = load_cluster_config("cluster.yaml")
+        self._cluster_config = cluster_config
+        self._ledger = None
+        self._metrics = None
+        self._mem_mb = None
+        self._runtime = None
+        self._input_size = None
+        self._previous_attempt = None
+        self._previous_attempt_loaded = False
+        self._queue = None
+        self._tracer = Tracer.from_environ(rule=self.rule_name)
+        if self._tracer.enabled:
+            self._tracer.trace_id = trace_id(jobscript, self.jobid)
+        self._tracer.record("submit.properties", started, time.time())
 
     def get_default_mem_mb(self):
         return self._cluster_config["__default__"].get("default_mem_mb", 1024)
@@ -59,6 +90,98 @@ class Submitter:
         return self._cluster_config["__default__"]\
             .get("default_queue", "")
 
+    def get_array_coalesce(self):
+        return self._cluster_config["__default__"]\
+            .get("array_coalesce", False)
+
+    def get_array_window(self):
+        return self._cluster_config["__default__"]\
+            .get("array_window", 5)
+
+    def get_array_max_tasks(self):
+        return self._cluster_config["__default__"]\
+            .get("array_max_tasks", 1000)
+
+    def get_ledger_reattach(self):
+        return self._cluster_config["__default__"]\
+            .get("ledger_reattach", False)
+
+    def get_autotune_mem(self):
+        return self._cluster_config["__default__"]\
+            .get("autotune_mem", False)
+
+    def get_autotune_by_input_size(self):
+        return self._cluster_config["__default__"]\
+            .get("autotune_by_input_size", False)
+
+    def get_autotune_runtime(self):
+        return self._cluster_config["__default__"]\
+            .get("autotune_runtime", False)
+
+    def get_failure_mem_factor(self):
+        return self._cluster_config["__default__"]\
+            .get("failure_mem_factor", 1.5)
+
+    def get_failure_runtime_factor(self):
+        return self._cluster_config["__default__"]\
+            .get("failure_runtime_factor", 2)
+
+    def get_failure_retry_errors(self):
+        return self._cluster_config["__default__"]\
+            .get("failure_retry_errors", False)
+
+    def get_failure_retry_window(self):
+        return self._cluster_config["__default__"]\
+            .get("failure_retry_window", 300)
+
+    def get_validate_complexes(self):
+        return self._cluster_config["__default__"]\
+            .get("validate_complexes", True)
+
+    def get_complex_cache_ttl(self):
+        return self._cluster_config["__default__"]\
+            .get("complex_cache_ttl", 3600)
+
+    def get_queue_cache_ttl(self):
+        return self._cluster_config["__default__"]\
+            .get("queue_cache_ttl", 30)
+
+    def get_bundle(self):
+        return self._cluster_config["__default__"]\
+            .get("bundle", False)
+
+    def get_bundle_slots(self):
+        return self._cluster_config["__default__"]\
+            .get("bundle_slots", 8)
+
+    def get_bundle_window(self):
+        return self._cluster_config["__default__"]\
+            .get("bundle_window", 5)
+
+    def get_bundle_max_jobs(self):
+        return self._cluster_config["__default__"]\
+            .get("bundle_max_jobs", 64)
+
+    def get_bundle_max_runtime(self):
+        return self._cluster_config["__default__"]\
+            .get("bundle_max_runtime", 10)
+
+    def get_bundle_max_mem_mb(self):
+        return self._cluster_config["__default__"]\
+            .get("bundle_max_mem_mb", 2000)
+
+    def get_bundle_spool_dir(self):
+        return self._cluster_config["__default__"]\
+            .get("bundle_spool_dir", ".snakemake/uge_bundles")
+
+    def get_log_archive(self):
+        return self._cluster_config["__default__"]\
+            .get("log_archive", False)
+
+    def get_array_spool_dir(self):
+        return self._cluster_config["__default__"]\
+            .get("array_spool_dir", ".snakemake/uge_arrays")
+
     @property
     def jobscript(self) -> str:
         return self._jobscript
@@ -81,26 +204,104 @@ class Submitter:
         return self.job_properties.get("resources", dict())
 
     @property
-    def mem_mb(self) -> Memory:
+    def requested_mem_mb(self) -> Memory:
         mem_value = self.resources.get(
             "mem_mb", self.cluster.get("mem_mb",
                 self.get_default_mem_mb())
         )
         return Memory(mem_value, unit=Unit.MEGA)
 
+    @property
+    def autotune_mem(self) -> bool:
+        if self.ledger is None:
+            return False
+        return bool(self.cluster.get(
+            "autotune_mem", self.get_autotune_mem()))
+
+    @property
+    def input_size(self) -> int:
+        if self._input_size is None:
+            inputs = read_job_properties(
+                self._jobscript, ["input"]).get("input", [])
+            self._input_size = sum(
+                os.path.getsize(path) for path in inputs
+                if os.path.isfile(path))
+        return self._input_size
+
+    @property
+    def autotune_input_size(self) -> Optional[int]:
+        """The input size for autotuning, None unless it scales by it."""
+        if not self.get_autotune_by_input_size():
+            return None
+        return self.input_size
+
+    @property
+    def mem_mb(self) -> Memory:
+        if self._mem_mb is None:
+            requested = self.requested_mem_mb
+            if self.autotune_mem:
+                model = UsageModel(
+                    self.ledger, self._cluster_config["__default__"])
+                try:
+                    tuned = model.tune_mem_mb(
+                        self.rule_name, requested.value,
+                        self.autotune_input_size)
+                    requested = Memory(tuned, unit=Unit.MEGA)
+                except sqlite3.Error as error:
+                    warnings.warn(f"memory autotuning failed: {error}")
+            previous = self.previous_attempt
+            if previous is not None and previous["failure"] == MEMORY \
+                    and previous["mem_mb"]:
+                # the last attempt ran out of memory, ask for more this time
+                escalated = previous["mem_mb"] * self.get_failure_mem_factor()
+                if escalated > requested.value:
+                    requested = Memory(escalated, unit=Unit.MEGA)
+            self._mem_mb = requested
+        return self._mem_mb
+
     @property
     def memory_units(self) -> Unit:
         return self._memory_units
 
     @property
-    def runtime(self) -> int:
+    def requested_runtime(self) -> int:
         rt = self.cluster.get("runtime", None)
         if rt:
             rt = int(rt)
         return rt
 
     @property
-    def resources_cmd(self) -> str:
+    def autotune_runtime(self) -> bool:
+        if self.ledger is None:
+            return False
+        return bool(self.cluster.get(
+            "autotune_runtime", self.get_autotune_runtime()))
+
+    @property
+    def runtime(self) -> int:
+        if self._runtime is None:
+            runtime = self.requested_runtime
+            if self.autotune_runtime:
+                model = UsageModel(
+                    self.ledger, self._cluster_config["__default__"])
+                try:
+                    runtime = model.tune_runtime(
+                        self.rule_name, runtime, self.autotune_input_size)
+                except sqlite3.Error as error:
+                    warnings.warn(f"runtime autotuning failed: {error}")
+            previous = self.previous_attempt
+            if previous is not None and previous["failure"] == RUNTIME \
+                    and previous["runtime"]:
+                # the last attempt was killed at its h_rt limit
+                escalated = math.ceil(
+                    previous["runtime"] * self.get_failure_runtime_factor())
+                runtime = max(runtime or 0, escalated)
+            # 0 marks a job that goes out without a limit
+            self._runtime = runtime or 0
+        return self._runtime or None
+
+    @property
+    def memory_cmd(self) -> str:
         mem_in_cluster_units = self.mem_mb.to(self.memory_units)
         res_cmd = []
         if self.threads > 1:
@@ -110,13 +311,20 @@ class Submitter:
             per_thread = math.ceil(mem_in_cluster_units.value)
         res_cmd.append(f"-l h_vmem={per_thread}G")
         res_cmd.append(f"-l m_mem_free={per_thread}G")
-
-        if self.runtime:
-            hours = self.runtime // 60
-            mins = self.runtime % 60
-            res_cmd.append(f"-l h_rt={hours}:{mins}:00")
         return " ".join(res_cmd)
 
+    @property
+    def runtime_cmd(self) -> str:
+        if not self.runtime:
+            return ""
+        hours = self.runtime // 60
+        mins = self.runtime % 60
+        return f"-l h_rt={hours}:{mins}:00"
+
+    @property
+    def resources_cmd(self) -> str:
+        return " ".join(p for p in [self.memory_cmd, self.runtime_cmd] if p)
+
     @property
     def wildcards(self) -> dict:
         return self.job_properties.get("wildcards", dict())
@@ -166,29 +374,84 @@ class Submitter:
             self.get_log_dir()))
         return project_logdir / self.rule_name
 
+    @property
+    def log_archive(self) -> bool:
+        return bool(self.cluster.get("log_archive", self.get_log_archive()))
+
+    @property
+    def log_suffix(self) -> str:
+        # with the log archive every job writes its own files, named after
+        # its Grid Engine jobid, so nothing has to be removed before qsub
+        return ".$JOB_ID" if self.log_archive else ""
+
     @property
     def outlog(self) -> Path:
         if self.is_group_jobtype:
-            return self.logdir / "groupid{groupid}_jobid{jobid}.out".format(
-                groupid=self.groupid, jobid=self.jobid)
-        return self.logdir / "{jobname}.out".format(jobname=self.jobname)
+            return self.logdir / "groupid{groupid}_jobid{jobid}{suffix}.out"\
+                .format(groupid=self.groupid, jobid=self.jobid,
+                        suffix=self.log_suffix)
+        return self.logdir / "{jobname}{suffix}.out".format(
+            jobname=self.jobname, suffix=self.log_suffix)
 
     @property
     def errlog(self) -> Path:
         if self.is_group_jobtype:
-            return self.logdir / "groupid{groupid}_jobid{jobid}.err".format(
-                groupid=self.groupid, jobid=self.jobid)
-        return self.logdir / "{jobname}.err".format(jobname=self.jobname)
+            return self.logdir / "groupid{groupid}_jobid{jobid}{suffix}.err"\
+                .format(groupid=self.groupid, jobid=self.jobid,
+                        suffix=self.log_suffix)
+        return self.logdir / "{jobname}{suffix}.err".format(
+            jobname=self.jobname, suffix=self.log_suffix)
 
     @property
     def jobinfo_cmd(self) -> str:
+        # qsub expands $JOB_ID itself, the shell must not
         return '-o "{out_log}" -e "{err_log}" -N "{jobname}"'.format(
-            out_log=self.outlog, err_log=self.errlog, jobname=self.jobname
+            out_log=str(self.outlog).replace("$JOB_ID", "\\$JOB_ID"),
+            err_log=str(self.errlog).replace("$JOB_ID", "\\$JOB_ID"),
+            jobname=self.jobname
         )
 
+    @property
+    def tracer(self) -> Tracer:
+        return self._tracer
+
+    @property
+    def trace_cmd(self) -> str:
+        # the jobscript stamps the start and end of the job with it
+        if not self.tracer.enabled:
+            return ""
+        return "-v {}={}".format(TRACE_ID_ENV, self.tracer.trace_id)
+
+    @property
+    def candidate_queues(self) -> List[str]:
+        queues = self.cluster.get("queue", self.get_default_queue())
+        if not queues:
+            return []
+        if isinstance(queues, str):
+            return [queues]
+        return list(queues)
+
+    def _choose_queue(self, candidates: List[str]) -> str:
+        from sge_queues import QueueCache
+
+        cache = QueueCache(
+            self._cluster_config["__default__"].get("queue_cache_path"),
+            ttl=self.get_queue_cache_ttl())
+        try:
+            return cache.choose(candidates, slots=self.threads)
+        except (OSError, ValueError) as error:
+            warnings.warn(f"choosing a queue failed: {error}")
+            return candidates[0]
+
     @property
     def queue(self) -> str:
-        return self.cluster.get("queue", self.get_default_queue())
+        if self._queue is None:
+            candidates = self.candidate_queues
+            if len(candidates) > 1:
+                self._queue = self._choose_queue(candidates)
+            else:
+                self._queue = candidates[0] if candidates else ""
+        return self._queue
 
     @property
     def queue_cmd(self) -> str:
@@ -208,6 +471,7 @@ class Submitter:
             "qsub -cwd -V",
             self.resources_cmd,
             self.jobinfo_cmd,
+            self.trace_cmd,
             self.queue_cmd,
             self.cluster_cmd,
             self.rule_specific_params,
@@ -215,6 +479,51 @@ class Submitter:
         ]
         return " ".join(p for p in params if p)
 
+    @property
+    def coalesce_arrays(self) -> bool:
+        if self.is_group_jobtype:
+            return False
+        return bool(self.cluster.get(
+            "array_coalesce", self.get_array_coalesce()))
+
+    @property
+    def array_signature(self) -> str:
+        signature = [
+            self.rule_name,
+            self.threads,
+            self.mem_mb.bytes(),
+            self.runtime,
+            self.queue,
+            self.cluster_cmd,
+            self.rule_specific_params,
+        ]
+        return hashlib.sha1(
+            json.dumps(signature).encode()).hexdigest()[:16]
+
+    @property
+    def bundle_jobs(self) -> bool:
+        """Whether the job is small enough to share a bundle job."""
+        if self.is_group_jobtype or self.threads > 1:
+            return False
+        if not self.cluster.get("bundle", self.get_bundle()):
+            return False
+        return bool(self.runtime) \
+            and self.runtime <= self.get_bundle_max_runtime() \
+            and self.mem_mb.value <= self.get_bundle_max_mem_mb()
+
+    @property
+    def bundle_signature(self) -> str:
+        # unlike task arrays, bundles mix the jobs of different rules
+        signature = [
+            self.mem_mb.bytes(),
+            self.runtime,
+            self.queue,
+            self.cluster_cmd,
+            self.rule_specific_params,
+        ]
+        return hashlib.sha1(
+            json.dumps(signature).encode()).hexdigest()[:16]
+
     def _create_logdir(self):
         os.makedirs(self.logdir, exist_ok=True)
 
@@ -227,39 +536,222 @@ class Submitter:
             assert os.path.isfile(self.errlog)
             os.remove(self.errlog)
 
-    def submit(self):
-        self._create_logdir()
-        self._remove_previous_logs()
+    @property
+    def ledger(self) -> Optional[JobLedger]:
+        if self._ledger is None:
+            self._ledger = JobLedger.from_cluster_config(self._cluster_config)
+        return self._ledger
+
+    @property
+    def metrics(self) -> Metrics:
+        if self._metrics is None:
+            self._metrics = Metrics.from_cluster_config(self._cluster_config)
+        return self._metrics
+
+    @property
+    def previous_attempt(self) -> Optional[dict]:
+        """The failed last submission of this rule and wildcards, if any."""
+        if not self._previous_attempt_loaded:
+            self._previous_attempt_loaded = True
+            if self.ledger is None:
+                return None
+            try:
+                job = self.ledger.find_latest(self.rule_name, self.wildcards)
+            except sqlite3.Error as error:
+                warnings.warn(f"job ledger lookup failed: {error}")
+                return None
+            if job is not None and job["state"] == "failed":
+                self._previous_attempt = job
+        return self._previous_attempt
+
+    def _check_retry(self):
+        """Refuse to retry a job that failed with an error of its own."""
+        previous = self.previous_attempt
+        if previous is None or previous["failure"] != ERROR \
+                or self.get_failure_retry_errors():
+            return
+        # only a restart of the same job within the same workflow run
+        if previous["snakemake_jobid"] != self.jobid or \
+                time.time() - previous["updated_at"] > \
+                self.get_failure_retry_window():
+            return
+        raise JobNotRetriedError(
+            f"job {previous['jobid']} of rule {self.rule_name} failed with "
+            f"exit status {previous['exit_status']}, not retrying it; "
+            f"see {previous['errlog']}")
+
+    def _validate_resources(self):
+        """Fail on resources the cluster does not know before qsub does."""
+        if not self.get_validate_complexes():
+            return
+        from sge_complexes import ComplexCache, resource_names
+
+        cache = ComplexCache(
+            self._cluster_config["__default__"].get("complex_cache_path"),
+            ttl=self.get_complex_cache_ttl())
+        cache.validate(resource_names(" ".join([
+            self.resources_cmd, self.cluster_cmd, self.rule_specific_params,
+        ])))
+
+    def _reattach(self):
+        """Reuse a still running job of a previous run for the same target."""
+        if self.ledger is None or not self.get_ledger_reattach():
+            return None
         try:
-            completed_process = subprocess.run(
-                self.submit_cmd,
-                check=False, shell=True,
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
+            job = self.ledger.find_active(self.rule_name, self.wildcards)
+        except sqlite3.Error as error:
+            warnings.warn(f"job ledger lookup failed: {error}")
+            return None
+        if job is None or not is_alive(job["jobid"]):
+            return None
+        return job["jobid"], job["outlog"], job["errlog"]
+
+    def _record_submission(self, jobid, outlog, errlog):
+        if self.ledger is None:
+            return
+        try:
+            self.ledger.record_submission(
+                jobid, self.jobid, self.rule_name, self.wildcards,
+                outlog, errlog, mem_mb=self.mem_mb.value,
+                input_size=self.autotune_input_size
+                if self.autotune_mem or self.autotune_runtime else None,
+                runtime=self.runtime, queue=self.queue,
+                queues=self.candidate_queues,
+                trace_id=self.tracer.trace_id,
+                log_archive=self.log_archive)
+        except sqlite3.Error as error:
+            warnings.warn(f"recording job {jobid} in the ledger failed: {error}")
+
+    def _submit_to_array(self):
+        coalescer = ArrayCoalescer(
+            self.get_array_spool_dir(),
+            window=self.get_array_window(),
+            max_tasks=self.get_array_max_tasks())
+        qsub = {
+            "params": [
+                self.resources_cmd,
+                self.queue_cmd,
+                self.cluster_cmd,
+                self.rule_specific_params,
+            ],
+            "jobname": "smk.{}.array".format(self.rule_name),
+            "logdir": str(self.logdir.absolute()),
+        }
+        jobid = coalescer.add(self.array_signature, self.jobscript, qsub)
+        batch, taskid = split_jobid(jobid)
+        outlog = self.logdir / "array.{}.{}.out".format(batch, taskid)
+        errlog = self.logdir / "array.{}.{}.err".format(batch, taskid)
+        return jobid, outlog, errlog
+
+    def _submit_to_bundle(self):
+        from uge_bundle import BundleCoalescer
+
+        bundler = BundleCoalescer(
+            self.get_bundle_spool_dir(),
+            window=self.get_bundle_window(),
+            max_tasks=self.get_bundle_max_jobs())
+        qsub = {
+            "params": [
+                self.memory_cmd,
+                self.queue_cmd,
+                self.cluster_cmd,
+                self.rule_specific_params,
+            ],
+            "slots": self.get_bundle_slots(),
+            "runtime": self.runtime,
+            "jobname": "smk.bundle",
+            "logdir": str(Path(self.get_log_dir()).absolute()),
+        }
+        # with the log archive the member logs are named after the member
+        # jobid, so that every attempt writes its own files
+        jobid = bundler.add(
+            self.bundle_signature, self.jobscript, qsub,
+            task_meta={
+                "outlog": str(self.outlog.absolute()),
+                "errlog": str(self.errlog.absolute()),
+            })
+        return jobid, \
+            Path(str(self.outlog).replace("$JOB_ID", jobid)), \
+            Path(str(self.errlog).replace("$JOB_ID", jobid))
+
+    def _submit_single(self):
+        if not self.log_archive:
+            self._remove_previous_logs()
+        try:
+            with self.tracer.span("submit.build"):
+                submit_cmd = self.submit_cmd
+            with self.metrics.timer(
+                    "uge_command_seconds", {"command": "qsub"}), \
+                    self.tracer.span("submit.qsub"):
+                completed_process = subprocess.run(
+                    submit_cmd,
+                    check=False, shell=True,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                )
+            if completed_process.returncode != 0:
+                self.metrics.inc("uge_command_errors", {"command": "qsub"})
             assert completed_process.returncode == 0
             output = completed_process.stdout.decode().strip()
             match = re.search(r"Your job (\d+).*", output)
             jobid = match.group(1)
             jobid = int(jobid)
 
-            return f"{jobid} {self.errlog}"
+            return jobid, \
+                Path(str(self.outlog).replace("$JOB_ID", str(jobid))), \
+                Path(str(self.errlog).replace("$JOB_ID", str(jobid)))
         except subprocess.CalledProcessError as error:
             raise QsubInvocationError(error)
         except AttributeError as error:
             raise JobidNotFoundError(error)
 
+    def submit(self):
+        try:
+            with self.metrics.timer(
+                    "uge_submit_seconds", {"rule": self.rule_name}), \
+                    self.tracer.span("submit") as span:
+                self._check_retry()
+                self._create_logdir()
+                submitted = self._reattach()
+                if submitted is None:
+                    self._validate_resources()
+                    if self.bundle_jobs:
+                        submitted = self._submit_to_bundle()
+                    elif self.coalesce_arrays:
+                        submitted = self._submit_to_array()
+                    else:
+                        submitted = self._submit_single()
+                    self._record_submission(*submitted)
+                span["jobid"] = str(submitted[0])
+        finally:
+            self.metrics.flush()
+        jobid, _, errlog = submitted
+        return f"{jobid} {errlog}"
+
+
+def load_uge_config(workdir: PathLike) -> Config:
+    from uge_config_snapshot import load_compiled_config
+
+    compiled = load_compiled_config(
+        profile_path("cluster.yaml"), Path(workdir) / "uge.yaml",
+        Path(workdir) / ".snakemake")
+    return Config(compiled["uge_config"], params=compiled["uge_params"])
 
-if __name__ == "__main__":
-    workdir = Path().resolve()
-    config_file = workdir / "uge.yaml"
-    if config_file.exists():
-        with config_file.open() as stream:
-            uge_config = Config.from_stream(stream)
-    else:
-        uge_config = Config()
 
+if __name__ == "__main__":
     jobscript = sys.argv[-1]
     cluster_cmds = sys.argv[1:-1]
+
+    # hand the job to the warm submit server when the sidecar runs one
+    client = SubmitClient.from_environ()
+    if client is not None:
+        reply = client.submit(jobscript, cluster_cmds)
+        if reply is not None:
+            if "error" in reply:
+                sys.exit(reply["error"])
+            print(reply["result"])
+            sys.exit(0)
+
+    uge_config = load_uge_config(Path().resolve())
     uge_submit = Submitter(
         jobscript=jobscript,
         uge_config=uge_config,
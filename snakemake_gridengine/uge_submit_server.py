@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Warm fork server for job submission.
+
+Keeps the submit modules, the cluster config and the `uge.yaml` config
+loaded and forks a child per request that builds and runs the `Submitter`.
+Requests arrive on a Unix socket from `uge_submit.py`, see `SubmitClient`.
+The sidecar starts this server when `submit_server` is enabled in
+cluster.yaml.
+"""
+
+import os
+import sys
+import json
+import stat
+import signal
+import socket
+import logging
+import argparse
+import traceback
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+from uge_utils import load_cluster_config
+from uge_submit import Submitter, load_uge_config
+
+
+logger = logging.getLogger(__name__)
+
+
+class SubmitServer:
+    def __init__(self, socket_path: str, workdir: str = None):
+        self._socket_path = socket_path
+        self._workdir = Path(workdir or os.getcwd()).resolve()
+        self._cluster_config = load_cluster_config("cluster.yaml")
+        self._uge_config = None
+        self._uge_config_mtime = None
+        self._socket = None
+
+    @property
+    def socket_path(self) -> str:
+        return self._socket_path
+
+    @property
+    def uge_config(self):
+        config_file = self._workdir / "uge.yaml"
+        mtime = config_file.stat().st_mtime if config_file.exists() else None
+        if self._uge_config is None or mtime != self._uge_config_mtime:
+            self._uge_config = load_uge_config(self._workdir)
+            self._uge_config_mtime = mtime
+        return self._uge_config
+
+    def _remove_stale_socket(self):
+        """Remove a socket left behind by us, refuse anything else."""
+        info = os.lstat(self.socket_path)
+        if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+            raise RuntimeError(
+                f"{self.socket_path} exists and is not a socket of ours")
+        os.remove(self.socket_path)
+
+    def bind(self):
+        if os.path.lexists(self.socket_path):
+            self._remove_stale_socket()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.socket_path)
+        # every request is submitted in our name, nobody else may connect
+        os.chmod(self.socket_path, 0o600)
+        self._socket.listen(128)
+
+    def close(self):
+        if self._socket is None:
+            return
+        self._socket.close()
+        self._socket = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def _handle(self, conn: socket.socket, uge_config):
+        with conn.makefile("rb") as stream:
+            request = json.loads(stream.readline().decode())
+        try:
+            # submit with the environment of the caller, qsub -V exports it
+            os.environ.clear()
+            os.environ.update(request["env"])
+            os.chdir(request["cwd"])
+            submitter = Submitter(
+                jobscript=request["jobscript"],
+                cluster_cmds=request["cluster_cmds"],
+                uge_config=uge_config,
+                cluster_config=self._cluster_config,
+            )
+            reply = {"result": submitter.submit()}
+        except Exception:
+            reply = {"error": traceback.format_exc()}
+        conn.sendall((json.dumps(reply) + "\n").encode())
+
+    def serve_forever(self):
+        # children are reaped automatically
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+        while True:
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                if self._socket is None:
+                    return
+                raise
+            uge_config = self.uge_config
+            pid = os.fork()
+            if pid == 0:
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                self._socket.close()
+                try:
+                    self._handle(conn, uge_config)
+                finally:
+                    conn.close()
+                    os._exit(0)
+            conn.close()
+
+
+def main(argv=sys.argv[1:]):
+    p = argparse.ArgumentParser(description="UGE snakemake submit server")
+    p.add_argument("--socket", required=True, help="Unix socket to listen on")
+    args = p.parse_args(argv)
+
+    server = SubmitServer(args.socket)
+    server.bind()
+
+    def shutdown(signum, frame):
+        server.close()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    # tell whoever started us that the socket is ready
+    print(json.dumps({"submit_socket": server.socket_path}), flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
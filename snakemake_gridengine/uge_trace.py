@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Job lifecycle tracing.
+
+With `UGE_TRACE` set to a file in the environment of Snakemake, the profile
+appends one JSON line per span to that file: the phases of a submission
+(`submit.properties`, `submit.build`, `submit.qsub` within `submit`), every
+status call (`status`, with the `status.qstat` and `status.qacct` commands
+it ran) and, written by `jobscript.sh` on the execution host, the
+`job.start` and `job.end` stamps of the job itself. The spans of one job
+share a trace id derived from its Snakemake jobid, which reaches the job as
+`UGE_TRACE_ID`. The analyzer turns a trace into a per-rule breakdown of
+where the wall time of a job went:
+
+    uge_trace.py report <trace file>
+
+`profile` is the time spent in the submit and status scripts themselves,
+`qmaster` the time spent waiting for qsub, qstat and qacct, `queue_wait`
+the time from submission to the job start, `runtime` the job itself and
+`detection` the time from the job end to the status call that reported it.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+
+TRACE_ENV = "UGE_TRACE"
+TRACE_ID_ENV = "UGE_TRACE_ID"
+
+PHASES = ["profile", "qmaster", "queue_wait", "runtime", "detection"]
+TERMINAL_STATES = ("success", "failed")
+
+
+def trace_id(jobscript: str, snakemake_jobid) -> str:
+    """
+    `<run>-<snakemake jobid>`, the run part tells apart the jobs of several
+    runs of one workflow, whose jobscripts are in different temporary
+    directories.
+    """
+    run = hashlib.sha1(
+        os.path.dirname(os.path.abspath(jobscript)).encode()).hexdigest()
+    return "{}-{}".format(run[:8], snakemake_jobid)
+
+
+class Tracer:
+    """Appends spans to the trace file, does nothing without one."""
+
+    def __init__(self, path: Optional[str], trace_id: str = None, **fields):
+        self._path = path or None
+        self.trace_id = trace_id
+        self._fields = fields
+
+    @staticmethod
+    def from_environ(**fields) -> "Tracer":
+        return Tracer(os.environ.get(TRACE_ENV), **fields)
+
+    @property
+    def enabled(self) -> bool:
+        return self._path is not None
+
+    def record(self, name: str, start: float, end: float, **attrs):
+        if not self.enabled:
+            return
+        span = dict(
+            self._fields, trace_id=self.trace_id, name=name, start=start,
+            end=end, pid=os.getpid(), host=socket.gethostname())
+        span.update(attrs)
+        line = (json.dumps(span) + "\n").encode()
+        # a single write to a file opened for appending keeps the lines of
+        # concurrent processes apart
+        try:
+            fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except OSError:
+            self._path = None
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Record the block as a span, attributes can be added to the dict."""
+        start = time.time()
+        try:
+            yield attrs
+        finally:
+            self.record(name, start, time.time(), **attrs)
+
+
+def read_spans(path: str) -> List[dict]:
+    spans = []
+    with open(path) as infile:
+        for line in infile:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                # a line cut short by a killed job
+                continue
+    return spans
+
+
+def _duration(span: dict) -> float:
+    return span["end"] - span["start"]
+
+
+def breakdown(spans: Iterable[dict]) -> Dict[str, dict]:
+    """Seconds per phase of every traced job, summed up per rule."""
+    spans = list(spans)
+    # status calls only know the trace id from the job ledger, without one
+    # they are matched to their submission by the Grid Engine jobid
+    traced_jobids = {
+        span["jobid"]: span["trace_id"] for span in spans
+        if span["name"] == "submit" and span.get("trace_id")
+        and span.get("jobid")
+    }
+    traces = {}
+    for span in spans:
+        trace = span.get("trace_id") or traced_jobids.get(span.get("jobid"))
+        if trace:
+            traces.setdefault(trace, []).append(span)
+
+    rules = {}
+    for trace in traces.values():
+        by_name = {}
+        for span in sorted(trace, key=lambda span: span["start"]):
+            by_name.setdefault(span["name"], []).append(span)
+        submits = by_name.get("submit")
+        if not submits:
+            continue
+        # a restarted job is traced again, the last attempt counts
+        submit = submits[-1]
+
+        def attempt(name):
+            return [
+                span for span in by_name.get(name, [])
+                if span["start"] >= submit["start"]
+            ]
+
+        phases = dict.fromkeys(PHASES, 0.0)
+        qsub = sum(map(_duration, attempt("submit.qsub")))
+        commands = sum(
+            map(_duration, attempt("status.qstat") + attempt("status.qacct")))
+        statuses = attempt("status")
+        phases["qmaster"] = qsub + commands
+        phases["profile"] = _duration(submit) - qsub + \
+            sum(map(_duration, statuses)) - commands
+        job_start = (attempt("job.start") or [None])[-1]
+        job_end = (attempt("job.end") or [None])[-1]
+        if job_start is not None:
+            phases["queue_wait"] = job_start["start"] - submit["end"]
+        if job_start is not None and job_end is not None:
+            phases["runtime"] = job_end["start"] - job_start["start"]
+        if job_end is not None:
+            reported = [
+                span["end"] for span in statuses
+                if span.get("status") in TERMINAL_STATES
+                and span["end"] >= job_end["start"]
+            ]
+            if reported:
+                phases["detection"] = min(reported) - job_end["start"]
+
+        rule = rules.setdefault(
+            submit.get("rule", "unknown"),
+            dict(dict.fromkeys(PHASES, 0.0), jobs=0))
+        rule["jobs"] += 1
+        for phase, seconds in phases.items():
+            rule[phase] += seconds
+    return rules
+
+
+def format_report(rules: Dict[str, dict]) -> str:
+    """Mean seconds per job and phase, and the share of each phase."""
+    lines = ["\t".join(["rule", "jobs"] + PHASES)]
+    for rule, phases in sorted(rules.items()):
+        total = sum(phases[phase] for phase in PHASES) or 1
+        lines.append("\t".join([rule, str(phases["jobs"])] + [
+            "{:.2f}s {:.0f}%".format(
+                phases[phase] / phases["jobs"],
+                100 * phases[phase] / total)
+            for phase in PHASES
+        ]))
+    return "\n".join(lines)
+
+
+def main(argv=sys.argv[1:]):
+    # the status script imports this module on every call
+    import argparse
+
+    p = argparse.ArgumentParser(description="UGE snakemake trace analyzer")
+    p.add_argument("command", choices=["report"])
+    p.add_argument("trace", help="the JSONL file given as $UGE_TRACE")
+    args = p.parse_args(argv)
+
+    print(format_report(breakdown(read_spans(args.trace))))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import os
 
-from snakemake import io
+
+def profile_path(path: str) -> str:
+    """A path relative to the profile dir, absolute paths stay as they are."""
+    return os.path.join(os.path.dirname(__file__), os.path.expandvars(path))
 
 
 def load_cluster_config(path=None):
@@ -8,9 +11,14 @@ def load_cluster_config(path=None):
     Load config to dict either from absolute path or relative to profile dir.\
     """
     if path:
-        path = os.path.join(
-            os.path.dirname(__file__), os.path.expandvars(path))
-        default_cluster_config = io.load_configfile(path)
+        # the YAML is only parsed when the compiled snapshot of it and of
+        # uge.yaml in the working directory is missing or out of date
+        from uge_config_snapshot import load_compiled_config
+
+        workdir = os.getcwd()
+        default_cluster_config = load_compiled_config(
+            profile_path(path), os.path.join(workdir, "uge.yaml"),
+            os.path.join(workdir, ".snakemake"))["cluster_config"]
     else:
         default_cluster_config = {}
     if "__default__" not in default_cluster_config:
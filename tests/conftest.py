@@ -0,0 +1,20 @@
+import pytest
+
+from snakemake_gridengine.uge_ledger import JobLedger
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """
+    Run every test in its own working directory, the profile writes its
+    job ledger, config snapshot and logs relative to it.
+    """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = JobLedger(tmp_path / "ledger.db")
+    yield ledger
+    ledger.close()
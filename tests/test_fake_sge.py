@@ -0,0 +1,43 @@
+import os
+import sys
+import time
+
+import pytest
+
+from snakemake_gridengine.uge_status import StatusChecker
+
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "benchmarks"))
+from fake_sge import FakeGridEngine  # noqa: E402
+
+
+@pytest.fixture
+def fake_sge(tmp_path, monkeypatch):
+    fake = FakeGridEngine.install(tmp_path / "sge", {
+        "queue_wait": 0, "runtime": 0, "accounting_lag": 0,
+        "failure_rate": 0,
+    })
+    for key, value in fake.environ().items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    return fake
+
+
+def test_fake_sge_status_round_trip(fake_sge):
+    jobid = fake_sge.submit("test_qstat.sh")
+    time.sleep(0.01)
+    fake_sge.flush_accounting(time.time())
+
+    assert StatusChecker(jobid, "").get_status() == StatusChecker.SUCCESS
+    assert "qacct" not in fake_sge.command_counts()
+
+
+def test_fake_sge_qdel(fake_sge):
+    fake_sge.settings["runtime"] = 3600
+    jobid = fake_sge.submit("test_qstat.sh")
+
+    assert StatusChecker(jobid, "").get_status() == StatusChecker.RUNNING
+    assert fake_sge.delete(jobid, time.time())
+    fake_sge.flush_accounting(time.time())
+    assert StatusChecker(jobid, "").get_status() == StatusChecker.FAILED
@@ -0,0 +1,27 @@
+import os
+import sys
+import subprocess
+
+
+PROFILE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "snakemake_gridengine")
+
+
+def imported_modules(module):
+    completed_process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROFILE_DIR, check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return {
+        line.split("|")[-1].strip()
+        for line in completed_process.stderr.decode().splitlines()
+        if line.startswith("import time:")
+    }
+
+
+def test_uge_status_does_not_import_snakemake():
+    modules = imported_modules("uge_status")
+
+    assert "uge_status" in modules
+    assert "snakemake" not in modules
+    assert "yaml" not in modules
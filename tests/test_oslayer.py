@@ -0,0 +1,24 @@
+import pytest
+
+from snakemake_gridengine.OSLayer import OSLayer
+
+
+def test_tail(tmp_path):
+    path = tmp_path / "job.err"
+    path.write_bytes(b"".join(b"line %d\n" % i for i in range(10000)))
+
+    assert OSLayer.tail(str(path), 3) == [
+        b"line 9997\n", b"line 9998\n", b"line 9999\n"]
+    assert OSLayer.tail(str(path), 2, block_size=3) == [
+        b"line 9998\n", b"line 9999\n"]
+    assert OSLayer.tail(str(path), 0) == []
+
+
+def test_tail_short_files(tmp_path):
+    path = tmp_path / "job.err"
+    path.write_bytes(b"first\nlast")
+    assert OSLayer.tail(str(path), 10) == [b"first\n", b"last"]
+    path.write_bytes(b"")
+    assert OSLayer.tail(str(path), 10) == []
+    with pytest.raises(FileNotFoundError):
+        OSLayer.tail(str(tmp_path / "missing"))
@@ -0,0 +1,132 @@
+import os
+
+import pytest
+
+from snakemake_gridengine.sge_accounting import AccountingIndex, \
+    AccountingRecord, parse_accounting_line
+
+
+def accounting_line(
+        jobid, owner="chorbadj", failed=0, exit_status=0, taskid=0,
+        maxvmem=17488000.0, wallclock=301.22, hostname="wigclust11",
+        maxrss=6376):
+    fields = ["0"] * 45
+    fields[0] = "all.q"
+    fields[1] = hostname
+    fields[3] = owner
+    fields[5] = str(jobid)
+    fields[11] = str(failed)
+    fields[12] = str(exit_status)
+    fields[13] = str(wallclock)
+    fields[16] = str(maxrss)
+    fields[35] = str(taskid)
+    fields[41] = "NONE"
+    fields[42] = str(maxvmem)
+    return ":".join(fields) + "\n"
+
+
+@pytest.fixture
+def accounting_file(tmp_path):
+    path = tmp_path / "accounting"
+    path.write_text("# Version: 8.1.9\n" + accounting_line(1504976))
+    return path
+
+
+def test_parse_accounting_line():
+    key, record = parse_accounting_line(accounting_line(17, taskid=3))
+
+    assert key == "17.3"
+    assert record == AccountingRecord(
+        0, 0, 17488000.0, 301.22, "wigclust11", 6376.0, "all.q", None)
+    assert parse_accounting_line(
+        accounting_line(17, owner="other"), owner="chorbadj") is None
+
+
+def test_accounting_index_tails_new_records(accounting_file, tmp_path):
+    index_path = tmp_path / "accounting.json"
+    accounting = AccountingIndex(accounting_file, index_path, "chorbadj")
+
+    assert accounting.lookup(1504976).exit_status == 0
+    assert accounting.lookup(1504977) is None
+
+    with open(accounting_file, "a") as outfile:
+        outfile.write(accounting_line(1504977, failed=100, exit_status=137))
+        # rerun of the same job, the last record wins
+        outfile.write(accounting_line(1504977, exit_status=0))
+        outfile.write(accounting_line(1504978, owner="other"))
+        # incomplete line still being written
+        outfile.write("all.q:wigclust11")
+
+    accounting = AccountingIndex(accounting_file, index_path, "chorbadj")
+    accounting.update()
+    assert accounting.lookup(1504977).exit_status == 0
+    assert accounting.lookup(1504978) is None
+    assert accounting.lookup(1504976) is not None
+
+
+def test_accounting_index_handles_rotation(accounting_file, tmp_path):
+    index_path = tmp_path / "accounting.json"
+    AccountingIndex(accounting_file, index_path).update()
+
+    rotated = tmp_path / "accounting.new"
+    rotated.write_text(accounting_line(1504979, exit_status=1))
+    os.replace(rotated, accounting_file)
+
+    accounting = AccountingIndex(accounting_file, index_path)
+    accounting.update()
+    assert accounting.lookup(1504979).exit_status == 1
+    assert accounting.lookup(1504976).exit_status == 0
+
+
+def test_accounting_index_appends_records(accounting_file, tmp_path):
+    index_path = tmp_path / "accounting.json"
+    accounting = AccountingIndex(accounting_file, index_path)
+    accounting.update()
+    size = accounting.records_path.stat().st_size
+
+    # an update that died after appending, before saving the index
+    with open(accounting.records_path, "ab") as outfile:
+        outfile.write(b'["1504977", [')
+    with open(accounting_file, "a") as outfile:
+        outfile.write(accounting_line(1504977, exit_status=1))
+
+    accounting = AccountingIndex(accounting_file, index_path)
+    accounting.update()
+    records = accounting.records_path.read_bytes()
+    assert records.startswith(b'["1504976", ')
+    assert records[size:].startswith(b'["1504977", ')
+    assert records.count(b"\n") == 2
+    assert accounting.lookup(1504977).exit_status == 1
+    assert accounting.lookup(150497) is None
+
+
+def test_accounting_index_compacts_records(
+        accounting_file, tmp_path, monkeypatch):
+    from snakemake_gridengine import sge_accounting
+
+    monkeypatch.setattr(sge_accounting, "MAX_INDEXED_RECORDS", 2)
+    index_path = tmp_path / "accounting.json"
+    with open(accounting_file, "a") as outfile:
+        for jobid in (1504977, 1504978, 1504977, 1504979):
+            outfile.write(accounting_line(jobid, exit_status=jobid % 2))
+
+    accounting = AccountingIndex(accounting_file, index_path)
+    accounting.update()
+
+    assert accounting.records_path.read_bytes().count(b"\n") == 2
+    assert accounting.lookup(1504976) is None
+    assert accounting.lookup(1504977).exit_status == 1
+    assert accounting.lookup(1504979).exit_status == 1
+
+
+def test_accounting_status_checks_failed(accounting_file, tmp_path, mocker):
+    from snakemake_gridengine import sge_status
+
+    with open(accounting_file, "a") as outfile:
+        # killed by the execd, the job script itself never failed
+        outfile.write(accounting_line(1504977, failed=100, exit_status=0))
+    mocker.patch.object(sge_status, "accounting", AccountingIndex(
+        accounting_file, tmp_path / "accounting.json"))
+
+    assert sge_status.accounting_status(1504976) == "success"
+    assert sge_status.accounting_status(1504977) == "failed"
@@ -0,0 +1,93 @@
+import os
+import subprocess
+
+import pytest
+
+from snakemake_gridengine.sge_complexes import ComplexCache, \
+    UnrequestableResourceError, parse_complexes, resource_names, \
+    validate_resources
+from snakemake_gridengine.sge_submit import RESOURCE_MAPPING, \
+    OPTION_MAPPING, build_alias_index, parse_qsub_settings
+from snakemake_gridengine.uge_submit import Submitter
+from snakemake_gridengine.uge_utils import load_cluster_config
+
+
+@pytest.fixture
+def qconf_sc():
+    filename = os.path.join(os.path.dirname(__file__), "qconf_sc.txt")
+    with open(filename) as infile:
+        return infile.read()
+
+
+def test_alias_index():
+    index = build_alias_index(RESOURCE_MAPPING)
+
+    assert index["walltime"] == "h_rt"
+    assert index["h_vmem"] == "h_vmem"
+    assert build_alias_index(OPTION_MAPPING)["queue"] == "q"
+
+
+def test_parse_qsub_settings_uses_aliases():
+    settings = parse_qsub_settings({"memory": 4, "queue": "all.q"})
+
+    assert settings == {
+        "options": {"q": "all.q"}, "resources": {"h_vmem": "4G"}}
+    with pytest.raises(KeyError):
+        parse_qsub_settings({"queue": "all.q"}, option_mapping={})
+
+
+def test_validate_resources(qconf_sc):
+    complexes = parse_complexes(qconf_sc)
+
+    validate_resources(["h_vmem", "mfree", "h_rt"], complexes)
+    with pytest.raises(UnrequestableResourceError, match="h_vmem"):
+        validate_resources(["h_vmme"], complexes)
+    with pytest.raises(UnrequestableResourceError, match="not requestable"):
+        validate_resources(["load_avg"], complexes)
+
+
+def test_resource_names():
+    assert resource_names(
+        "-pe smp 2 -l h_vmem=2G -l m_mem_free=2G,h_rt=1:0:0 -q all.q") == \
+        ["h_vmem", "m_mem_free", "h_rt"]
+
+
+def test_complex_cache_runs_qconf_once(tmp_path, mocker, qconf_sc):
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        "qconf -sc", returncode=0, stdout=qconf_sc.encode(), stderr=b""))
+    cache = ComplexCache(tmp_path / "complexes.json", ttl=60)
+
+    assert cache.complexes()["h_vmem"].requestable == "YES"
+    cache.validate(["h_vmem"])
+    subprocess.run.assert_called_once()
+
+
+def test_complex_cache_without_qconf(tmp_path, mocker):
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        "qconf -sc", returncode=1, stdout=b"", stderr=b"denied"))
+    cache = ComplexCache(tmp_path / "complexes.json", ttl=60)
+
+    assert cache.complexes() is None
+    cache.validate(["h_vmme"])
+
+
+def test_submit_rejects_unknown_resource(tmp_path, mocker, qconf_sc):
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        "qconf -sc", returncode=0, stdout=qconf_sc.encode(), stderr=b""))
+    cluster_config = load_cluster_config("cluster.yaml")
+    cluster_config["__default__"]["complex_cache_path"] = \
+        str(tmp_path / "complexes.json")
+    jobscript = os.path.join(os.path.dirname(__file__), "real_jobscript.sh")
+
+    submitter = Submitter(
+        jobscript, cluster_cmds=["-l", "h_vmme=2G"],
+        cluster_config=cluster_config)
+    submitter._ledger = None
+
+    # uge_submit imports the module by its plain name
+    with pytest.raises(ValueError, match="did you mean 'h_vmem'"):
+        submitter.submit()
+    # only qconf ran, qsub never did
+    subprocess.run.assert_called_once_with(
+        "qconf -sc", check=False, shell=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -0,0 +1,128 @@
+import os
+import subprocess
+
+import pytest
+
+from snakemake_gridengine import sge_failure
+from snakemake_gridengine.sge_failure import classify
+from snakemake_gridengine.uge_status import StatusChecker
+from snakemake_gridengine.uge_submit import Submitter, JobNotRetriedError
+
+
+RULE = "search_fasta_on_index"
+WILDCARDS = {"i": "0"}
+
+
+@pytest.fixture
+def submitter(ledger, mocker):
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        b"", returncode=0,
+        stdout=b"""Your job 1504977 ("test_qstat.sh") has been submitted"""))
+    jobscript = os.path.join(os.path.dirname(__file__), "real_jobscript.sh")
+    submitter = Submitter(jobscript)
+    submitter._ledger = ledger
+    return submitter
+
+
+def failed_attempt(ledger, failure, snakemake_jobid=2, mem_mb=4000,
+                   runtime=30, exit_status=137):
+    ledger.record_submission(
+        1504976, snakemake_jobid, RULE, WILDCARDS, "a.out", "a.err",
+        mem_mb=mem_mb, runtime=runtime)
+    ledger.record_state(1504976, StatusChecker.FAILED)
+    ledger.record_usage(1504976, 1e9, 0, 60.0, 0, exit_status)
+    ledger.record_failure(1504976, failure)
+
+
+def test_classify():
+    assert classify(0, 0) is None
+    # exit status 137 used to be read as its last digit
+    assert classify(100, 137, maxvmem=3.9e9, mem_mb=4000) == \
+        sge_failure.MEMORY
+    assert classify(0, 137, wallclock=1800, runtime=30, mem_mb=4000,
+                    maxvmem=1e9) == sge_failure.RUNTIME
+    assert classify(37, 137, runtime=30) == sge_failure.RUNTIME
+    assert classify(28, 0) == sge_failure.NODE
+    assert classify(100, 143, maxvmem=1e9, mem_mb=4000) == \
+        sge_failure.KILLED
+    assert classify(0, 1, maxvmem=1e9, mem_mb=4000, wallclock=60,
+                    runtime=30) == sge_failure.ERROR
+
+
+def test_qacct_job_state_reads_whole_values():
+    qacct = "failed       0\nexit_status  10\n"
+    assert StatusChecker._qacct_job_state(qacct) == "FAIL"
+    qacct = "failed       100 : assumedly after job\nexit_status  0\n"
+    assert StatusChecker._qacct_job_state(qacct) == "FAIL"
+
+
+def test_status_records_failure_class(ledger, tmp_path):
+    ledger.record_submission(
+        1504976, 2, RULE, WILDCARDS, "a.out", "a.err", mem_mb=1000)
+    checker = StatusChecker(1504976, "a.err")
+    checker._ledger = ledger
+    checker._accounting = {
+        "failed": 100, "exit_status": 137, "maxvmem": 1.05e9,
+        "maxrss": 0, "wallclock": 12.0,
+    }
+
+    checker._record_status_in_ledger(StatusChecker.FAILED)
+
+    assert ledger.get(1504976)["failure"] == sge_failure.MEMORY
+
+
+def test_retry_escalates_memory(ledger, submitter):
+    failed_attempt(ledger, sge_failure.MEMORY)
+
+    assert submitter.mem_mb.value == 6000
+    assert submitter.runtime is None
+
+
+def test_retry_escalates_runtime(ledger, submitter):
+    failed_attempt(ledger, sge_failure.RUNTIME)
+
+    assert submitter.runtime == 60
+    assert "-l h_rt=1:0:00" in submitter.resources_cmd
+
+
+def test_error_is_not_retried(ledger, submitter):
+    failed_attempt(ledger, sge_failure.ERROR, exit_status=1)
+
+    with pytest.raises(JobNotRetriedError):
+        submitter.submit()
+    subprocess.run.assert_not_called()
+
+
+def test_error_of_an_earlier_run_is_resubmitted(ledger, submitter):
+    failed_attempt(ledger, sge_failure.ERROR, snakemake_jobid=7)
+
+    assert submitter.submit().startswith("1504977 ")
+
+
+def test_failure_report(ledger, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.err").write_text(
+        "".join(f"line {i}\n" for i in range(1000)) + "MemoryError\n")
+    ledger.record_submission(
+        1504976, 2, RULE, WILDCARDS, "a.err", "a.err", mem_mb=1000)
+    checker = StatusChecker(1504976, "a.err")
+    checker._ledger = ledger
+    checker._cluster_config = {"__default__": {
+        "failure_report_lines": 2, "log_dir": str(tmp_path / "logs")}}
+    checker._accounting = {
+        "failed": 100, "exit_status": 137, "maxvmem": 1.05e9,
+        "maxrss": 0, "wallclock": 12.0,
+    }
+    checker._record_status_in_ledger(StatusChecker.FAILED)
+
+    checker._report_failure()
+
+    report = (tmp_path / "logs" / "failures" / "1504976.txt").read_text()
+    assert report == capsys.readouterr().err
+    assert report.splitlines() == [
+        "job 1504976 failed, classified as memory",
+        "failed 100  exit_status 137  maxvmem 1050 MB  wallclock 12 s",
+        "--- last 2 lines of a.err",
+        "line 999",
+        "MemoryError",
+    ]
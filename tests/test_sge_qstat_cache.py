@@ -0,0 +1,83 @@
+import io
+import subprocess
+
+from snakemake_gridengine.sge_qstat_cache import QstatSnapshotCache, \
+    encode_snapshot, lookup_snapshot
+
+
+QSTAT_XML = b"""<?xml version='1.0'?>
+<job_info>
+  <queue_info>
+    <job_list state="running">
+      <JB_job_number>17</JB_job_number>
+      <state>r</state>
+      <queue_name>all.q@wigclust11.cshl.edu</queue_name>
+      <slots>1</slots>
+    </job_list>
+  </queue_info>
+  <job_info>
+    <job_list state="pending">
+      <JB_job_number>1504976</JB_job_number>
+      <state>Eqw</state>
+      <slots>1</slots>
+    </job_list>
+    <job_list state="pending">
+      <JB_job_number>900001</JB_job_number>
+      <state>qw</state>
+      <slots>1</slots>
+    </job_list>
+  </job_info>
+</job_info>
+"""
+
+
+def test_encode_lookup_snapshot():
+    states = {str(jobid): "r" for jobid in range(1, 2000, 3)}
+    states["1504976"] = "Eqw"
+    data = encode_snapshot(states)
+
+    assert lookup_snapshot(data, "1504976") == "Eqw"
+    assert lookup_snapshot(data, "1") == "r"
+    assert lookup_snapshot(data, "1999") == "r"
+    assert lookup_snapshot(data, "2") is None
+    assert lookup_snapshot(data, "12345678") is None
+
+
+def test_encode_empty_snapshot():
+    assert lookup_snapshot(encode_snapshot({}), "17") is None
+
+
+def test_qstat_snapshot_cache_refreshes_once(tmp_path, mocker):
+    mocker.patch("subprocess.Popen", return_value=mocker.Mock(
+        stdout=io.BytesIO(QSTAT_XML), stderr=io.BytesIO(b""),
+        **{"wait.return_value": 0}))
+    cache = QstatSnapshotCache(tmp_path / "qstat.snapshot", ttl=60)
+
+    assert cache.lookup(17) == "r"
+    assert cache.lookup(1504976) == "Eqw"
+    assert cache.lookup(900001) == "qw"
+    assert cache.lookup(18) is None
+
+    subprocess.Popen.assert_called_once()
+
+
+def test_qstat_snapshot_cache_refreshes_for_newer_jobs(tmp_path, mocker):
+    mocker.patch("subprocess.Popen", return_value=mocker.Mock(
+        stdout=io.BytesIO(QSTAT_XML), stderr=io.BytesIO(b""),
+        **{"wait.return_value": 0}))
+    cache = QstatSnapshotCache(tmp_path / "qstat.snapshot", ttl=60)
+    assert cache.lookup(17) == "r"
+
+    newer = QSTAT_XML.replace(b"900001", b"1504980")
+    subprocess.Popen.side_effect = lambda *args, **kwargs: mocker.Mock(
+        stdout=io.BytesIO(newer), stderr=io.BytesIO(b""),
+        **{"wait.return_value": 0})
+    # submitted after the snapshot was taken
+    assert cache.lookup(1504980) == "qw"
+    # finished before it was ever listed, asked about only once
+    assert cache.lookup(1504979) is None
+    assert cache.lookup(1504978) is None
+    assert cache.lookup(1504990) is None
+    assert cache.lookup(1504990) is None
+
+    assert subprocess.Popen.call_count == 3
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from snakemake_gridengine.sge_qstat_xml import iter_qstat_xml, \
+    qstat_states, expand_tasks
+
+
+@pytest.fixture
+def qstat_xml():
+    return os.path.join(os.path.dirname(__file__), "qstat.xml")
+
+
+def test_iter_qstat_xml(qstat_xml):
+    with open(qstat_xml, "rb") as infile:
+        jobs = list(iter_qstat_xml(infile))
+
+    assert [job.jobid for job in jobs] == [
+        "1504976", "1504978", "1504977", "1504978", "1504979"]
+    running = jobs[0]
+    assert running.state == "r"
+    assert running.queue == "all.q@wigclust11.cshl.edu"
+    assert running.slots == 1
+    assert running.start_time == "2020-08-03T07:48:20.919"
+    pending = jobs[2]
+    assert pending.queue is None
+    assert pending.slots == 4
+    assert pending.submission_time == "2020-08-03T07:48:21.273"
+    assert jobs[1].taskid == "3"
+
+
+def test_qstat_states(qstat_xml):
+    with open(qstat_xml, "rb") as infile:
+        states = qstat_states(iter_qstat_xml(infile))
+
+    assert states["1504976"] == "r"
+    assert states["1504978"] == "r"
+    assert states["1504978.3"] == "r"
+    assert states["1504978.5"] == "qw"
+    assert states["1504979"] == "Eqw"
+
+
+def test_expand_tasks():
+    assert expand_tasks("1-5:2") == ["1", "3", "5"]
+    assert expand_tasks("3,7-8:1") == ["3", "7", "8"]
+    assert expand_tasks(None) == []
@@ -0,0 +1,98 @@
+import os
+import subprocess
+
+import pytest
+
+from snakemake_gridengine.sge_queues import QueueCache, choose_queue, \
+    parse_cluster_queues, recent_queue_waits
+from snakemake_gridengine.uge_submit import Submitter
+from snakemake_gridengine.uge_utils import load_cluster_config
+
+
+@pytest.fixture
+def qstat_gc():
+    filename = os.path.join(os.path.dirname(__file__), "qstat_gc.txt")
+    with open(filename) as infile:
+        return infile.read()
+
+
+def accounting_line(queue, submitted, started):
+    fields = ["0"] * 45
+    fields[0] = queue
+    fields[8] = str(submitted)
+    fields[9] = str(started)
+    fields[41] = "NONE"
+    return ":".join(fields) + "\n"
+
+
+def test_parse_cluster_queues(qstat_gc):
+    queues = parse_cluster_queues(qstat_gc)
+
+    assert sorted(queues) == ["all.q", "gpu.q", "long.q", "short.q"]
+    assert queues["all.q"].available == 2
+    assert queues["long.q"].load == 0.33
+    assert queues["gpu.q"].load is None
+
+
+def test_choose_queue(qstat_gc):
+    queues = parse_cluster_queues(qstat_gc)
+
+    assert choose_queue(["all.q", "long.q"], queues) == "long.q"
+    # not enough free slots in all.q for 4 threads
+    assert choose_queue(["all.q", "gpu.q"], queues, slots=4) == "all.q"
+    assert choose_queue(["unknown.q", "all.q"], queues) == "all.q"
+    # long.q and short.q look alike, the recent wait times decide
+    assert choose_queue(
+        ["long.q", "short.q"], queues,
+        waits={"long.q": 600, "short.q": 20}) == "short.q"
+    assert choose_queue(["long.q", "short.q"], queues) == "long.q"
+
+
+def test_recent_queue_waits(tmp_path):
+    accounting = tmp_path / "accounting"
+    accounting.write_text("".join([
+        "# Version: 8.1.9\n",
+        accounting_line("all.q", 1000, 1010),
+        accounting_line("all.q", 1000, 1030),
+        accounting_line("all.q", 1000, 1100),
+        accounting_line("long.q", 1000, 0),
+        accounting_line("short.q", 1600000000000, 1600000005000),
+    ]))
+
+    assert recent_queue_waits(accounting) == {"all.q": 30, "short.q": 5}
+    assert recent_queue_waits(accounting, window=1)["all.q"] == 100
+
+
+def test_queue_cache_runs_qstat_once(tmp_path, mocker, qstat_gc):
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        "qstat -g c", returncode=0, stdout=qstat_gc.encode(), stderr=b""))
+    cache = QueueCache(
+        tmp_path / "queues.json", ttl=60,
+        accounting_file=tmp_path / "missing")
+
+    assert cache.choose(["all.q", "short.q"]) == "short.q"
+    assert cache.choose(["gpu.q", "long.q"]) == "long.q"
+    subprocess.run.assert_called_once()
+
+
+def test_queue_cache_without_qstat(tmp_path, mocker):
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        "qstat -g c", returncode=1, stdout=b"", stderr=b"error"))
+    cache = QueueCache(tmp_path / "queues.json", ttl=60)
+
+    assert cache.choose(["all.q", "long.q"]) == "all.q"
+
+
+def test_submitter_picks_candidate_queue(tmp_path, mocker, qstat_gc):
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        "qstat -g c", returncode=0, stdout=qstat_gc.encode(), stderr=b""))
+    cluster_config = load_cluster_config("cluster.yaml")
+    cluster_config["__default__"]["queue_cache_path"] = \
+        str(tmp_path / "queues.json")
+    jobscript = os.path.join(os.path.dirname(__file__), "real_jobscript.sh")
+
+    submitter = Submitter(jobscript, cluster_config=cluster_config)
+    submitter.cluster["queue"] = ["all.q", "long.q"]
+
+    assert submitter.queue == "long.q"
+    assert "-q long.q" in submitter.submit_cmd
@@ -0,0 +1,101 @@
+import os
+import subprocess
+
+import pytest
+
+from snakemake_gridengine.uge_array import ArrayCoalescer, is_batch_jobid
+from snakemake_gridengine.uge_status import StatusChecker
+
+
+QSUB = {"params": ["-l h_vmem=2G"], "jobname": "smk.a.array", "logdir": "logs"}
+
+
+@pytest.fixture
+def jobscript():
+    return os.path.join(os.path.dirname(__file__), "real_jobscript.sh")
+
+
+@pytest.fixture
+def coalescer(tmp_path, mocker):
+    mocker.patch("subprocess.Popen")
+    return ArrayCoalescer(tmp_path / "spool", window=5, max_tasks=3)
+
+
+def test_array_coalescer_add(coalescer, jobscript):
+    ids = [coalescer.add("sig1", jobscript, QSUB) for _ in range(4)]
+    other = coalescer.add("sig2", jobscript, QSUB)
+
+    batches = [jobid.split(".")[0] for jobid in ids]
+    assert all(is_batch_jobid(jobid) for jobid in ids)
+    assert [jobid.split(".")[1] for jobid in ids] == ["1", "2", "3", "1"]
+    assert batches[0] == batches[1] == batches[2] != batches[3]
+    assert other.split(".")[0] not in batches
+    # one flusher per batch
+    assert subprocess.Popen.call_count == 3
+
+
+def test_array_coalescer_flush(coalescer, jobscript, mocker):
+    jobid = coalescer.add("sig1", jobscript, QSUB)
+    coalescer.add("sig1", jobscript, QSUB)
+    batch = jobid.split(".")[0]
+    assert coalescer.resolve(batch) == (None, False)
+
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        b"", returncode=0,
+        stdout=b'Your job-array 1504976.1-2:1 ("smk.a.array") has been submitted'))
+    assert coalescer.flush("sig1", batch) == 1504976
+
+    cmd = subprocess.run.call_args[0][0]
+    assert "-t 1-2" in cmd
+    assert "'logs/array.{}.$TASK_ID.err'".format(batch) in cmd
+    assert coalescer.resolve(batch) == (1504976, False)
+
+    tasks = (coalescer.batch_dir(batch) / "tasks").read_text().splitlines()
+    assert tasks[1].endswith("task-2.sh")
+
+
+def test_qstat_job_state_of_array_task():
+    output = """job_number:                 1504976
+job-array tasks:            1-4:1
+job_state             1:    r
+job_state             2:    Eqw
+"""
+    assert StatusChecker._qstat_job_state(output, "1") == "r"
+    assert StatusChecker._qstat_job_state(output, "2") == "qw"
+    assert StatusChecker._qstat_job_state(output, "3") == ""
+    assert StatusChecker._qstat_job_state(output) == "r"
+
+
+def test_status_of_unsubmitted_batch(coalescer, jobscript, mocker):
+    jobid = coalescer.add("sig1", jobscript, QSUB)
+    checker = StatusChecker(jobid, "")
+    mocker.patch.object(
+        StatusChecker, "array_spool_dir", str(coalescer.spool_dir))
+
+    assert checker.get_status() == StatusChecker.RUNNING
+
+
+def test_pending_array_task_is_found_without_qacct(tmp_path, mocker):
+    import io
+
+    qstat_xml = os.path.join(os.path.dirname(__file__), "qstat.xml")
+    with open(qstat_xml, "rb") as infile:
+        xml = infile.read()
+    mocker.patch("subprocess.Popen", side_effect=lambda *a, **k: mocker.Mock(
+        stdout=io.BytesIO(xml), stderr=io.BytesIO(b""),
+        **{"wait.return_value": 0}))
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        b"", returncode=0, stdout=b"job_number: 1504978\n"
+        b"job-array tasks: 1-6:1\njob_state             3:    r\n"))
+    cluster_config = {"__default__": {
+        "qstat_cache_path": str(tmp_path / "qstat.snapshot"),
+        "accounting_file": "", "ledger_path": ""}}
+
+    for taskid in (3, 5):
+        checker = StatusChecker(f"1504978.{taskid}", "")
+        checker._cluster_config = cluster_config
+        assert checker._query_status_using_qstat() == StatusChecker.RUNNING
+    # qstat -j twice and one shared qstat -xml, no qacct
+    assert all("qstat -j" in call[0][0]
+               for call in subprocess.run.call_args_list)
+    subprocess.Popen.assert_called_once()
@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import subprocess
+
+import pytest
+
+from snakemake_gridengine.uge_autotune import UsageModel, percentile
+from snakemake_gridengine.uge_ledger import JobLedger
+from snakemake_gridengine.uge_status import StatusChecker
+from snakemake_gridengine.uge_submit import Submitter
+from snakemake_gridengine.uge_utils import load_cluster_config
+
+
+@pytest.fixture
+def jobscript():
+    return os.path.join(os.path.dirname(__file__), "real_jobscript.sh")
+
+
+def finished_job(ledger, jobid, rule, maxvmem, input_size=None, maxrss=0):
+    ledger.record_submission(
+        jobid, jobid, rule, {"i": str(jobid)}, "a.out", "a.err",
+        mem_mb=10000, input_size=input_size)
+    ledger.record_state(jobid, StatusChecker.SUCCESS)
+    ledger.record_usage(jobid, maxvmem, maxrss, 60.0)
+
+
+def test_percentile():
+    assert percentile([1, 2, 3, 4, 5], 50) == 3
+    assert percentile([1, 2, 3, 4, 5], 100) == 5
+    assert percentile([10, 20], 25) == 12.5
+
+
+def test_usage_model_mem_mb(ledger):
+    model = UsageModel(ledger, {
+        "autotune_min_samples": 3, "autotune_mem_percentile": 100,
+        "autotune_mem_margin": 0.5,
+    })
+    finished_job(ledger, 1, "align", 1e9)
+    finished_job(ledger, 2, "align", 2e9)
+    assert model.mem_mb("align") is None
+
+    # ru_maxrss is in kilobytes and wins when it is higher
+    finished_job(ledger, 3, "align", 1e9, maxrss=3e9 / 1024)
+
+    assert model.mem_mb("align") == 4500
+    assert model.tune_mem_mb("align", 16000) == 4500
+    assert model.tune_mem_mb("align", 2000) == 2000
+
+
+def test_usage_model_by_input_size(ledger):
+    model = UsageModel(ledger, {
+        "autotune_min_samples": 2, "autotune_mem_percentile": 100,
+        "autotune_mem_margin": 0, "autotune_by_input_size": True,
+    })
+    finished_job(ledger, 1, "align", 1e9, input_size=1000)
+    finished_job(ledger, 2, "align", 1e9, input_size=1010)
+    finished_job(ledger, 3, "align", 8e9, input_size=10 ** 9)
+
+    assert model.mem_mb("align", 1020) == 1000
+    # too few jobs of that size, the whole rule is used
+    assert model.mem_mb("align", 10 ** 9) == 8000
+
+
+def test_submit_uses_autotuned_memory(ledger, jobscript, mocker):
+    for jobid in range(1, 6):
+        finished_job(ledger, jobid, "search_fasta_on_index", 1.5e9)
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        b"", returncode=0,
+        stdout=b"""Your job 1504976 ("test_qstat.sh") has been submitted"""))
+    cluster_config = load_cluster_config("cluster.yaml")
+    cluster_config["__default__"]["autotune_mem"] = True
+
+    submitter = Submitter(jobscript, cluster_config=cluster_config)
+    submitter._ledger = ledger
+
+    assert submitter.mem_mb.value == 1800
+    assert "h_vmem=2G" in submitter.resources_cmd
+    submitter.submit()
+    assert ledger.get(1504976)["mem_mb"] == 1800
+    # the inputs are only measured when the tuning scales by their size
+    assert ledger.get(1504976)["input_size"] is None
+
+
+def test_submit_measures_inputs_only_by_input_size(ledger, jobscript, mocker):
+    cluster_config = load_cluster_config("cluster.yaml")
+    cluster_config["__default__"]["autotune_mem"] = True
+    getsize = mocker.spy(os.path, "getsize")
+
+    submitter = Submitter(jobscript, cluster_config=cluster_config)
+    submitter._ledger = ledger
+    assert submitter.autotune_input_size is None
+    submitter.mem_mb
+    getsize.assert_not_called()
+
+    cluster_config["__default__"]["autotune_by_input_size"] = True
+    submitter = Submitter(jobscript, cluster_config=cluster_config)
+    submitter._ledger = ledger
+    assert submitter.autotune_input_size == submitter.input_size
+
+
+def test_ledger_adds_usage_columns(tmp_path):
+    path = tmp_path / "old.db"
+    connection = sqlite3.connect(str(path))
+    connection.execute(
+        "CREATE TABLE jobs (jobid TEXT PRIMARY KEY, snakemake_jobid TEXT, "
+        "rule TEXT, wildcards TEXT, workdir TEXT, outlog TEXT, errlog TEXT, "
+        "state TEXT, submitted_at REAL, updated_at REAL)")
+    connection.close()
+
+    ledger = JobLedger(path)
+    ledger.record_submission(1, 1, "align", {}, "a.out", "a.err", mem_mb=10)
+    ledger.record_usage(1, 1e9, 0, 60.0)
+
+    assert ledger.get(1)["maxvmem"] == 1e9
+    ledger.close()
+
+
+def test_qacct_usage():
+    qacct = os.path.join(os.path.dirname(__file__), "qacct.txt")
+    with open(qacct) as infile:
+        usage = StatusChecker._qacct_usage(infile.read())
+
+    assert usage == {
+        "failed": 0, "exit_status": 0,
+        "maxvmem": 17.488 * 1024 ** 2, "maxrss": 6376.0, "wallclock": 301.22,
+    }
+
+
+def test_usage_model_runtime(ledger):
+    model = UsageModel(ledger, {
+        "autotune_min_samples": 3, "autotune_runtime_percentile": 100,
+        "autotune_runtime_margin": 0, "autotune_runtime_min": 1,
+    })
+    for jobid in range(1, 4):
+        finished_job(ledger, jobid, "align", 1e9)
+        ledger.record_usage(jobid, 1e9, 0, 600.0 * jobid)
+
+    assert model.runtime_minutes("align") == 30
+    assert model.tune_runtime("align", None) == 30
+    assert model.tune_runtime("align", 45) == 45
+
+
+def test_submit_uses_predicted_runtime(ledger, jobscript):
+    for jobid in range(1, 6):
+        finished_job(ledger, jobid, "search_fasta_on_index", 1e9)
+        ledger.record_usage(jobid, 1e9, 0, 3600.0)
+    cluster_config = load_cluster_config("cluster.yaml")
+    cluster_config["__default__"]["autotune_runtime"] = True
+
+    submitter = Submitter(jobscript, cluster_config=cluster_config)
+    submitter._ledger = ledger
+
+    assert submitter.runtime == 72
+    assert "-l h_rt=1:12:00" in submitter.resources_cmd
+
+
+def test_predicted_runtime_measures_inputs_only_by_input_size(
+        ledger, jobscript, mocker):
+    cluster_config = load_cluster_config("cluster.yaml")
+    cluster_config["__default__"]["autotune_runtime"] = True
+    getsize = mocker.spy(os.path, "getsize")
+
+    submitter = Submitter(jobscript, cluster_config=cluster_config)
+    submitter._ledger = ledger
+    submitter.runtime
+    getsize.assert_not_called()
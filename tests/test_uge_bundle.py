@@ -0,0 +1,148 @@
+import os
+import json
+import subprocess
+
+import pytest
+
+from snakemake_gridengine.uge_bundle import BundleCoalescer, \
+    is_bundle_jobid, run
+from snakemake_gridengine.uge_status import StatusChecker
+from snakemake_gridengine.uge_submit import Submitter
+from snakemake_gridengine.uge_utils import load_cluster_config
+
+
+QSUB = {
+    "params": ["-l h_vmem=1G"], "slots": 4, "runtime": 5,
+    "jobname": "smk.bundle", "logdir": "logs",
+}
+
+
+@pytest.fixture
+def bundler(tmp_path, mocker):
+    mocker.patch("subprocess.Popen")
+    return BundleCoalescer(tmp_path / "spool", window=5, max_tasks=64)
+
+
+def member(tmp_path, name, exit_status):
+    script = tmp_path / f"{name}.sh"
+    script.write_text(f"#!/bin/sh\necho {name}\necho {name} >&2\n"
+                      f"exit {exit_status}\n")
+    script.chmod(0o755)
+    return str(script)
+
+
+def logs(tmp_path, name):
+    return {
+        "outlog": str(tmp_path / f"{name}.out"),
+        "errlog": str(tmp_path / f"{name}.err"),
+    }
+
+
+def test_bundle_submit_cmd(bundler, tmp_path):
+    jobids = [
+        bundler.add("sig", member(tmp_path, "job", 0), QSUB)
+        for _ in range(10)]
+    batch = jobids[0].split(".")[0]
+
+    assert is_bundle_jobid(jobids[0])
+    assert len(set(jobid.split(".")[0] for jobid in jobids)) == 1
+    cmd = bundler.submit_cmd(batch, 10)
+    assert "-pe smp 4" in cmd
+    # three waves of at most 4 jobs of 5 minutes
+    assert "-l h_rt=0:15:00" in cmd
+    assert "-pe smp 2" in bundler.submit_cmd(batch, 2)
+
+
+def test_bundle_runner_records_members(bundler, tmp_path, mocker):
+    first = bundler.add(
+        "sig", member(tmp_path, "ok", 0), QSUB, logs(tmp_path, "ok"))
+    bundler.add(
+        "sig", member(tmp_path, "bad", 3), QSUB, logs(tmp_path, "bad"))
+    batch = first.split(".")[0]
+    # the members are real processes
+    mocker.stopall()
+
+    assert run(bundler.batch_dir(batch), 2) == 0
+
+    assert bundler.member_status(batch, 1)["exit_status"] == 0
+    assert bundler.member_status(batch, 2)["exit_status"] == 3
+    assert (tmp_path / "ok.out").read_text() == "ok\n"
+    assert (tmp_path / "bad.err").read_text() == "bad\n"
+
+
+def test_status_of_bundle_members(bundler, tmp_path, mocker):
+    ok = bundler.add("sig", member(tmp_path, "ok", 0), QSUB)
+    lost = bundler.add("sig", member(tmp_path, "lost", 0), QSUB)
+    batch = ok.split(".")[0]
+    mocker.patch.object(
+        StatusChecker, "bundle_spool_dir", str(bundler.spool_dir))
+    mocker.patch.object(StatusChecker, "ledger", None)
+    mocker.patch.object(StatusChecker, "_report_failure")
+    (bundler.batch_dir(batch) / "jobid").write_text("1504976")
+    (bundler.batch_dir(batch) / "status").mkdir()
+    (bundler.batch_dir(batch) / "status" / "1").write_text(
+        json.dumps({"exit_status": 0}))
+
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        b"", returncode=0, stdout=b"job_number: 1504976", stderr=b""))
+    assert StatusChecker(ok, "").get_status() == StatusChecker.SUCCESS
+    assert StatusChecker(lost, "").get_status() == StatusChecker.RUNNING
+
+    # the bundle job is gone without a record of the member
+    subprocess.run.return_value = subprocess.CompletedProcess(
+        b"", returncode=1, stdout=b"",
+        stderr=b"Following jobs do not exist: 1504976")
+    assert StatusChecker(lost, "").get_status() == StatusChecker.FAILED
+
+
+def test_submitter_bundles_small_jobs(tmp_path, mocker, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    mocker.patch("subprocess.Popen")
+    mocker.patch("subprocess.run")
+    cluster_config = load_cluster_config("cluster.yaml")
+    cluster_config["__default__"].update({
+        "bundle": True, "ledger_path": "", "validate_complexes": False,
+        "bundle_spool_dir": str(tmp_path / "bundles")})
+    jobscript = os.path.join(os.path.dirname(__file__), "real_jobscript.sh")
+
+    submitter = Submitter(jobscript, cluster_config=cluster_config)
+    # no runtime, the job is not known to be small
+    assert not submitter.bundle_jobs
+    submitter.cluster["runtime"] = 5
+    submitter.resources["mem_mb"] = 1000
+    submitter._runtime = submitter._mem_mb = None
+    assert submitter.bundle_jobs
+
+    jobid, errlog = submitter.submit().split()
+    assert is_bundle_jobid(jobid)
+    subprocess.run.assert_not_called()
+    batch, taskid = jobid.split(".")
+    meta = json.loads((tmp_path / "bundles" / batch / "task-1.json")
+                      .read_text())
+    assert meta["errlog"] == os.path.abspath(errlog)
+
+
+def test_bundled_attempts_write_their_own_logs(tmp_path, mocker):
+    mocker.patch("subprocess.Popen")
+    mocker.patch("subprocess.run")
+    cluster_config = load_cluster_config("cluster.yaml")
+    cluster_config["__default__"].update({
+        "bundle": True, "ledger_path": "", "validate_complexes": False,
+        "log_archive": True, "bundle_spool_dir": str(tmp_path / "bundles")})
+    jobscript = os.path.join(os.path.dirname(__file__), "real_jobscript.sh")
+
+    errlogs = []
+    for _ in range(2):
+        submitter = Submitter(jobscript, cluster_config=cluster_config)
+        submitter.cluster["runtime"] = 5
+        submitter.resources["mem_mb"] = 1000
+        jobid, errlog = submitter.submit().split()
+        batch, taskid = jobid.split(".")
+        meta = json.loads((
+            tmp_path / "bundles" / batch / "task-{}.json".format(taskid)
+        ).read_text())
+        assert meta["errlog"] == os.path.abspath(errlog)
+        assert errlog.endswith(".{}.err".format(jobid))
+        errlogs.append(errlog)
+
+    assert errlogs[0] != errlogs[1]
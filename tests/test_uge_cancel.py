@@ -0,0 +1,61 @@
+import time
+
+from snakemake_gridengine.uge_cancel import Canceller, chunks, task_ranges
+
+from .test_fake_sge import fake_sge  # noqa: F401
+
+
+def test_task_ranges():
+    assert task_ranges([5, 1, 3, 2, 7, 8]) == ["1-3", "5", "7-8"]
+    assert task_ranges([]) == []
+
+
+def test_chunks():
+    targets = [str(jobid) for jobid in range(1000000, 1000010)]
+    assert [len(call) for call in chunks(targets, 4)] == [4, 4, 2]
+    # every id takes eight bytes with its separator
+    assert [len(call) for call in chunks(targets, 100, 24)] == [3, 3, 3, 1]
+
+
+def test_targets_merges_tasks_into_whole_jobs(tmp_path):
+    canceller = Canceller({"__default__": {
+        "array_spool_dir": str(tmp_path / "arrays"),
+    }})
+    (tmp_path / "arrays" / "a00ff").mkdir(parents=True)
+    (tmp_path / "arrays" / "a00ff" / "jobid").write_text("17")
+
+    targets = canceller.targets(
+        ["12", "13.2", "13.1", "12.4", "a00ff.3", "a00ff.4", "garbage"])
+
+    assert targets == {"12": set(), "13": {1, 2}, "17": {3, 4}}
+    assert sorted(canceller.qdel_args(targets)) == ["12", "13.1-2", "17.3-4"]
+
+
+def test_cancel_deletes_jobs_in_bulk(fake_sge, tmp_path):  # noqa: F811
+    fake_sge.settings["runtime"] = 3600
+    jobids = [fake_sge.submit("job.sh") for _ in range(5)]
+    array_jobid = fake_sge.submit("array.sh", tasks=range(1, 7))
+    # a coalesced array still in its window
+    (tmp_path / "arrays" / "a1234").mkdir(parents=True)
+    canceller = Canceller({"__default__": {
+        "array_spool_dir": str(tmp_path / "arrays"),
+        "cancel_chunk_size": 2,
+    }})
+
+    remaining = canceller.cancel(
+        [str(jobid) for jobid in jobids] +
+        ["{}.{}".format(array_jobid, task) for task in (2, 3, 5)] +
+        ["a1234.1"])
+
+    assert remaining == []
+    now = time.time()
+    alive = {
+        (task["jobid"], task["taskid"]) for task in fake_sge.tasks()
+        if task["end"] > now
+    }
+    assert alive == {(array_jobid, 1), (array_jobid, 4), (array_jobid, 6)}
+    assert (tmp_path / "arrays" / "a1234" / "cancelled").exists()
+    counts = fake_sge.command_counts()
+    # 5 jobs and 2 task ranges in calls of at most 2 ids, one confirmation
+    assert counts["qdel"] == 4
+    assert counts["qstat -xml"] == 1
@@ -0,0 +1,66 @@
+import yaml
+
+from snakemake_gridengine.uge_config import Config
+from snakemake_gridengine.uge_config_snapshot import load_compiled_config
+
+
+def write_configs(tmp_path, uge_yaml=None):
+    cluster_yaml = tmp_path / "cluster.yaml"
+    cluster_yaml.write_text("__default__:\n  log_dir: logs\n")
+    uge_config = tmp_path / "uge.yaml"
+    if uge_yaml is not None:
+        uge_config.write_text(uge_yaml)
+    return cluster_yaml, uge_config
+
+
+def test_snapshot_is_reused_until_a_source_changes(tmp_path, mocker):
+    cluster_yaml, uge_yaml = write_configs(
+        tmp_path, "__default__: -P lab\nalign: [-l gpu=1, -R y]\n")
+    snapshot_dir = tmp_path / ".snakemake"
+
+    compiled = load_compiled_config(cluster_yaml, uge_yaml, snapshot_dir)
+    assert compiled["cluster_config"] == {"__default__": {"log_dir": "logs"}}
+    assert compiled["uge_params"] == {
+        "__default__": "-P lab", "align": "-P lab -l gpu=1 -R y"}
+
+    safe_load = mocker.spy(yaml, "safe_load")
+    assert load_compiled_config(cluster_yaml, uge_yaml, snapshot_dir) == \
+        compiled
+    safe_load.assert_not_called()
+
+    uge_yaml.write_text("__default__: -P other\n")
+    compiled = load_compiled_config(cluster_yaml, uge_yaml, snapshot_dir)
+    assert compiled["uge_params"] == {"__default__": "-P other"}
+    assert safe_load.call_count == 2
+
+
+def test_snapshot_notices_a_new_uge_yaml(tmp_path):
+    cluster_yaml, uge_yaml = write_configs(tmp_path)
+    snapshot_dir = tmp_path / ".snakemake"
+
+    compiled = load_compiled_config(cluster_yaml, uge_yaml, snapshot_dir)
+    assert compiled["uge_params"] == {"__default__": ""}
+
+    uge_yaml.write_text("align: -l gpu=1\n")
+    compiled = load_compiled_config(cluster_yaml, uge_yaml, snapshot_dir)
+    config = Config(compiled["uge_config"], params=compiled["uge_params"])
+    assert config.params_for_rule("align") == "-l gpu=1"
+    assert config.params_for_rule("other") == ""
+
+
+def test_snapshot_is_shared_across_paths_and_rebuilt_when_broken(tmp_path):
+    cluster_yaml, uge_yaml = write_configs(tmp_path, "align: -l gpu=1\n")
+    snapshot_dir = tmp_path / ".snakemake"
+    (tmp_path / "sub").mkdir()
+
+    compiled = load_compiled_config(cluster_yaml, uge_yaml, snapshot_dir)
+    assert load_compiled_config(
+        tmp_path / "sub" / ".." / "cluster.yaml",
+        tmp_path / "sub" / ".." / "uge.yaml", snapshot_dir) == compiled
+    snapshots = list(snapshot_dir.glob("*.pickle"))
+    assert len(snapshots) == 1
+
+    for content in (b"\x80\x04\x95", b"\x80\x04N.", b"garbage"):
+        snapshots[0].write_bytes(content)
+        assert load_compiled_config(
+            cluster_yaml, uge_yaml, snapshot_dir) == compiled
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from snakemake_gridengine.uge_job_properties import SUBMITTER_KEYS, \
+    parse_properties, read_job_properties
+
+
+PROPERTIES = {
+    "type": "single", "rule": "aggregate", "local": False,
+    "input": ["a.txt", "b [1].txt", 'c"].txt', "d\\", "e{}.txt"],
+    "output": [],
+    "wildcards": {"cohort": "all"},
+    "params": {"names": [["x"], {"y": "]"}], "threshold": 1.5},
+    "log": ["logs/aggregate.log"],
+    "threads": 4,
+    "resources": {"mem_mb": 8000},
+    "jobid": 17,
+    "cluster": {"queue": "all.q"},
+}
+
+
+@pytest.mark.parametrize("inputs", [
+    PROPERTIES["input"], ["plain.txt"], [], ["x]y.txt", "z.txt"],
+    [1, 2, 3], [["nested"]], ["a", "]x"], ["a", "]"], ["]"],
+    ["a]{}.txt".format(i) for i in range(40)],
+    ['b\\"]{}.txt'.format(i) for i in range(3)],
+])
+def test_parse_properties_skips_what_it_does_not_need(inputs):
+    properties = dict(PROPERTIES, input=inputs)
+    line = json.dumps(properties)
+
+    assert parse_properties(line, SUBMITTER_KEYS) == {
+        key: properties[key] for key in SUBMITTER_KEYS if key in properties}
+    assert parse_properties(line, ["input", "log"]) == {
+        "input": inputs, "log": properties["log"]}
+    assert parse_properties(line) == properties
+
+
+def test_read_job_properties(tmp_path):
+    jobscript = tmp_path / "job.sh"
+    jobscript.write_text("#!/bin/sh\n# properties = {}\necho\n".format(
+        json.dumps(PROPERTIES)))
+
+    assert read_job_properties(jobscript, ["rule", "threads"]) == {
+        "rule": "aggregate", "threads": 4}
+    assert read_job_properties(jobscript) == PROPERTIES
+
+
+def test_parse_properties_falls_back_to_decoding_everything():
+    line = '{"input": ["a"], "broken": , "rule": "r"}'
+
+    with pytest.raises(ValueError):
+        parse_properties(line, ["rule"])
+
+    # an object the lean parser does not walk to its end is decoded in full
+    line = '{"input": ["a"] , "rule": "r" ,"threads":2 }'
+    assert parse_properties(line, ["rule", "threads", "groupid"]) == {
+        "rule": "r", "threads": 2}
@@ -0,0 +1,68 @@
+import os
+import subprocess
+
+import pytest
+
+from snakemake_gridengine.uge_ledger import JobLedger
+from snakemake_gridengine.uge_status import StatusChecker
+from snakemake_gridengine.uge_submit import Submitter
+
+
+@pytest.fixture
+def jobscript():
+    return os.path.join(os.path.dirname(__file__), "real_jobscript.sh")
+
+
+def test_ledger_states(ledger, tmp_path):
+    ledger.record_submission(
+        1504976, 2, "search_fasta_on_index", {"i": "0"}, "a.out", "a.err",
+        workdir=tmp_path)
+    ledger.record_submission(
+        1504977, 3, "search_fasta_on_index", {"i": "1"}, "b.out", "b.err",
+        workdir=tmp_path)
+    assert ledger.terminal_state(1504976) is None
+
+    ledger.record_state(1504976, StatusChecker.SUCCESS)
+
+    assert ledger.terminal_state(1504976) == "success"
+    assert [j["jobid"] for j in ledger.active_jobs(tmp_path)] == ["1504977"]
+    assert ledger.find_active(
+        "search_fasta_on_index", {"i": "1"}, tmp_path)["errlog"] == "b.err"
+    assert ledger.find_active(
+        "search_fasta_on_index", {"i": "0"}, tmp_path) is None
+
+
+def test_status_answered_from_ledger(ledger, mocker):
+    ledger.record_submission(1504976, 2, "rule", {}, "a.out", "a.err")
+    ledger.record_state(1504976, StatusChecker.FAILED)
+    mocker.patch("subprocess.run")
+
+    checker = StatusChecker(1504976, "a.err")
+    checker._ledger = ledger
+
+    assert checker.get_status() == StatusChecker.FAILED
+    subprocess.run.assert_not_called()
+
+
+def test_submit_records_job(ledger, jobscript, mocker):
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        b"", returncode=0,
+        stdout=b"""Your job 1504976 ("test_qstat.sh") has been submitted"""))
+
+    submitter = Submitter(jobscript)
+    submitter._ledger = ledger
+    submitter.submit()
+
+    job = ledger.get(1504976)
+    assert job["snakemake_jobid"] == "2"
+    assert job["rule"] == "search_fasta_on_index"
+    assert job["errlog"].endswith("smk.search_fasta_on_index.i=0.err")
+
+
+def test_ledger_journal_mode(tmp_path):
+    ledger = JobLedger.from_cluster_config({"__default__": {
+        "ledger_path": str(tmp_path / "ledger.db"),
+        "ledger_journal_mode": "DELETE"}})
+
+    mode = ledger.connection.execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "delete"
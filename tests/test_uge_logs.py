@@ -0,0 +1,79 @@
+import os
+import subprocess
+
+import pytest
+
+from snakemake_gridengine.uge_logs import LogArchive, consolidate, show
+from snakemake_gridengine.uge_submit import Submitter
+from snakemake_gridengine.uge_utils import load_cluster_config
+
+
+def finished_job(ledger, tmp_path, jobid, wildcards, state="success",
+                 log_archive=True):
+    logdir = tmp_path / "cluster_logs" / "align"
+    logdir.mkdir(parents=True, exist_ok=True)
+    outlog = logdir / f"smk.align.{jobid}.out"
+    errlog = logdir / f"smk.align.{jobid}.err"
+    outlog.write_text(f"output of {jobid}\n")
+    errlog.write_text(f"errors of {jobid}\n")
+    ledger.record_submission(
+        jobid, jobid, "align", wildcards, outlog, errlog, workdir=tmp_path,
+        log_archive=log_archive)
+    ledger.record_state(jobid, state)
+    return outlog, errlog
+
+
+def test_consolidate_archives_finished_logs(ledger, tmp_path):
+    out_1, err_1 = finished_job(ledger, tmp_path, 1, {"sample": "a"})
+    out_2, _ = finished_job(ledger, tmp_path, 2, {"sample": "b"}, "failed")
+    out_3, _ = finished_job(ledger, tmp_path, 3, {"sample": "c"}, None)
+    # submitted without the archive, e.g. by a rule that opted out
+    out_4, _ = finished_job(
+        ledger, tmp_path, 4, {"sample": "d"}, log_archive=False)
+
+    assert consolidate(ledger, tmp_path) == 2
+
+    assert not out_1.exists() and not err_1.exists() and not out_2.exists()
+    assert out_3.exists() and out_4.exists()
+    archive = LogArchive(tmp_path / "cluster_logs" / "align")
+    assert archive.read(archive.find(2)["err"]) == b"errors of 2\n"
+    assert sorted(os.listdir(archive.archive_path.parent)) == [
+        "archive.gz", "archive.gz.lock", "archive.idx",
+        "smk.align.3.err", "smk.align.3.out",
+        "smk.align.4.err", "smk.align.4.out"]
+    # nothing left to do until the next job finishes
+    assert consolidate(ledger, tmp_path) == 0
+
+
+def test_show_reads_archive_and_log_files(ledger, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    finished_job(ledger, tmp_path, 1, {"sample": "a"})
+    consolidate(ledger, tmp_path)
+    finished_job(ledger, tmp_path, 2, {"sample": "b"}, None)
+
+    assert show(ledger, "1") == {
+        "out": b"output of 1\n", "err": b"errors of 1\n"}
+    assert show(ledger, "align/sample=a", ["err"]) == {
+        "err": b"errors of 1\n"}
+    assert show(ledger, "2")["out"] == b"output of 2\n"
+    with pytest.raises(KeyError):
+        show(ledger, "align/sample=z")
+
+
+def test_submit_with_log_archive(tmp_path, mocker, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        b"", returncode=0, stdout=b'Your job 1504976 ("x") has been submitted'))
+    cluster_config = load_cluster_config("cluster.yaml")
+    cluster_config["__default__"].update({
+        "log_archive": True, "ledger_path": "", "validate_complexes": False})
+    jobscript = os.path.join(os.path.dirname(__file__), "real_jobscript.sh")
+
+    submitter = Submitter(jobscript, cluster_config=cluster_config)
+    mocker.spy(submitter, "_remove_previous_logs")
+    result = submitter.submit()
+
+    submitter._remove_previous_logs.assert_not_called()
+    assert '.\\$JOB_ID.out"' in submitter.submit_cmd
+    jobid, errlog = result.split()
+    assert errlog.endswith(".1504976.err")
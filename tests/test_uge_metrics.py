@@ -0,0 +1,60 @@
+import time
+
+from snakemake_gridengine.uge_metrics import Metrics
+from snakemake_gridengine.uge_status import StatusChecker
+
+from .test_fake_sge import fake_sge  # noqa: F401
+
+
+def test_metrics_of_several_processes_are_merged(tmp_path):
+    textfile = tmp_path / "textfile" / "uge.prom"
+    first, second = Metrics(textfile), Metrics(textfile)
+    first.observe("uge_command_seconds", 0.2, {"command": "qstat"})
+    first.inc("uge_status_calls", {"status": "running"})
+    second.observe("uge_command_seconds", 3, {"command": "qstat"})
+    second.inc("uge_status_calls", {"status": "running"})
+    second.inc("uge_status_calls", {"status": "none"})
+
+    first.flush()
+    second.flush()
+    # nothing left to merge
+    second.flush()
+
+    lines = textfile.read_text().splitlines()
+    assert 'uge_status_calls_total{status="running"} 2' in lines
+    assert 'uge_status_calls_total{status="none"} 1' in lines
+    assert 'uge_command_seconds_bucket{command="qstat",le="0.25"} 1' in lines
+    assert 'uge_command_seconds_bucket{command="qstat",le="5"} 2' in lines
+    assert 'uge_command_seconds_bucket{command="qstat",le="+Inf"} 2' in lines
+    assert 'uge_command_seconds_count{command="qstat"} 2' in lines
+    assert 'uge_command_seconds_sum{command="qstat"} 3.2' in lines
+    assert "# TYPE uge_status_calls counter" in lines
+    assert lines[-1] == "# EOF"
+
+
+def test_metrics_are_off_without_a_textfile(tmp_path):
+    metrics = Metrics.from_cluster_config({"__default__": {}})
+    metrics.inc("uge_status_calls", {"status": "running"})
+    metrics.flush()
+
+    assert not metrics.enabled
+    assert metrics.samples() == {}
+
+
+def test_status_checker_records_metrics(fake_sge, tmp_path):  # noqa: F811
+    jobid = fake_sge.submit("test_qstat.sh")
+    time.sleep(0.01)
+    fake_sge.flush_accounting(time.time())
+    textfile = tmp_path / "uge.prom"
+    checker = StatusChecker(jobid, "")
+    checker._cluster_config = {"__default__": {
+        "metrics_textfile": str(textfile), "ledger_path": "",
+    }}
+
+    assert checker.get_status() == StatusChecker.SUCCESS
+
+    text = textfile.read_text()
+    assert 'uge_status_calls_total{status="success"} 1' in text
+    assert 'uge_command_seconds_count{command="qstat"} 1' in text
+    assert 'uge_queue_wait_seconds_count{queue="all.q",rule="unknown"} 1' \
+        in text
@@ -0,0 +1,59 @@
+import time
+import subprocess
+
+from snakemake_gridengine.uge_polling import PollingPolicy
+from snakemake_gridengine.uge_status import StatusChecker
+
+
+def test_polling_policy_backoff():
+    policy = PollingPolicy({"poll_jitter": 0, "poll_max_delay": 40})
+
+    assert policy.delay(PollingPolicy.ACCOUNTING_LAG, 0) == 0.5
+    assert policy.delay(PollingPolicy.ACCOUNTING_LAG, 2) == 0.5 * 1.5 ** 2
+    assert policy.delay(PollingPolicy.QSTAT_ERROR, 1) == 15
+    assert policy.delay(PollingPolicy.QSTAT_ERROR, 5) == 40
+
+
+def test_polling_policy_maps_wait_between_tries(caplog):
+    policy = PollingPolicy({"poll_jitter": 0, "wait_between_tries": 2,
+                            "poll_qstat_error_delay": 10})
+
+    assert policy.delay(PollingPolicy.ACCOUNTING_LAG, 0) == 2
+    assert policy.delay(PollingPolicy.QSTAT_ERROR, 0) == 10
+    assert policy.delay(PollingPolicy.PENDING, 0) == 30
+    assert "wait_between_tries is deprecated" in caplog.text
+
+
+def test_polling_policy_jitter():
+    policy = PollingPolicy({"poll_jitter": 0.5})
+    delays = {policy.delay(PollingPolicy.PENDING) for _ in range(20)}
+
+    assert len(delays) > 1
+    assert all(15 <= delay <= 45 for delay in delays)
+
+
+def test_get_status_backs_off_on_qstat_errors(mocker):
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        b"", returncode=1, stdout=b"", stderr=b"error: unable to contact qmaster"))
+    mocker.patch("time.sleep")
+    checker = StatusChecker(1504976, "")
+    checker._cluster_config = {"__default__": {
+        "max_status_checks": 3, "poll_jitter": 0}}
+
+    assert checker.get_status() is None
+    delays = [call.args[0] for call in time.sleep.call_args_list]
+    assert delays == [5, 15, 45]
+
+
+def test_get_status_retries_quickly_for_accounting_lag(mocker):
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        b"", returncode=1, stdout=b"",
+        stderr=b"Following jobs do not exist: 1504976"))
+    mocker.patch("time.sleep")
+    checker = StatusChecker(1504976, "")
+    checker._cluster_config = {"__default__": {
+        "max_status_checks": 3, "poll_jitter": 0}}
+
+    checker.get_status()
+    delays = [call.args[0] for call in time.sleep.call_args_list]
+    assert delays == [0.5, 0.75, 1.125]
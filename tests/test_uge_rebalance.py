@@ -0,0 +1,76 @@
+import os
+import subprocess
+import time
+
+import pytest
+
+from snakemake_gridengine.sge_queues import parse_cluster_queues
+from snakemake_gridengine.uge_rebalance import Rebalancer
+
+
+@pytest.fixture
+def queue_cache(mocker):
+    filename = os.path.join(os.path.dirname(__file__), "qstat_gc.txt")
+    with open(filename) as infile:
+        queues = parse_cluster_queues(infile.read())
+    return mocker.Mock(**{"summary.return_value": (queues, {})})
+
+
+def submit(ledger, jobid, rule, queue, queues, age, workdir):
+    ledger.record_submission(
+        jobid, jobid, rule, {}, "a.out", "a.err", workdir=workdir,
+        queue=queue, queues=queues)
+    with ledger.connection:
+        ledger.connection.execute(
+            "UPDATE jobs SET submitted_at = ? WHERE jobid = ?",
+            (time.time() - age, str(jobid)))
+
+
+def test_rebalance_moves_long_pending_jobs(
+        ledger, queue_cache, tmp_path, mocker):
+    mocker.patch("subprocess.run", return_value=mocker.Mock(returncode=0))
+    cluster_config = {
+        "__default__": {"rebalance_after": 600},
+        "quick": {"rebalance_after": 60},
+    }
+    candidates = ["all.q", "long.q"]
+    submit(ledger, 1, "slow", "all.q", candidates, 1200, tmp_path)
+    # pending, but not for long enough
+    submit(ledger, 2, "slow", "all.q", candidates, 300, tmp_path)
+    submit(ledger, 3, "quick", "all.q", candidates, 300, tmp_path)
+    # running already
+    submit(ledger, 4, "slow", "all.q", candidates, 1200, tmp_path)
+    # no other queue to go to
+    submit(ledger, 5, "slow", "all.q", None, 1200, tmp_path)
+    # already in the better queue
+    submit(ledger, 6, "slow", "long.q", candidates, 1200, tmp_path)
+    states = {"1": "qw", "2": "qw", "3": "qw", "4": "r", "5": "qw", "6": "qw"}
+
+    rebalancer = Rebalancer(
+        ledger, cluster_config, queue_cache=queue_cache, workdir=tmp_path)
+    moves = rebalancer.run(states)
+
+    assert [move["jobid"] for move in moves] == ["1", "3"]
+    subprocess.run.assert_any_call(
+        "qalter -q long.q 1", check=False, shell=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert ledger.get(1)["queue"] == "long.q"
+    assert [m["to_queue"] for m in ledger.moves(1)] == ["long.q"]
+    # the moved job waits afresh in its new queue
+    assert rebalancer.run(states) == []
+
+
+def test_rebalance_records_failed_moves(ledger, queue_cache, tmp_path, mocker):
+    mocker.patch("subprocess.run", return_value=mocker.Mock(
+        returncode=1, stderr=b"denied: job 1 is already running"))
+    submit(ledger, 1, "slow", "all.q", ["all.q", "long.q"], 1200, tmp_path)
+
+    rebalancer = Rebalancer(
+        ledger, {"__default__": {"rebalance_max_moves": 1}},
+        queue_cache=queue_cache, workdir=tmp_path)
+    moves = rebalancer.run({"1": "qw"})
+
+    assert "already running" in moves[0]["error"]
+    assert ledger.get(1)["queue"] == "all.q"
+    assert ledger.moves(1)[0]["error"] == moves[0]["error"]
+    assert rebalancer.run({"1": "qw"}) == []
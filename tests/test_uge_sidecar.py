@@ -0,0 +1,70 @@
+import io
+import os
+import json
+import threading
+import subprocess
+
+import pytest
+
+from snakemake_gridengine.uge_sidecar import QstatPoller, SidecarServer
+from snakemake_gridengine.uge_sidecar_client import \
+    SidecarClient, SIDECAR_VARS_ENV
+from snakemake_gridengine.uge_status import StatusChecker
+
+
+QSTAT_STATES = {
+    "1504976": "r",
+    "1504977": "qw",
+    "1504978": "r",
+    "1504978.3": "r",
+}
+
+
+@pytest.fixture
+def sidecar(tmp_path):
+    poller = QstatPoller("chorbadj", interval=1)
+    poller.update(dict(QSTAT_STATES))
+    socket_path = str(tmp_path / "sidecar.sock")
+    server = SidecarServer(socket_path, poller)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield poller, socket_path
+    server.shutdown()
+    server.server_close()
+
+
+def test_qstat_poller_poll(mocker):
+    qstat_xml = os.path.join(os.path.dirname(__file__), "qstat.xml")
+    with open(qstat_xml, "rb") as infile:
+        mocker.patch("subprocess.Popen", return_value=mocker.Mock(
+            stdout=infile, stderr=io.BytesIO(b""),
+            **{"wait.return_value": 0}))
+        poller = QstatPoller("chorbadj", interval=1)
+        assert poller.poll()
+
+    assert poller.lookup("1504977")["state"] == "qw"
+    assert poller.lookup("1504978.3")["state"] == "r"
+
+
+def test_sidecar_client_query(sidecar):
+    poller, socket_path = sidecar
+    client = SidecarClient(socket_path)
+
+    assert client.query(1504977)["state"] == "qw"
+
+    poller.update({})
+    reply = client.query(1504977)
+    assert reply["state"] is None
+    assert reply["finished"]
+
+
+def test_status_checker_uses_sidecar(sidecar, monkeypatch, mocker):
+    _, socket_path = sidecar
+    monkeypatch.setenv(
+        SIDECAR_VARS_ENV, json.dumps({"status_socket": socket_path}))
+    mocker.patch("subprocess.run")
+
+    checker = StatusChecker(1504976, "")
+
+    assert checker.get_status() == StatusChecker.RUNNING
+    subprocess.run.assert_not_called()
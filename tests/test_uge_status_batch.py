@@ -0,0 +1,84 @@
+import io
+import os
+import getpass
+import subprocess
+
+from snakemake_gridengine.uge_ledger import JobLedger
+from snakemake_gridengine.uge_status import StatusChecker
+
+from .test_sge_accounting import accounting_line
+
+
+QSTAT_XML = os.path.join(os.path.dirname(__file__), "qstat.xml")
+
+
+def test_get_statuses_queries_the_cluster_once(tmp_path, mocker):
+    accounting_file = tmp_path / "accounting"
+    accounting_file.write_text("".join([
+        accounting_line(1504990, owner=getpass.getuser(), exit_status=1),
+        accounting_line(1504991, owner=getpass.getuser()),
+    ]))
+    ledger = JobLedger(tmp_path / "ledger.db")
+    ledger.record_submission(1504993, 5, "rule", {}, "a.out", "a.err")
+    ledger.record_state(1504993, StatusChecker.SUCCESS)
+    ledger.close()
+    cluster_config = {"__default__": {
+        "accounting_file": str(accounting_file),
+        "accounting_index_path": str(tmp_path / "accounting.json"),
+        "ledger_path": str(tmp_path / "ledger.db"),
+        "failure_report_dir": str(tmp_path / "failures"),
+    }}
+    with open(QSTAT_XML, "rb") as infile:
+        qstat_xml = infile.read()
+    mocker.patch("subprocess.Popen", return_value=mocker.Mock(
+        stdout=io.BytesIO(qstat_xml), stderr=io.BytesIO(b""),
+        **{"wait.return_value": 0}))
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        b"", returncode=1, stdout=b"", stderr=b"error: job id not found"))
+
+    statuses = StatusChecker.get_statuses(
+        ["1504976", "1504978.5", "1504990", "1504991", "1504992", "1504993"],
+        cluster_config)
+
+    assert statuses == {
+        "1504976": StatusChecker.RUNNING,
+        "1504978.5": StatusChecker.RUNNING,
+        "1504990": StatusChecker.FAILED,
+        "1504991": StatusChecker.SUCCESS,
+        "1504992": StatusChecker.RUNNING,
+        "1504993": StatusChecker.SUCCESS,
+    }
+    subprocess.Popen.assert_called_once()
+    # the job missing from qstat and the up to date index is not accounted
+    # yet, qacct would scan the same accounting file
+    subprocess.run.assert_not_called()
+
+
+def test_get_statuses_asks_each_job_once_when_qstat_fails(tmp_path, mocker):
+    from snakemake_gridengine.uge_array import ArrayCoalescer
+
+    mocker.patch("subprocess.Popen")
+    coalescer = ArrayCoalescer(tmp_path / "spool")
+    jobscript = os.path.join(os.path.dirname(__file__), "real_jobscript.sh")
+    batch = coalescer.add("sig1", jobscript, {
+        "params": [], "jobname": "smk.a.array", "logdir": "logs"})
+    (coalescer.batch_dir(batch.split(".")[0]) / "jobid").write_text(
+        "1504992")
+    cluster_config = {"__default__": {
+        "array_spool_dir": str(tmp_path / "spool"),
+        "ledger_path": "",
+        "accounting_file": "",
+        "poll_max_wait": 60,
+    }}
+    mocker.patch("subprocess.Popen", return_value=mocker.Mock(
+        stdout=io.BytesIO(b""), stderr=io.BytesIO(b"qmaster down"),
+        returncode=1, **{"wait.return_value": 1}))
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        b"", returncode=1, stdout=b"", stderr=b"error: job id not found"))
+    sleep = mocker.patch("time.sleep")
+
+    statuses = StatusChecker.get_statuses(["1504976", batch], cluster_config)
+
+    assert statuses == {
+        "1504976": StatusChecker.RUNNING, batch: StatusChecker.RUNNING}
+    sleep.assert_not_called()
@@ -0,0 +1,70 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from snakemake_gridengine.uge_sidecar_client import SubmitClient
+
+
+SERVER = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)),
+    "snakemake_gridengine", "uge_submit_server.py")
+
+
+@pytest.fixture
+def fake_qsub(tmp_path, monkeypatch):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    qsub = bindir / "qsub"
+    qsub.write_text(
+        '#!/bin/sh\necho "Your job 1504976 (\\"$TEST_TAG\\") has been submitted"\n')
+    qsub.chmod(0o755)
+    monkeypatch.setenv("PATH", "{}:{}".format(bindir, os.environ["PATH"]))
+    monkeypatch.chdir(tmp_path)
+    return qsub
+
+
+@pytest.fixture
+def submit_server(tmp_path, fake_qsub):
+    socket_path = str(tmp_path / "submit.sock")
+    process = subprocess.Popen(
+        [sys.executable, SERVER, "--socket", socket_path],
+        stdout=subprocess.PIPE)
+    assert process.stdout.readline()
+    yield socket_path
+    process.terminate()
+    process.wait()
+
+
+def test_submit_client_unreachable(tmp_path):
+    client = SubmitClient(str(tmp_path / "missing.sock"))
+    assert client.submit("real_jobscript.sh", []) is None
+
+
+def test_submit_through_server(submit_server, monkeypatch):
+    jobscript = os.path.join(os.path.dirname(__file__), "real_jobscript.sh")
+    monkeypatch.setenv("TEST_TAG", "from-client")
+    client = SubmitClient(submit_server)
+
+    reply = client.submit(jobscript, [])
+
+    assert reply["result"].startswith("1504976 ")
+    assert os.path.isdir("cluster_logs/search_fasta_on_index")
+
+
+def test_submit_socket_is_private(submit_server):
+    assert os.stat(submit_server).st_mode & 0o777 == 0o600
+
+
+def test_submit_server_keeps_foreign_files(tmp_path):
+    from snakemake_gridengine.uge_submit_server import SubmitServer
+
+    path = tmp_path / "submit.sock"
+    path.write_text("not a socket")
+    server = SubmitServer(str(path))
+
+    with pytest.raises(RuntimeError, match="not a socket of ours"):
+        server.bind()
+    server.close()
+    assert path.read_text() == "not a socket"
@@ -0,0 +1,78 @@
+import os
+import subprocess
+
+from snakemake_gridengine.uge_submit import Submitter
+from snakemake_gridengine.uge_trace import breakdown, read_spans
+
+
+PROFILE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "snakemake_gridengine")
+
+
+def test_submit_phases_are_traced(tmp_path, monkeypatch, mocker):
+    trace = tmp_path / "trace.jsonl"
+    monkeypatch.setenv("UGE_TRACE", str(trace))
+    monkeypatch.chdir(tmp_path)
+    mocker.patch("subprocess.run", return_value=subprocess.CompletedProcess(
+        b"", returncode=0,
+        stdout=b'Your job 1504976 ("test_qstat.sh") has been submitted'))
+    jobscript = os.path.join(os.path.dirname(__file__), "real_jobscript.sh")
+
+    submitter = Submitter(jobscript, cluster_config={"__default__": {
+        "ledger_path": "", "validate_complexes": False,
+    }})
+    submitter.submit()
+
+    spans = read_spans(trace)
+    assert [span["name"] for span in spans] == [
+        "submit.properties", "submit.build", "submit.qsub", "submit"]
+    assert {span["trace_id"] for span in spans} == {submitter.tracer.trace_id}
+    assert submitter.tracer.trace_id.endswith("-{}".format(submitter.jobid))
+    assert spans[-1]["jobid"] == "1504976"
+    assert spans[-1]["rule"] == submitter.rule_name
+    assert "-v UGE_TRACE_ID={}".format(submitter.tracer.trace_id) in \
+        subprocess.run.call_args[0][0]
+
+
+def test_jobscript_stamps_start_and_end(tmp_path):
+    trace = tmp_path / "trace.jsonl"
+    with open(os.path.join(PROFILE_DIR, "jobscript.sh")) as infile:
+        template = infile.read()
+    jobscript = tmp_path / "job.sh"
+    jobscript.write_text(template.format(properties="{}", exec_job="exit 3"))
+
+    completed_process = subprocess.run(
+        ["bash", str(jobscript)], env=dict(
+            os.environ, UGE_TRACE=str(trace), UGE_TRACE_ID="abc-7",
+            JOB_ID="17"))
+
+    assert completed_process.returncode == 3
+    start, end = read_spans(trace)
+    assert (start["name"], start["exit_status"]) == ("job.start", None)
+    assert (end["name"], end["exit_status"]) == ("job.end", 3)
+    assert start["trace_id"] == end["trace_id"] == "abc-7"
+    assert end["jobid"] == "17"
+
+
+def span(name, start, end, trace_id="t-1", **attrs):
+    return dict(attrs, name=name, start=start, end=end, trace_id=trace_id)
+
+
+def test_breakdown_per_rule():
+    spans = [
+        span("submit.qsub", 0.5, 1.5),
+        span("submit", 0, 2, rule="align", jobid="17"),
+        span("job.start", 12, 12),
+        # a status call answered without the ledger, matched by its jobid
+        span("status", 20, 21, trace_id=None, jobid="17", status="running"),
+        span("status.qstat", 20.2, 20.7),
+        span("job.end", 50, 50),
+        span("status", 60, 61, status="success"),
+    ]
+
+    rules = breakdown(spans)
+
+    assert rules == {"align": {
+        "jobs": 1, "qmaster": 1.5, "profile": 2.5, "queue_wait": 10,
+        "runtime": 38, "detection": 11,
+    }}